@@ -1,11 +1,96 @@
+import time
 from tenacity import retry, stop_after_attempt
 from langchain_core.prompts import ChatPromptTemplate
-from typing import Dict
+from typing import Dict, Optional
+from ..configuration import SINGLE_FLIGHT_ENABLED
+from ..llm import LLMDeadlineExceeded, ainvoke_llm, invoke_llm, llm_caller, model_key
+from ..metrics import extract_token_usage
+from ..prompt_cache import aprompt_chain, prompt_chain
+from ..scheduler import LLM_SCHEDULER, SchedulerTimeout, TokenBudgetExceeded, current_job
+from ..singleflight import LLM_FLIGHTS, record_shared, request_key
+
+# Failures of the leader's own job (budget, slot wait, deadline): followers make their own call instead
+JOB_SCOPED_ERRORS = (TokenBudgetExceeded, SchedulerTimeout, LLMDeadlineExceeded)
 
 class BaseAgent:
+    # Agents whose prompt has a static prefix set this to its PromptParts
+    prompt_parts = None
+
     def __init__(self, llm):
         self.llm = llm
+        self.tokens_used = 0
         
     @retry(stop=stop_after_attempt(3))
     def invoke(self, input_data: Dict) -> Dict:
-        raise NotImplementedError 
\ No newline at end of file
+        raise NotImplementedError 
+
+    def _flight_key(self, inputs: Dict) -> str:
+        # Client and prompt objects live as long as any call using them, so their
+        # ids tell apart models with different settings and different prompts.
+        # Only calls of the same priority class are shared, so an interactive
+        # call never waits behind a batch call queued in the scheduler
+        return request_key(model_key(self.llm), id(self.llm), id(self.prompt), inputs, current_job().priority)
+
+    def _shared(self, response, start: float) -> None:
+        """Account for a response reused from another caller's call"""
+        tokens = sum(extract_token_usage(response))
+        self.tokens_used += tokens
+        LLM_SCHEDULER.charge(tokens)
+        record_shared(model_key(self.llm), time.monotonic() - start)
+
+    @staticmethod
+    def _follow_timeout() -> float:
+        """How long a follower waits for an identical call before making its own
+
+        One attempt's timeout, so the follower still has most of its own
+        deadline left for its own call if the leader's runs long.
+        """
+        return min(llm_caller.timeout, llm_caller.deadline)
+
+    @staticmethod
+    def _deadline(start: float) -> float:
+        """This caller's deadline left, counting time spent waiting as a follower"""
+        return llm_caller.deadline - (time.monotonic() - start)
+
+    def _invoke(self, inputs: Dict, deadline: Optional[float] = None):
+        chain = prompt_chain(self.prompt, self.llm, self.prompt_parts)
+        response = invoke_llm(chain, inputs, key=model_key(self.llm), deadline=deadline)
+        self.tokens_used += sum(extract_token_usage(response))
+        return response
+
+    async def _ainvoke(self, inputs: Dict, deadline: Optional[float] = None):
+        chain = await aprompt_chain(self.prompt, self.llm, self.prompt_parts)
+        response = await ainvoke_llm(chain, inputs, key=model_key(self.llm), deadline=deadline)
+        self.tokens_used += sum(extract_token_usage(response))
+        return response
+
+    def call_llm(self, inputs: Dict):
+        """Run `self.prompt | self.llm` with deadlines, backoff and optional hedging
+
+        An identical request already in flight (same model, prompt and
+        inputs and priority class, from any agent or job) is waited for
+        instead of repeated; its tokens count toward this agent and job.
+        If it is still running after one attempt's timeout, this caller
+        makes its own call with the rest of its deadline and job.
+        """
+        if not SINGLE_FLIGHT_ENABLED:
+            return self._invoke(inputs)
+        start = time.monotonic()
+        response, shared = LLM_FLIGHTS.do(self._flight_key(inputs),
+                                          lambda: self._invoke(inputs, self._deadline(start)),
+                                          retry_on=JOB_SCOPED_ERRORS, timeout=self._follow_timeout())
+        if shared:
+            self._shared(response, start)
+        return response
+
+    async def acall_llm(self, inputs: Dict):
+        """Async counterpart of call_llm, awaiting the model on the running event loop"""
+        if not SINGLE_FLIGHT_ENABLED:
+            return await self._ainvoke(inputs)
+        start = time.monotonic()
+        response, shared = await LLM_FLIGHTS.ado(self._flight_key(inputs),
+                                                 lambda: self._ainvoke(inputs, self._deadline(start)),
+                                                 retry_on=JOB_SCOPED_ERRORS, timeout=self._follow_timeout())
+        if shared:
+            self._shared(response, start)
+        return response
@@ -1,78 +1,139 @@
-from typing import Dict
-import traceback
+from typing import Dict, List
+import asyncio
 import logging
-import json
+from ..logs import log_context, log_payload
+from ..scheduler import TokenBudgetExceeded
 from ..utils import extract_json_from_response
+from ..records import RiskTable
+from ..validation import IDENTIFIED_RISK_VALIDATOR
+from ..delta import context_hash
+from ..wire import IDENTIFIED_ROW, decode_rows
 from .base import BaseAgent
-from ..prompts import CREATOR_PROMPT
+from ..prompts import CREATOR_PROMPT, CREATOR_PROMPT_PARTS
 
 logger = logging.getLogger(__name__)
 
 class CreatorAgent(BaseAgent):
     """Agent responsible for initial risk identification"""
-    
+
     def __init__(self, llm):
         super().__init__(llm)
         self.prompt = CREATOR_PROMPT
+        self.prompt_parts = CREATOR_PROMPT_PARTS
+
+    @staticmethod
+    def _contexts(state: Dict) -> List[str]:
+        if not state.get("context"):
+            logger.error("No context found in state")
+            raise ValueError("No context found from document search")
+        return [context.content if hasattr(context, 'content') else str(context) for context in state["context"]]
+
+    @staticmethod
+    def _parse_chunk(response) -> List[Dict]:
+        """Extract and validate the risks of one context chunk ([category, risk] rows)"""
+        response_text = str(response.content if hasattr(response, 'content') else response)
+        records = decode_rows(extract_json_from_response(response_text), IDENTIFIED_ROW)
+        result = IDENTIFIED_RISK_VALIDATOR.validate(records)
+        if result.invalid:
+            logger.warning("Dropped %d malformed risks", len(result.invalid))
+        return result.valid
+
+    @staticmethod
+    def _chunk_failed(context: str, error: Exception) -> None:
+        # The traceback is formatted by the log listener, off the request path
+        logger.error("Failed to process chunk: %s", error, exc_info=True)
+        log_payload(logger, "creator.failed_context", "Failed chunk context: %s", context, level=logging.ERROR)
+
+    def _finish(self, state: Dict, chunk_risks: List[List[Dict]]) -> Dict:
+        """Number the risks of all chunks in order and build the state update
+
+        Numbering starts at state["next_risk_id"] (1 by default), so delta runs
+        never reuse the Ids of carried-over risks.
+        """
+        total_chunks = len(chunk_risks)
+        all_risks = []
+        context_risks: Dict[str, List[str]] = {}
+        risk_counter = state.get("next_risk_id", 1)
+        for context, stage_risks in zip(state["context"], chunk_risks):
+            # Add IDs to risks
+            for risk in stage_risks:
+                risk["Id"] = f"R{risk_counter:03d}"
+                risk_counter += 1
+            all_risks.extend(stage_risks)
+            context_risks.setdefault(context_hash(context), []).extend(risk["Id"] for risk in stage_risks)
+
+        if not all_risks:
+            logger.error("=== Risk analysis failed: No risks were generated from %d chunks ===", total_chunks)
+            raise ValueError(f"No risks were generated from {total_chunks} context chunks")
+
+        logger.info("=== Risk analysis completed: Generated %d total risks ===", len(all_risks))
+
+        # Convert final list to a columnar risk table
+        risk_list = RiskTable.from_records(all_risks)
+        tokens = self.tokens_used
+
+        return {
+            "risk_list": risk_list,
+            "iteration": 1,
+            "context_risks": context_risks,
+            "token_usage": {"generation": tokens}
+        }
 
     def generate(self, state: Dict) -> Dict:
         try:
-            if not state.get("context"):
-                logger.error("No context found in state")
-                raise ValueError("No context found from document search")
- 
-            all_risks = []
-            risk_counter = 1
- 
-            total_chunks = len(state['context'])
-            logger.info(f"=== Starting risk analysis with {total_chunks} context chunks ===")
-            
+            contexts = self._contexts(state)
+            total_chunks = len(contexts)
+            logger.info("=== Starting risk analysis with %d context chunks ===", total_chunks)
+
             # Process each context chunk
-            for context in state["context"]:
-                try:
-                    logger.info(f"\n[Chunk {risk_counter}/{total_chunks}] Processing...")
-                    
-                    context_content = context.content if hasattr(context, 'content') else str(context)
-                    logger.info(f"[Chunk {risk_counter}/{total_chunks}] Content preview: {context_content[:200]}...")
-                    
-                    chain = self.prompt | self.llm
-                    response = chain.invoke({
-                        "context": context_content
-                    })
-                    
-                    # Extract JSON from response text
-                    response_text = str(response.content if hasattr(response, 'content') else response)
-                    stage_risks = extract_json_from_response(response_text)
-                    
-                    # Add IDs to risks
-                    for risk in stage_risks:
-                        risk["Id"] = f"R{risk_counter:03d}"
-                        risk_counter += 1
-                    all_risks.extend(stage_risks)
-                    
-                except Exception as e:
-                    logger.error(f"[Chunk {risk_counter}/{total_chunks}] Failed to process:")
-                    logger.error(f"  Error: {str(e)}")
-                    logger.error(f"  Context: {str(context)[:200]}...")
-                    logger.error(f"  Traceback: {traceback.format_exc()}")
-                    continue
- 
-            if not all_risks:
-                logger.error(f"=== Risk analysis failed: No risks were generated from {total_chunks} chunks ===")
-                raise ValueError(f"No risks were generated from {total_chunks} context chunks")
-            
-            logger.info(f"=== Risk analysis completed: Generated {len(all_risks)} total risks ===")
- 
-            # Convert final list to JSON string
-            risk_list = extract_json_from_response(all_risks)
-            tokens = len(risk_list)
-            
-            return {
-                "risk_list": risk_list,
-                "iteration": 1,
-                "token_usage": {"generation": tokens}
-            }
- 
+            chunk_risks = []
+            for chunk, context_content in enumerate(contexts, start=1):
+                with log_context(chunk=f"{chunk}/{total_chunks}"):
+                    try:
+                        logger.debug("Processing chunk")
+                        log_payload(logger, "creator.context", "Content preview: %s", context_content)
+
+                        response = self.call_llm({
+                            "context": context_content
+                        })
+                        chunk_risks.append(self._parse_chunk(response))
+
+                    except TokenBudgetExceeded:
+                        raise
+                    except Exception as e:
+                        self._chunk_failed(context_content, e)
+                        chunk_risks.append([])
+
+            return self._finish(state, chunk_risks)
+
+        except Exception as e:
+            logger.error("Error in risk generation: %s", e)
+            raise
+
+    async def agenerate(self, state: Dict) -> Dict:
+        """Async generate: all context chunks are sent to the model concurrently"""
+        try:
+            contexts = self._contexts(state)
+            total_chunks = len(contexts)
+            logger.info("=== Starting risk analysis with %d context chunks ===", total_chunks)
+
+            async def process(chunk: int, context_content: str) -> List[Dict]:
+                with log_context(chunk=f"{chunk}/{total_chunks}"):
+                    try:
+                        log_payload(logger, "creator.context", "Content preview: %s", context_content)
+                        response = await self.acall_llm({"context": context_content})
+                        return self._parse_chunk(response)
+                    except TokenBudgetExceeded:
+                        raise
+                    except Exception as e:
+                        self._chunk_failed(context_content, e)
+                        return []
+
+            chunk_risks = await asyncio.gather(*[
+                process(chunk, context_content) for chunk, context_content in enumerate(contexts, start=1)
+            ])
+            return self._finish(state, list(chunk_risks))
+
         except Exception as e:
-            logger.error(f"Error in risk generation: {str(e)}")
-            raise 
\ No newline at end of file
+            logger.error("Error in risk generation: %s", e)
+            raise
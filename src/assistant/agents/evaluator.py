@@ -1,19 +1,128 @@
-from typing import Dict
+from typing import Dict, List, Tuple
+import asyncio
 import logging
-import traceback
 from tenacity import retry, stop_after_attempt
-from ..utils import extract_json_from_response, rate_limit, split_json_array, merge_json_responses, count_tokens, process_risk_data
+from ..utils import extract_json_from_response, rate_limit, render_risk_chunks
+from ..records import RiskTable
+from ..scoring import score_risks
+from ..validation import validate_evaluated_risks
+from ..wire import EVALUATOR_INPUT_ROW, SCORE_ROW, decode_rows, join_by_id
+from ..logs import log_context
+from ..scheduler import TokenBudgetExceeded
 from .base import BaseAgent
-from ..prompts import EVALUATOR_PROMPT
+from ..prompts import EVALUATOR_PROMPT, EVALUATOR_PROMPT_PARTS
 
 logger = logging.getLogger(__name__)
 
+# Fields of an evaluated risk besides its scores, and how many times invalid or missing risks are re-asked
+EVALUATOR_FIELDS = ["Id", "Risco", "Relacionado ao"]
+MAX_REASK = 1
+
+def _chunks(risk_list: RiskTable) -> List[str]:
+    return render_risk_chunks(risk_list, fields=EVALUATOR_INPUT_ROW, compact=True)
+
+def _parse(response, risk_list: RiskTable):
+    """Validate [Id, scores...] rows after joining back the risk text and category"""
+    rows = decode_rows(extract_json_from_response(response), SCORE_ROW)
+    return validate_evaluated_risks(join_by_id(rows, risk_list, EVALUATOR_FIELDS))
+
 class EvaluatorAgent(BaseAgent):
     """Agent responsible for evaluating identified risks"""
-    
+
     def __init__(self, llm):
         super().__init__(llm)
         self.prompt = EVALUATOR_PROMPT
+        self.prompt_parts = EVALUATOR_PROMPT_PARTS
+
+    def _evaluate_chunks(self, risk_list: RiskTable) -> Tuple[List[Dict], List[str]]:
+        """Evaluate risks chunk by chunk, keeping only records that pass validation"""
+        valid, errors = [], []
+        chunks = _chunks(risk_list)
+        for index, chunk in enumerate(chunks, start=1):
+            with log_context(chunk=f"{index}/{len(chunks)}"):
+                try:
+                    response = self.call_llm({"risk_list": chunk})
+
+                    # Extract JSON from response text and validate each record
+                    result = _parse(response, risk_list)
+                except TokenBudgetExceeded:
+                    raise
+                except Exception as e:
+                    logger.error("[Evaluator] Chunk failed: %s", e)
+                    errors.append(f"Chunk failed: {str(e)}")
+                    continue
+
+            valid.extend(result.valid)
+            for record, record_errors in result.invalid:
+                errors.append(f"{record.get('Id', '?')}: {'; '.join(record_errors)}")
+        return valid, errors
+
+    async def _aevaluate_chunks(self, risk_list: RiskTable) -> Tuple[List[Dict], List[str]]:
+        """Async _evaluate_chunks: all chunks are sent to the model concurrently"""
+        async def evaluate_chunk(label: str, chunk: str):
+            with log_context(chunk=label):
+                try:
+                    response = await self.acall_llm({"risk_list": chunk})
+                    return _parse(response, risk_list), None
+                except TokenBudgetExceeded:
+                    raise
+                except Exception as e:
+                    logger.error("[Evaluator] Chunk failed: %s", e)
+                    return None, f"Chunk failed: {str(e)}"
+
+        chunks = _chunks(risk_list)
+        results = await asyncio.gather(*[
+            evaluate_chunk(f"{index}/{len(chunks)}", chunk) for index, chunk in enumerate(chunks, start=1)
+        ])
+        valid, errors = [], []
+        for result, error in results:
+            if error:
+                errors.append(error)
+                continue
+            valid.extend(result.valid)
+            for record, record_errors in result.invalid:
+                errors.append(f"{record.get('Id', '?')}: {'; '.join(record_errors)}")
+        return valid, errors
+
+    @staticmethod
+    def _pending(risk_list: RiskTable, evaluated: Dict[str, Dict]) -> RiskTable:
+        """Risks from the input that have no valid evaluation yet"""
+        ids = risk_list.column("Id")
+        return risk_list.take([i for i, risk_id in enumerate(ids) if risk_id not in evaluated])
+
+    @staticmethod
+    def _collect(valid: List[Dict], evaluated: Dict[str, Dict], input_ids) -> None:
+        for record in valid:
+            if record["Id"] in input_ids:
+                evaluated.setdefault(record["Id"], record)
+
+    def _finish(self, state: Dict, evaluated: Dict[str, Dict], pending: RiskTable, errors: List[str]) -> Dict:
+        if not evaluated:
+            raise ValueError("No valid risk evaluations were returned")
+
+        # Keep the input order; risks that never validated stay unscored for the optimizer
+        risk_list = state["risk_list"]
+        records = [evaluated.get(risk["Id"], risk) for risk in risk_list.to_records(EVALUATOR_FIELDS)]
+        evaluated_risks = score_risks(RiskTable.from_records(records))
+        tokens = self.tokens_used
+
+        update = {
+            "risk_analysis": evaluated_risks,
+            "iteration": state["iteration"] + 1,
+            "token_usage": {"evaluation": tokens}
+        }
+        if len(pending):
+            logger.warning("[Evaluator] %d risks could not be validated", len(pending))
+            update["validation_errors"] = errors
+        else:
+            logger.info("[Evaluator] Successfully processed risk evaluations")
+        return update
+
+    @staticmethod
+    def _failed(e: Exception) -> Dict:
+        logger.error("[Evaluator] Failed: %s", e, exc_info=True)
+        error_msg = f"Error in evaluation: {str(e)}"
+        return {"validation_errors": [error_msg]}
 
     @rate_limit(max_calls=10, period=60)
     @retry(stop=stop_after_attempt(2))
@@ -21,36 +130,49 @@ class EvaluatorAgent(BaseAgent):
         """Evaluate risks and assign impact scores"""
         logger.info("Starting report evaluation")
         try:
-            # Split input if needed
-            chunks = split_json_array(state["risk_list"])
-            all_responses = []
-            
-            for chunk in chunks:
-                chain = self.prompt | self.llm
-                response = chain.invoke({"risk_list": chunk})
-                
-                # Extract JSON from response text
-                risks = extract_json_from_response(response)
-                all_responses.append(risks)
-            
-            # Merge all responses
-            evaluated_risks = merge_json_responses(all_responses)
-            
-            # Process risk data
-            df = process_risk_data(evaluated_risks)
-            evaluated_risks = df.to_json(orient='records', force_ascii=False)
-            tokens = count_tokens(evaluated_risks)
-            
-            logger.info(f"[Evaluator] Successfully processed risk evaluations")
-            
-            return {
-                "risk_analysis": evaluated_risks,
-                "iteration": state["iteration"] + 1,
-                "token_usage": {"evaluation": tokens}
-            }
-            
+            risk_list = state["risk_list"]
+            input_ids = set(risk_list.column("Id"))
+            evaluated: Dict[str, Dict] = {}
+            errors: List[str] = []
+
+            # Evaluate everything once, then re-ask only for invalid or missing risks
+            pending = risk_list
+            for attempt in range(1 + MAX_REASK):
+                if attempt:
+                    logger.warning("[Evaluator] Re-asking for %d invalid or missing risks", len(pending))
+                valid, errors = self._evaluate_chunks(pending)
+                self._collect(valid, evaluated, input_ids)
+                pending = self._pending(risk_list, evaluated)
+                if not len(pending):
+                    break
+
+            return self._finish(state, evaluated, pending, errors)
+
+        except Exception as e:
+            return self._failed(e)
+
+    @rate_limit(max_calls=10, period=60)
+    @retry(stop=stop_after_attempt(2))
+    async def aevaluate(self, state: Dict) -> Dict:
+        """Async evaluate, with the same re-ask and validation rules"""
+        logger.info("Starting report evaluation")
+        try:
+            risk_list = state["risk_list"]
+            input_ids = set(risk_list.column("Id"))
+            evaluated: Dict[str, Dict] = {}
+            errors: List[str] = []
+
+            pending = risk_list
+            for attempt in range(1 + MAX_REASK):
+                if attempt:
+                    logger.warning("[Evaluator] Re-asking for %d invalid or missing risks", len(pending))
+                valid, errors = await self._aevaluate_chunks(pending)
+                self._collect(valid, evaluated, input_ids)
+                pending = self._pending(risk_list, evaluated)
+                if not len(pending):
+                    break
+
+            return self._finish(state, evaluated, pending, errors)
+
         except Exception as e:
-            logger.error(f"[Evaluator] Failed: {str(e)}")
-            logger.error(f"[Evaluator] Traceback: {traceback.format_exc()}")
-            error_msg = f"Error in evaluation: {str(e)}"
-            return {"validation_errors": [error_msg]}
+            return self._failed(e)
@@ -1,14 +1,45 @@
-from typing import Dict
+from typing import Dict, List
+import asyncio
 import logging
-import json
 from tenacity import retry, stop_after_attempt
-from ..utils import extract_json_from_response, rate_limit, split_json_array, merge_json_responses, count_tokens
+from ..utils import extract_json_from_response, rate_limit, render_risk_chunks
+from ..records import RiskTable
+from ..scoring import score_risks
+from ..validation import validate_evaluated_risks
 from .base import BaseAgent
 from ..prompts import OPTIMIZER_PROMPT
-import traceback
+from ..wire import OPTIMIZER_INPUT_ROW, SCORE_ROW, decode_rows, join_by_id
+from ..logs import log_context
+from ..scheduler import TokenBudgetExceeded
 
 logger = logging.getLogger(__name__)
 
+# How many times invalid or missing risks are re-asked before their evaluated scores are kept
+MAX_REASK = 1
+
+def _chunks(risk_analysis: RiskTable) -> List[str]:
+    return render_risk_chunks(risk_analysis, fields=OPTIMIZER_INPUT_ROW, compact=True)
+
+def _parse(response, risk_analysis: RiskTable):
+    """Validate revised [Id, scores...] rows after joining back the full input records"""
+    rows = decode_rows(extract_json_from_response(response), SCORE_ROW)
+    return validate_evaluated_risks(join_by_id(rows, risk_analysis, list(risk_analysis.columns)))
+
+def _collect(result, optimized: Dict[str, Dict], errors: List[str], input_ids) -> None:
+    """Keep valid revisions of input risks; made-up Ids are dropped"""
+    for record in result.valid:
+        if record["Id"] in input_ids:
+            optimized.setdefault(record["Id"], record)
+        else:
+            errors.append(f"{record['Id']}: not an input risk")
+    for record, record_errors in result.invalid:
+        errors.append(f"{record.get('Id', '?')}: {'; '.join(record_errors)}")
+
+def _pending(risk_analysis: RiskTable, optimized: Dict[str, Dict]) -> RiskTable:
+    """Risks from the input that have no valid revision yet"""
+    ids = risk_analysis.column("Id")
+    return risk_analysis.take([i for i, risk_id in enumerate(ids) if risk_id not in optimized])
+
 class OptimizationAgent(BaseAgent):
     """Agent responsible for optimizing and finalizing risk analysis"""
     
@@ -16,37 +47,122 @@ class OptimizationAgent(BaseAgent):
         super().__init__(llm)
         self.prompt = OPTIMIZER_PROMPT
 
+    def _optimize_chunks(self, risk_analysis: RiskTable, optimized: Dict[str, Dict], input_ids) -> List[str]:
+        """Revise risks chunk by chunk, collecting valid revisions into `optimized`"""
+        errors: List[str] = []
+        chunks = _chunks(risk_analysis)
+        for index, chunk in enumerate(chunks, start=1):
+            with log_context(chunk=f"{index}/{len(chunks)}"):
+                try:
+                    response = self.call_llm({"risk_analysis": chunk})
+
+                    # Extract JSON from response text and validate each record
+                    result = _parse(response, risk_analysis)
+                except TokenBudgetExceeded:
+                    raise
+                except Exception as e:
+                    logger.error("[Optimizer] Chunk failed: %s", e)
+                    errors.append(f"Chunk failed: {str(e)}")
+                    continue
+            _collect(result, optimized, errors, input_ids)
+        return errors
+
+    async def _aoptimize_chunks(self, risk_analysis: RiskTable, optimized: Dict[str, Dict], input_ids) -> List[str]:
+        """Async _optimize_chunks: all chunks are sent to the model concurrently"""
+        async def optimize_chunk(label: str, chunk: str):
+            with log_context(chunk=label):
+                try:
+                    response = await self.acall_llm({"risk_analysis": chunk})
+                    return _parse(response, risk_analysis), None
+                except TokenBudgetExceeded:
+                    raise
+                except Exception as e:
+                    logger.error("[Optimizer] Chunk failed: %s", e)
+                    return None, f"Chunk failed: {str(e)}"
+
+        chunks = _chunks(risk_analysis)
+        results = await asyncio.gather(*[
+            optimize_chunk(f"{index}/{len(chunks)}", chunk) for index, chunk in enumerate(chunks, start=1)
+        ])
+        errors: List[str] = []
+        for result, error in results:
+            if error:
+                errors.append(error)
+                continue
+            _collect(result, optimized, errors, input_ids)
+        return errors
+
+    def _finish(self, state: Dict, optimized: Dict[str, Dict], pending: RiskTable, errors: List[str]) -> Dict:
+        if not optimized:
+            raise ValueError("No valid risk revisions were returned")
+
+        # Keep the input order; risks without a valid revision keep their evaluated scores
+        risk_analysis = state["risk_analysis"]
+        records = [optimized.get(risk["Id"], risk) for risk in risk_analysis.to_records()]
+        optimized_risks = score_risks(RiskTable.from_records(records))
+        tokens = self.tokens_used
+
+        update = {
+            "risk_list": optimized_risks,
+            "iteration": state["iteration"] + 1,
+            "token_usage": {"optimization": tokens}
+        }
+        if len(pending):
+            logger.warning("[Optimizer] %d risks kept their evaluated scores", len(pending))
+            update["validation_errors"] = errors + [
+                f"{risk_id}: no valid revision, kept its evaluated scores" for risk_id in pending.column("Id")
+            ]
+        else:
+            logger.info("[Optimizer] Successfully extracted optimized risks")
+        return update
+
     @rate_limit(max_calls=5, period=60)
     @retry(stop=stop_after_attempt(3))
     def optimize(self, state: Dict) -> Dict:
         """Optimize risk analysis with scoring and categorization"""
         logger.info("Starting report optimization")
         try:
-            # Split input if needed
-            chunks = split_json_array(state["risk_analysis"])
-            all_responses = []
-            
-            for chunk in chunks:
-                chain = self.prompt | self.llm
-                response = chain.invoke({"risk_analysis": chunk})
-                
-                # Extract JSON from response
-                risks = extract_json_from_response(response)
-                all_responses.append(risks)
-            
-            # Merge responses
-            optimized_risks = merge_json_responses(all_responses)
-            tokens = count_tokens(optimized_risks)
-            
-            logger.info("[Optimizer] Successfully extracted optimized risks")
-            
-            return {
-                "risk_list": optimized_risks,
-                "iteration": state["iteration"] + 1,
-                "token_usage": {"optimization": tokens}
-            }
-            
+            risk_analysis = state["risk_analysis"]
+            input_ids = set(risk_analysis.column("Id"))
+            optimized: Dict[str, Dict] = {}
+
+            # Revise everything once, then re-ask only for invalid or missing risks
+            pending = risk_analysis
+            for attempt in range(1 + MAX_REASK):
+                if attempt:
+                    logger.warning("[Optimizer] Re-asking for %d invalid or missing risks", len(pending))
+                errors = self._optimize_chunks(pending, optimized, input_ids)
+                pending = _pending(risk_analysis, optimized)
+                if not len(pending):
+                    break
+
+            return self._finish(state, optimized, pending, errors)
+
+        except Exception as e:
+            logger.error("[Optimizer] Failed: %s", e, exc_info=True)
+            raise
+
+    @rate_limit(max_calls=5, period=60)
+    @retry(stop=stop_after_attempt(3))
+    async def aoptimize(self, state: Dict) -> Dict:
+        """Async optimize, with the same re-ask and validation rules"""
+        logger.info("Starting report optimization")
+        try:
+            risk_analysis = state["risk_analysis"]
+            input_ids = set(risk_analysis.column("Id"))
+            optimized: Dict[str, Dict] = {}
+
+            pending = risk_analysis
+            for attempt in range(1 + MAX_REASK):
+                if attempt:
+                    logger.warning("[Optimizer] Re-asking for %d invalid or missing risks", len(pending))
+                errors = await self._aoptimize_chunks(pending, optimized, input_ids)
+                pending = _pending(risk_analysis, optimized)
+                if not len(pending):
+                    break
+
+            return self._finish(state, optimized, pending, errors)
+
         except Exception as e:
-            logger.error(f"[Optimizer] Failed: {str(e)}")
-            logger.error(f"[Optimizer] Traceback: {traceback.format_exc()}")
+            logger.error("[Optimizer] Failed: %s", e, exc_info=True)
             raise
@@ -0,0 +1,287 @@
+import argparse
+import hashlib
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, List, Optional, Sequence, Tuple
+from .configuration import BATCH_WORKERS, EXPORT_FORMATS, SCHEDULER_JOB_TOKEN_BUDGET, logger
+from .delta import RunSnapshot, snapshot_path
+from .export import WRITERS, ReportExporter
+from .metrics import PROCESS_METRICS, start_run
+from .records import RISK_FIELDS, RiskTable
+from .scheduler import job_context
+from .scoring import CATEGORY_FIELD, DOCUMENT_FIELD, aggregate_risks
+
+DOCUMENT_EXTENSIONS = (".pdf",)
+PROGRESS_FILE = "progress.json"
+# Portfolio report base name; one file per export format (portfolio_report.json, .xlsx, ...)
+PORTFOLIO_REPORT = "portfolio_report"
+PORTFOLIO_SUMMARY = "portfolio_summary.json"
+
+def document_id(path: str, root: str) -> str:
+    """Stable report name for a document: its path relative to root, without extension
+
+    Documents in subdirectories get a short hash of the relative path appended,
+    so a/b.pdf and a__b.pdf do not flatten to the same name.
+    """
+    relative = os.path.relpath(os.path.abspath(path), os.path.abspath(root))
+    stem = os.path.splitext(relative)[0]
+    if os.sep not in stem:
+        return stem
+    digest = hashlib.sha256(relative.replace(os.sep, "/").encode("utf-8")).hexdigest()[:8]
+    return f"{stem.replace(os.sep, '__')}-{digest}"
+
+def discover_documents(source: str) -> List[Tuple[str, str]]:
+    """List (document id, path) pairs from a directory or a manifest file
+
+    A manifest is either a text file with one path per line (blank lines and
+    `#` comments ignored) or a JSON list of paths or {"path", "id"} objects.
+    Relative paths are resolved against the manifest's directory.
+    """
+    if os.path.isdir(source):
+        documents = []
+        for directory, _, files in os.walk(source):
+            for name in sorted(files):
+                if name.lower().endswith(DOCUMENT_EXTENSIONS):
+                    path = os.path.join(directory, name)
+                    documents.append((document_id(path, source), path))
+        return _check_unique(sorted(documents), source)
+
+    root = os.path.dirname(os.path.abspath(source))
+    with open(source, "r", encoding="utf-8") as f:
+        text = f.read()
+    if source.endswith(".json"):
+        entries = json.loads(text)
+    else:
+        entries = [line.strip() for line in text.splitlines() if line.strip() and not line.strip().startswith("#")]
+
+    documents = []
+    for entry in entries:
+        if isinstance(entry, dict):
+            path, doc_id = entry["path"], entry.get("id")
+        else:
+            path, doc_id = entry, None
+        path = path if os.path.isabs(path) else os.path.join(root, path)
+        documents.append((doc_id or document_id(path, root), path))
+
+    return _check_unique(documents, source)
+
+def _check_unique(documents: List[Tuple[str, str]], source: str) -> List[Tuple[str, str]]:
+    ids = [doc_id for doc_id, _ in documents]
+    duplicates = sorted({doc_id for doc_id in ids if ids.count(doc_id) > 1})
+    if duplicates:
+        raise ValueError(f"Duplicate document ids in {source}: {duplicates}")
+    return documents
+
+def _write_json(path: str, data) -> None:
+    """Write JSON atomically so an interrupted batch never leaves a torn file"""
+    tmp_file = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_file, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_file, path)
+
+class BatchProgress:
+    """Per-document status persisted to progress.json after every change"""
+
+    def __init__(self, path: str, resume: bool = True):
+        self.path = path
+        self._lock = threading.Lock()
+        self.documents: Dict[str, Dict] = {}
+        if resume and os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                self.documents = json.load(f)
+
+    def is_done(self, doc_id: str) -> bool:
+        entry = self.documents.get(doc_id, {})
+        return entry.get("status") == "done" and os.path.exists(entry.get("report", ""))
+
+    def update(self, doc_id: str, **fields) -> None:
+        with self._lock:
+            self.documents.setdefault(doc_id, {}).update(fields)
+            _write_json(self.path, self.documents)
+
+def analyse_document(doc_id: str, path: str, reports_dir: str, baseline_file: Optional[str] = None,
+                     token_budget: int = SCHEDULER_JOB_TOKEN_BUDGET) -> Dict:
+    """Run the workflow on one document and write its report, snapshot and metrics
+
+    With a baseline snapshot (from a previous batch of the same document),
+    only the contexts that changed are re-analysed. The document's LLM calls
+    are scheduled as a batch job, behind interactive work, and stop once
+    token_budget tokens are spent (0: no limit).
+    """
+    from .main import get_agent
+
+    initial_state = {
+        "input_file": path,
+        "risk_list": RiskTable(),
+        "iteration": 0
+    }
+    if baseline_file:
+        initial_state["baseline_file"] = baseline_file
+
+    with start_run(doc_id) as run_metrics, job_context(doc_id, "batch", token_budget):
+        final_state = get_agent().invoke(initial_state)
+
+    final_risks = final_state["risk_list"]
+    if not len(final_risks):
+        raise ValueError(f"Workflow produced no risks: {final_state.get('validation_errors', [])}")
+
+    final_risks = final_risks.assign({DOCUMENT_FIELD: [doc_id] * len(final_risks)})
+    report_file = os.path.join(reports_dir, f"{doc_id}.json")
+    _write_json(report_file, final_risks.to_records())
+    RunSnapshot.from_state(final_state).save(snapshot_path(report_file))
+    run_metrics.write(os.path.join(reports_dir, f"{doc_id}.metrics.json"))
+
+    return {
+        "report": report_file,
+        "risks": len(final_risks),
+        "token_usage": final_state.get("token_usage", {}),
+        "validation_errors": len(final_state.get("validation_errors") or []),
+    }
+
+class Portfolio:
+    """Consolidated report across documents, appended to as each document finishes
+
+    Risks are streamed to the portfolio files in every export format and
+    only the per-document summary records are kept, so memory and time per
+    document stay flat as the portfolio grows.
+    """
+
+    def __init__(self, output_dir: str, formats: Sequence[str] = EXPORT_FORMATS):
+        self.output_dir = output_dir
+        self.exporter = ReportExporter(
+            os.path.join(output_dir, PORTFOLIO_REPORT), formats, [DOCUMENT_FIELD] + RISK_FIELDS
+        )
+        self.summary: List[Dict] = []
+        self._lock = threading.Lock()
+
+    def add(self, table: RiskTable) -> None:
+        self.exporter.write(table)
+        # Groups include the document, so each document's aggregates are final
+        summary = aggregate_risks(table)
+        with self._lock:
+            self.summary.extend(summary)
+
+    def add_report(self, report_file: str) -> None:
+        with open(report_file, "r", encoding="utf-8") as f:
+            self.add(RiskTable.from_records(json.load(f)))
+
+    def close(self) -> int:
+        """Finish the portfolio files and write the summary; returns the number of risks"""
+        self.exporter.close()
+        summary = sorted(self.summary, key=lambda record: (str(record[DOCUMENT_FIELD]), str(record[CATEGORY_FIELD])))
+        _write_json(os.path.join(self.output_dir, PORTFOLIO_SUMMARY), summary)
+        return self.exporter.rows
+
+    def abort(self) -> None:
+        self.exporter.abort()
+
+def consolidate(progress: BatchProgress, output_dir: str, formats: Sequence[str] = EXPORT_FORMATS) -> int:
+    """Rebuild the portfolio report and summary from the per-document reports, one at a time"""
+    portfolio = Portfolio(output_dir, formats)
+    try:
+        for doc_id, entry in sorted(progress.documents.items()):
+            if entry.get("status") == "done":
+                portfolio.add_report(entry["report"])
+    except Exception:
+        portfolio.abort()
+        raise
+    return portfolio.close()
+
+def run_batch(source: str, output_dir: str, workers: int = BATCH_WORKERS, resume: bool = True,
+              limit: Optional[int] = None, baseline_dir: Optional[str] = None,
+              formats: Sequence[str] = EXPORT_FORMATS,
+              token_budget: int = SCHEDULER_JOB_TOKEN_BUDGET) -> BatchProgress:
+    """Analyse every document from source with document-level parallelism
+
+    Models, rate limits, the LLM worker pool and the document caches are
+    process-wide, so all workers share them. Documents already marked done in
+    progress.json are skipped when resuming. With baseline_dir (the output
+    directory of an earlier batch), documents with a snapshot there run in
+    delta mode. The portfolio report is written in each of `formats` as
+    documents finish, starting with those done in an earlier run.
+    """
+    documents = discover_documents(source)
+    if limit:
+        documents = documents[:limit]
+    reports_dir = os.path.join(output_dir, "reports")
+    os.makedirs(reports_dir, exist_ok=True)
+
+    progress = BatchProgress(os.path.join(output_dir, PROGRESS_FILE), resume=resume)
+    pending = [(doc_id, path) for doc_id, path in documents if not progress.is_done(doc_id)]
+    logger.info(f"Batch: {len(documents)} documents, {len(documents) - len(pending)} already done, "
+                f"{len(pending)} to analyse with {workers} workers")
+
+    portfolio = Portfolio(output_dir, formats)
+    try:
+        for doc_id, entry in sorted(progress.documents.items()):
+            if progress.is_done(doc_id):
+                portfolio.add_report(entry["report"])
+    except Exception:
+        portfolio.abort()
+        raise
+
+    def process(doc_id: str, path: str) -> None:
+        started = time.time()
+        progress.update(doc_id, path=path, status="running", started_at=started, error=None)
+        try:
+            baseline_file = None
+            if baseline_dir:
+                candidate = snapshot_path(os.path.join(baseline_dir, "reports", f"{doc_id}.json"))
+                baseline_file = candidate if os.path.exists(candidate) else None
+            result = analyse_document(doc_id, path, reports_dir, baseline_file, token_budget)
+            portfolio.add_report(result["report"])
+            progress.update(doc_id, status="done", finished_at=time.time(),
+                            wall_s=time.time() - started, **result)
+            logger.info(f"Batch: {doc_id} done ({result['risks']} risks, {time.time() - started:.1f}s)")
+        except Exception as e:
+            logger.error(f"Batch: {doc_id} failed: {str(e)}")
+            logger.debug("Batch: %s traceback", doc_id, exc_info=True)
+            progress.update(doc_id, status="failed", finished_at=time.time(), error=str(e))
+
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="batch") as executor:
+            futures = [executor.submit(process, doc_id, path) for doc_id, path in pending]
+            for future in as_completed(futures):
+                future.result()
+    except BaseException:
+        portfolio.abort()
+        raise
+
+    risks = portfolio.close()
+    PROCESS_METRICS.write(os.path.join(output_dir, "batch_metrics.json"))
+
+    failed = [doc_id for doc_id, entry in progress.documents.items() if entry.get("status") == "failed"]
+    logger.info(f"Batch finished: {risks} risks in {', '.join(portfolio.exporter.paths.values())}")
+    if failed:
+        logger.warning(f"Batch: {len(failed)} documents failed: {failed}")
+    return progress
+
+def main():
+    parser = argparse.ArgumentParser(description="Analyse a directory or manifest of documents")
+    parser.add_argument("source", help="Directory of PDFs, or a manifest (.txt with one path per line, or .json)")
+    parser.add_argument("--output-dir", default="batch_output", help="Where reports and progress are written")
+    parser.add_argument("--workers", type=int, default=BATCH_WORKERS, help="Documents analysed concurrently")
+    parser.add_argument("--restart", action="store_true", help="Ignore progress.json and analyse every document")
+    parser.add_argument("--limit", type=int, help="Only analyse the first N documents")
+    parser.add_argument("--baseline-dir", help="Output directory of a previous batch; re-analyse only changed contexts")
+    parser.add_argument("--formats", nargs="+", choices=sorted(WRITERS), default=EXPORT_FORMATS,
+                        help="Portfolio report formats (default: RISK_AGENT_EXPORT_FORMATS)")
+    parser.add_argument("--token-budget", type=int, default=SCHEDULER_JOB_TOKEN_BUDGET,
+                        help="Maximum LLM tokens per document (default: RISK_AGENT_JOB_TOKEN_BUDGET, 0: no limit)")
+    args = parser.parse_args()
+
+    try:
+        progress = run_batch(args.source, args.output_dir, args.workers, resume=not args.restart,
+                             limit=args.limit, baseline_dir=args.baseline_dir, formats=args.formats,
+                             token_budget=args.token_budget)
+    except Exception as e:
+        logger.error(f"Batch failed: {str(e)}")
+        raise
+    if any(entry.get("status") == "failed" for entry in progress.documents.values()):
+        raise SystemExit(1)
+
+if __name__ == "__main__":
+    main()
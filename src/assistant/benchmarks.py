@@ -0,0 +1,239 @@
+import argparse
+import contextlib
+import gc
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List, Optional
+
+PACKAGE_DIR = Path(__file__).resolve().parent
+FIXTURE_PATH = PACKAGE_DIR / "risk_analysis" / "output_risk_eval.json"
+DOCUMENT_PATH = PACKAGE_DIR / "documents" / "TERMO_DE_REFERENCIA.pdf"
+BASELINE_PATH = PACKAGE_DIR / "risk_analysis" / "benchmark_baseline.json"
+
+RISK_SIZES = [1_000, 10_000, 100_000]
+PAGE_SIZES = [10, 200, 2000]
+QUICK_RISK_SIZES = [1_000]
+QUICK_PAGE_SIZES = [10]
+
+def synthetic_risks(n: int) -> List[Dict]:
+    """Cycle the fixture risks up to n records with unique Ids"""
+    with open(FIXTURE_PATH, "r", encoding="utf-8") as f:
+        sample = json.load(f)
+    risks = []
+    for i in range(n):
+        risk = dict(sample[i % len(sample)])
+        risk["Id"] = f"R{i + 1:06d}"
+        risks.append(risk)
+    return risks
+
+def synthetic_pages(n: int) -> List:
+    """Cycle the sample document pages up to n page Documents"""
+    from langchain.schema import Document
+
+    with open(DOCUMENT_PATH, "r", encoding="utf-8", errors="replace") as f:
+        pages = [page.strip() for page in f.read().split("\f") if page.strip()]
+    return [
+        Document(page_content=pages[i % len(pages)], metadata={"source": "synthetic.pdf", "page": i})
+        for i in range(n)
+    ]
+
+def measure(fn: Callable[[], object], repeat: int = 3) -> Dict[str, float]:
+    """Time fn (best and median of `repeat` runs) and its peak traced memory"""
+    timings = []
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+
+    gc.collect()
+    tracemalloc.start()
+    try:
+        fn()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {
+        "best_s": min(timings),
+        "median_s": statistics.median(timings),
+        "peak_mib": peak / (1024 * 1024),
+    }
+
+def micro_benchmarks(risk_sizes: List[int], page_sizes: List[int]) -> Dict[str, Callable[[], object]]:
+    """Build the micro benchmark cases, keyed by name"""
+    from .export import export_report
+    from .records import RiskTable
+    from .scoring import score_risks
+    from .utils import (
+        count_tokens,
+        extract_json_from_response,
+        get_text_splitter,
+        merge_json_responses,
+        process_risk_data,
+        render_risk_chunks,
+        split_json_array,
+    )
+
+    cases = {}
+    for n in risk_sizes:
+        risks = synthetic_risks(n)
+        risks_json = json.dumps(risks, ensure_ascii=False)
+        table = RiskTable.from_records(risks)
+        batches = [risks[i:i + 20] for i in range(0, n, 20)]
+        response = "Segue a avaliação:\n```json\n" + json.dumps(risks, ensure_ascii=False, indent=2) + "\n```"
+
+        cases[f"split_json_array[{n}]"] = lambda s=risks_json: split_json_array(s)
+        cases[f"render_risk_chunks[{n}]"] = lambda t=table: render_risk_chunks(t)
+        cases[f"merge_json_responses[{n}]"] = lambda b=batches: merge_json_responses(b)
+        cases[f"extract_json_from_response[{n}]"] = lambda r=response: extract_json_from_response(r)
+        cases[f"count_tokens[{n}]"] = lambda s=risks_json: count_tokens(s)
+        cases[f"process_risk_data[{n}]"] = lambda s=risks_json: process_risk_data(s)
+        cases[f"score_risks[{n}]"] = lambda t=table: score_risks(t)
+        export_base = os.path.join(tempfile.mkdtemp(prefix="bench-export-"), "report")
+        cases[f"export_report[{n}]"] = lambda t=score_risks(table), b=export_base: export_report(
+            t, b, ["jsonl", "parquet", "xlsx"]
+        )
+
+    for n in page_sizes:
+        pages = synthetic_pages(n)
+        cases[f"text_splitter[{n} pages]"] = lambda p=pages: get_text_splitter().split_documents(p)
+
+    return cases
+
+@contextlib.contextmanager
+def cache_dir(path: str) -> Iterator[None]:
+    """Point every module that stores artifacts under CACHE_DIR at path, with empty in-memory caches"""
+    from . import blobs, ingest, stages, utils
+
+    previous = (utils.CACHE_DIR, ingest.CACHE_DIR, stages.CACHE_DIR, blobs.BLOB_DIR)
+    utils.CACHE_DIR = ingest.CACHE_DIR = stages.CACHE_DIR = path
+    blobs.BLOB_DIR = os.path.join(path, "blobs")
+    for cache in (utils.vectorstore_cache, utils.context_cache, blobs._blob_cache):
+        cache.clear()
+    try:
+        yield
+    finally:
+        utils.CACHE_DIR, ingest.CACHE_DIR, stages.CACHE_DIR, blobs.BLOB_DIR = previous
+
+def graph_benchmarks() -> Dict[str, Callable[[], object]]:
+    """Full workflow runs against the fake backend, with a cold and a warm cache"""
+    from .fakes import use_fake_backend
+    from .main import get_agent
+    from .records import RiskTable
+
+    use_fake_backend()
+    agent = get_agent()
+    state = {"input_file": str(DOCUMENT_PATH), "risk_list": RiskTable(), "iteration": 0}
+
+    def cold():
+        # A fresh cache directory and empty in-memory caches force splitting, embedding and indexing
+        with cache_dir(tempfile.mkdtemp(prefix="bench-cache-")):
+            return agent.invoke(state)
+
+    # Prime the shared cache so the warm case measures cache hits only
+    agent.invoke(state)
+
+    return {
+        "graph_run[cold cache]": cold,
+        "graph_run[warm cache]": lambda: agent.invoke(state),
+    }
+
+def compare(results: Dict[str, Dict], baseline: Dict[str, Dict], tolerance: float) -> List[str]:
+    """Return a message for each case slower or larger than baseline by more than tolerance"""
+    regressions = []
+    for name, result in results.items():
+        reference = baseline.get(name)
+        if not reference:
+            continue
+        for metric in ("best_s", "peak_mib"):
+            if reference[metric] > 0 and result[metric] > reference[metric] * (1 + tolerance):
+                regressions.append(
+                    f"{name}: {metric} {result[metric]:.4f} vs baseline {reference[metric]:.4f}"
+                )
+    return regressions
+
+def print_table(results: Dict[str, Dict], baseline: Optional[Dict[str, Dict]] = None) -> None:
+    print(f"{'benchmark':<42} {'best (s)':>10} {'median (s)':>11} {'peak (MiB)':>11} {'vs base':>8}")
+    for name, result in results.items():
+        reference = (baseline or {}).get(name)
+        delta = f"{result['best_s'] / reference['best_s']:.2f}x" if reference and reference["best_s"] else "-"
+        print(f"{name:<42} {result['best_s']:>10.4f} {result['median_s']:>11.4f} {result['peak_mib']:>11.2f} {delta:>8}")
+
+def isolate_environment() -> None:
+    """Benchmark settings, which configuration reads once at import
+
+    The fake backend has no quota, so client-side rate limits would only add
+    sleeps, and its indexes must never land in (or evict from) the real cache,
+    even when RISK_AGENT_CACHE_DIR is set. Graph runs measure the LLM stages,
+    so stored stage outputs are not reused.
+    """
+    if "src.assistant.configuration" in sys.modules:
+        raise RuntimeError("benchmark settings must be applied before the package configuration is imported")
+    os.environ.setdefault("RISK_AGENT_RATE_LIMITS", "0")
+    os.environ.setdefault("RISK_AGENT_STAGE_CACHE", "0")
+    os.environ["RISK_AGENT_CACHE_DIR"] = tempfile.mkdtemp(prefix="bench-cache-")
+
+def main():
+    isolate_environment()
+    parser = argparse.ArgumentParser(
+        description="Run the risk analyst micro and end-to-end benchmarks",
+        epilog="Scale-ups are synthetic: the fixture risks are cycled to 1k-100k records and the "
+               "sample document pages to 10-2000 pages. Graph runs use the offline fake backend."
+    )
+    parser.add_argument("--quick", action="store_true", help="Only run the smallest sizes")
+    parser.add_argument("--repeat", type=int, default=3, help="Timed runs per case")
+    parser.add_argument("--filter", default="", help="Only run cases whose name contains this text")
+    parser.add_argument("--no-graph", action="store_true", help="Skip the end-to-end graph runs")
+    parser.add_argument("--baseline", default=str(BASELINE_PATH), help="Baseline JSON file")
+    parser.add_argument("--save-baseline", action="store_true", help="Write results as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed slowdown before flagging a regression")
+    parser.add_argument("--output", help="Write results to this JSON file")
+    parser.add_argument("--ci", action="store_true",
+                        help="Fail when the baseline file is missing instead of only printing results")
+    args = parser.parse_args()
+    if args.ci and not args.save_baseline and not os.path.exists(args.baseline):
+        parser.error(f"no baseline at {args.baseline}; record one with --quick --save-baseline")
+
+    cases = micro_benchmarks(
+        QUICK_RISK_SIZES if args.quick else RISK_SIZES,
+        QUICK_PAGE_SIZES if args.quick else PAGE_SIZES,
+    )
+    if not args.no_graph:
+        cases.update(graph_benchmarks())
+
+    results = {}
+    for name, fn in cases.items():
+        if args.filter in name:
+            results[name] = measure(fn, args.repeat)
+
+    baseline = None
+    if os.path.exists(args.baseline) and not args.save_baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+    print_table(results, baseline)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    if args.save_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"\nBaseline saved to: {args.baseline}")
+    elif baseline:
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print("\nRegressions:")
+            for message in regressions:
+                print(f"  {message}")
+            sys.exit(1)
+        print("\nNo regressions against baseline")
+
+if __name__ == "__main__":
+    main()
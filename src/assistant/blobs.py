@@ -0,0 +1,70 @@
+import hashlib
+import os
+import uuid
+from dataclasses import dataclass
+from typing import List, Union
+from .configuration import BLOB_CACHE_SIZE, BLOB_MIN_SIZE, CACHE_DIR
+from .utils import LRUCache
+
+BLOB_DIR = os.path.join(CACHE_DIR, "blobs")
+
+# Recently stored or read blob texts, by digest
+_blob_cache = LRUCache(BLOB_CACHE_SIZE)
+
+@dataclass(frozen=True)
+class BlobRef:
+    """Reference to a text in the blob store, used in graph state instead of the text
+
+    Only the digest and size are copied between nodes and written to
+    checkpoints; `content` reads the text back on first use.
+    """
+    digest: str
+    size: int
+
+    @property
+    def content(self) -> str:
+        return get_blob(self.digest)
+
+    def __str__(self) -> str:
+        return self.content
+
+def _blob_path(digest: str) -> str:
+    return os.path.join(BLOB_DIR, digest[:2], f"{digest}.txt")
+
+def put_blob(text: str) -> BlobRef:
+    """Store a text under its sha256 digest; storing the same text twice is a no-op"""
+    digest = hashlib.sha256(text.encode("utf-8")).hexdigest()
+    path = _blob_path(digest)
+    if not os.path.exists(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_file = f"{path}.{uuid.uuid4().hex}.tmp"
+        # newline="" keeps \r and \r\n as they are, so the file matches its digest
+        with open(tmp_file, "w", encoding="utf-8", newline="") as f:
+            f.write(text)
+        os.replace(tmp_file, path)
+    else:
+        # Refresh the mtime that cache eviction goes by
+        os.utime(path)
+    _blob_cache.put(digest, text)
+    return BlobRef(digest, len(text))
+
+def get_blob(digest: str) -> str:
+    text = _blob_cache.get(digest)
+    if text is None:
+        try:
+            with open(_blob_path(digest), "r", encoding="utf-8", newline="") as f:
+                text = f.read()
+        except FileNotFoundError:
+            raise FileNotFoundError(
+                f"Blob {digest} is not in {BLOB_DIR}; it was evicted from the cache, "
+                "so state or checkpoints referring to it cannot be resumed"
+            ) from None
+        _blob_cache.put(digest, text)
+    return text
+
+def has_blob(digest: str) -> bool:
+    return _blob_cache.get(digest) is not None or os.path.exists(_blob_path(digest))
+
+def to_blobs(texts: List[str], min_size: int = BLOB_MIN_SIZE) -> List[Union[str, BlobRef]]:
+    """Replace texts of at least min_size characters with blob references"""
+    return [put_blob(text) if isinstance(text, str) and len(text) >= min_size else text for text in texts]
@@ -0,0 +1,373 @@
+import argparse
+import hashlib
+import json
+import os
+import re
+import shutil
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+from .configuration import CACHE_DIR, CACHE_MAX_AGE_DAYS, CACHE_MAX_MB, logger
+
+MANIFEST_FILE = "manifest.json"
+MANIFEST_VERSION = 1
+HASH_BLOCK_SIZE = 1 << 20
+# Access times are persisted at most this often per entry
+TOUCH_INTERVAL_S = 60
+# Untracked files younger than this may belong to a run that has not recorded them yet
+ORPHAN_GRACE_S = 3600
+# Content-addressed stores inside CACHE_DIR whose files are evicted by modification time
+LOOSE_DIRS = ("stages", "blobs")
+# Names of the artifacts this cache writes at its top level (index directories,
+# RAG contexts, unfinished writes); nothing else in CACHE_DIR is ever removed
+ARTIFACT_SUFFIXES = (".faiss", ".contexts.json", ".tmp")
+
+_WHITESPACE = re.compile(r"\s+")
+_BLOB_DIGEST = re.compile(r'"__blob__":\s*"([0-9a-f]{64})"')
+
+def file_hash(path: str, algorithm: str = "md5") -> str:
+    """Hash a file in fixed-size blocks instead of reading it into memory"""
+    digest = hashlib.new(algorithm)
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def text_hash(pages: Iterable[str]) -> str:
+    """Hash of a document's non-empty pages with whitespace normalized
+
+    A PDF re-exported with identical text (new metadata, fonts or object
+    layout) gets the same hash as the original.
+    """
+    digest = hashlib.sha256()
+    for page in pages:
+        text = _WHITESPACE.sub(" ", page).strip()
+        if text:
+            digest.update(text.encode("utf-8"))
+            digest.update(b"\f")
+    return digest.hexdigest()
+
+def path_size(path: str) -> int:
+    if os.path.isdir(path):
+        return sum(
+            os.path.getsize(os.path.join(directory, name))
+            for directory, _, files in os.walk(path) for name in files
+        )
+    return os.path.getsize(path) if os.path.exists(path) else 0
+
+def _remove(path: str) -> None:
+    if os.path.isdir(path):
+        shutil.rmtree(path, ignore_errors=True)
+    elif os.path.exists(path):
+        os.remove(path)
+
+class CacheManifest:
+    """Record of the derived artifacts stored in a cache directory
+
+    `documents` maps a file's content hash and index fingerprint to the
+    normalized-text hash its index is stored under, so known files skip PDF
+    parsing. `entries` holds every index and context file (path relative to
+    the cache directory) with its kind, size, creation and last access time.
+
+    Several processes may share a cache directory (e.g. the ingestion worker
+    and the service): changes written by others are merged in before every
+    update and when a document lookup misses.
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+        self.path = os.path.join(root, MANIFEST_FILE)
+        self.documents: Dict[str, Dict] = {}
+        self.entries: Dict[str, Dict] = {}
+        self._lock = threading.RLock()
+        # Modification time of the manifest file as last read or written by this process
+        self._mtime_ns: Optional[int] = None
+        self._load()
+
+    def _stat(self) -> Optional[int]:
+        try:
+            return os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def _read(self) -> Optional[Dict]:
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logger.warning(f"[Cache] Ignoring unreadable manifest {self.path}: {str(e)}")
+            return None
+        if data.get("version") != MANIFEST_VERSION:
+            logger.warning(f"[Cache] Ignoring manifest version {data.get('version')} in {self.path}")
+            return None
+        return data
+
+    def _load(self) -> None:
+        self._mtime_ns = self._stat()
+        data = self._read()
+        if data is not None:
+            self.documents = data.get("documents", {})
+            self.entries = data.get("entries", {})
+
+    def refresh(self) -> None:
+        """Merge in what other processes wrote to the manifest since we last read or saved it
+
+        Entries another process evicted are dropped unless their files still exist.
+        """
+        with self._lock:
+            mtime_ns = self._stat()
+            if mtime_ns is None or mtime_ns == self._mtime_ns:
+                return
+            self._mtime_ns = mtime_ns
+            data = self._read()
+            if data is None:
+                return
+            entries = data.get("entries", {})
+            for relative, entry in self.entries.items():
+                other = entries.get(relative)
+                if other is None:
+                    if os.path.exists(os.path.join(self.root, relative)):
+                        entries[relative] = entry
+                elif entry["last_access"] > other["last_access"]:
+                    entries[relative] = entry
+            self.entries = entries
+            self.documents = {**data.get("documents", {}), **self.documents}
+
+    def save(self) -> None:
+        with self._lock:
+            data = {"version": MANIFEST_VERSION, "documents": self.documents, "entries": self.entries}
+            tmp_file = f"{self.path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_file, "w", encoding="utf-8") as f:
+                json.dump(data, f, indent=1)
+            os.replace(tmp_file, self.path)
+            self._mtime_ns = self._stat()
+
+    def lookup_document(self, content_hash: str, fingerprint: str) -> Optional[str]:
+        """Text hash recorded for a file content and index fingerprint"""
+        key = f"{content_hash}:{fingerprint}"
+        with self._lock:
+            if key not in self.documents:
+                # The document may have been ingested by another process
+                self.refresh()
+            document = self.documents.get(key)
+            return document["text_hash"] if document else None
+
+    def record_document(self, content_hash: str, fingerprint: str, text_hash: str) -> None:
+        with self._lock:
+            self.refresh()
+            self.documents[f"{content_hash}:{fingerprint}"] = {"text_hash": text_hash, "recorded": time.time()}
+            self.save()
+
+    def record(self, relative: str, kind: str, **info) -> None:
+        """Register a newly written artifact"""
+        now = time.time()
+        with self._lock:
+            self.refresh()
+            self.entries[relative] = {
+                "kind": kind,
+                "size": path_size(os.path.join(self.root, relative)),
+                "created": now,
+                "last_access": now,
+                **info,
+            }
+            self.save()
+
+    def touch(self, relative: str) -> None:
+        """Mark an artifact as used; persisted at most every TOUCH_INTERVAL_S"""
+        now = time.time()
+        with self._lock:
+            entry = self.entries.get(relative)
+            if entry is None:
+                if os.path.exists(os.path.join(self.root, relative)):
+                    self.record(relative, "index" if relative.endswith(".faiss") else "contexts")
+                return
+            if now - entry["last_access"] >= TOUCH_INTERVAL_S:
+                entry["last_access"] = now
+                self.refresh()
+                self.save()
+
+    def _loose_files(self) -> List[Tuple[str, int, float]]:
+        """(relative path, size, mtime) of files in the content-addressed stores"""
+        files = []
+        for name in LOOSE_DIRS:
+            for directory, _, names in os.walk(os.path.join(self.root, name)):
+                for file_name in names:
+                    path = os.path.join(directory, file_name)
+                    try:
+                        stat = os.stat(path)
+                    except FileNotFoundError:
+                        # Removed by a concurrent eviction or replaced mid-write
+                        continue
+                    files.append((os.path.relpath(path, self.root), stat.st_size, stat.st_mtime))
+        return files
+
+    def _orphans(self, now: float) -> List[Tuple[str, int, float]]:
+        """Top-level artifacts no manifest entry refers to (e.g. indexes from an older cache layout)
+
+        Only names this cache writes are considered, so a CACHE_DIR shared
+        with other files never loses them.
+        """
+        orphans = []
+        for name in os.listdir(self.root):
+            path = os.path.join(self.root, name)
+            if not name.endswith(ARTIFACT_SUFFIXES) or name in self.entries:
+                continue
+            try:
+                modified = os.path.getmtime(path)
+            except FileNotFoundError:
+                continue
+            if now - modified >= ORPHAN_GRACE_S:
+                orphans.append((name, path_size(path), modified))
+        return orphans
+
+    def _blob_dependents(self, blobs: Set[str]) -> List[str]:
+        """Stage entries (relative paths) whose stored output refers to one of the blob digests"""
+        dependents = []
+        for directory, _, names in os.walk(os.path.join(self.root, "stages")):
+            for file_name in names:
+                path = os.path.join(directory, file_name)
+                try:
+                    with open(path, "r", encoding="utf-8") as f:
+                        digests = set(_BLOB_DIGEST.findall(f.read()))
+                except OSError:
+                    continue
+                if digests & blobs:
+                    dependents.append(os.path.relpath(path, self.root))
+        return dependents
+
+    def stats(self) -> Dict:
+        now = time.time()
+        with self._lock:
+            kinds: Dict[str, Dict] = {}
+            for entry in self.entries.values():
+                kind = kinds.setdefault(entry["kind"], {"count": 0, "bytes": 0, "oldest_access": now})
+                kind["count"] += 1
+                kind["bytes"] += entry["size"]
+                kind["oldest_access"] = min(kind["oldest_access"], entry["last_access"])
+            for relative, size, modified in self._loose_files():
+                kind = kinds.setdefault(relative.split(os.sep)[0], {"count": 0, "bytes": 0, "oldest_access": now})
+                kind["count"] += 1
+                kind["bytes"] += size
+                kind["oldest_access"] = min(kind["oldest_access"], modified)
+            orphans = self._orphans(now)
+            for kind in kinds.values():
+                kind["oldest_age_days"] = round((now - kind.pop("oldest_access")) / 86400, 2)
+            return {
+                "root": self.root,
+                "documents": len(self.documents),
+                "kinds": kinds,
+                "orphans": {"count": len(orphans), "bytes": sum(size for _, size, _ in orphans)},
+                "total_bytes": sum(kind["bytes"] for kind in kinds.values()) + sum(size for _, size, _ in orphans),
+            }
+
+    def evict(self, max_bytes: Optional[float] = None, max_age_s: Optional[float] = None,
+              dry_run: bool = False) -> List[str]:
+        """Remove orphans, artifacts unused for max_age_s, then the least recently used beyond max_bytes
+
+        Stage entries referring to an evicted blob are removed with it, so
+        their node runs again instead of replaying a dangling reference.
+        Checkpoints are stored outside the cache and cannot be checked: a
+        checkpointed thread whose blobs were evicted can no longer be resumed
+        (reading its contexts raises FileNotFoundError). Disable the limits
+        while such threads need to stay resumable.
+
+        Returns the removed paths, relative to the cache directory.
+        """
+        now = time.time()
+        with self._lock:
+            self.refresh()
+            items = [(relative, entry["size"], entry["last_access"]) for relative, entry in self.entries.items()]
+            items += self._loose_files()
+            items.sort(key=lambda item: item[2])
+
+            removed = [relative for relative, _, _ in self._orphans(now)]
+            kept = []
+            for relative, size, last_access in items:
+                if max_age_s and now - last_access > max_age_s:
+                    removed.append(relative)
+                else:
+                    kept.append((relative, size))
+            if max_bytes:
+                total = sum(size for _, size in kept)
+                for relative, size in kept:
+                    if total <= max_bytes:
+                        break
+                    removed.append(relative)
+                    total -= size
+
+            blob_dir = "blobs" + os.sep
+            evicted_blobs = {
+                os.path.basename(relative)[:-len(".txt")]
+                for relative in removed if relative.startswith(blob_dir) and relative.endswith(".txt")
+            }
+            if evicted_blobs:
+                removed_set = set(removed)
+                removed += [relative for relative in self._blob_dependents(evicted_blobs) if relative not in removed_set]
+
+            if dry_run or not removed:
+                return removed
+            for relative in removed:
+                _remove(os.path.join(self.root, relative))
+                self.entries.pop(relative, None)
+            # Forget documents whose index is gone, so their next run re-parses the file
+            indexes = {entry.get("text_hash") for entry in self.entries.values() if entry["kind"] == "index"}
+            self.documents = {
+                key: document for key, document in self.documents.items() if document["text_hash"] in indexes
+            }
+            self.save()
+        logger.info(f"[Cache] Evicted {len(removed)} artifacts from {self.root}")
+        return removed
+
+_manifests: Dict[str, CacheManifest] = {}
+_manifests_lock = threading.Lock()
+
+def get_manifest(root: str = CACHE_DIR) -> CacheManifest:
+    """Shared manifest of a cache directory"""
+    with _manifests_lock:
+        manifest = _manifests.get(root)
+        if manifest is None:
+            os.makedirs(root, exist_ok=True)
+            manifest = _manifests[root] = CacheManifest(root)
+        return manifest
+
+def evict_if_needed(root: str = CACHE_DIR) -> List[str]:
+    """Apply the configured CACHE_MAX_MB / CACHE_MAX_AGE_DAYS limits"""
+    if not CACHE_MAX_MB and not CACHE_MAX_AGE_DAYS:
+        return []
+    try:
+        return get_manifest(root).evict(
+            max_bytes=CACHE_MAX_MB * 1024 * 1024 or None,
+            max_age_s=CACHE_MAX_AGE_DAYS * 86400 or None,
+        )
+    except OSError as e:
+        logger.warning(f"[Cache] Eviction failed in {root}: {str(e)}")
+        return []
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect and trim the document cache")
+    parser.add_argument("--cache-dir", default=CACHE_DIR, help="Cache directory (default: RISK_AGENT_CACHE_DIR)")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("stats", help="Show entries, sizes and ages per kind")
+    evict = commands.add_parser("evict", help="Remove orphaned, old and least recently used artifacts")
+    evict.add_argument("--max-mb", type=float, default=CACHE_MAX_MB, help="Size budget in MiB (0: no limit)")
+    evict.add_argument("--max-age-days", type=float, default=CACHE_MAX_AGE_DAYS, help="Maximum age since last use (0: no limit)")
+    evict.add_argument("--dry-run", action="store_true", help="Only list what would be removed")
+    args = parser.parse_args()
+
+    manifest = get_manifest(args.cache_dir)
+    if args.command == "stats":
+        print(json.dumps(manifest.stats(), indent=2))
+        return
+    removed = manifest.evict(
+        max_bytes=args.max_mb * 1024 * 1024 or None,
+        max_age_s=args.max_age_days * 86400 or None,
+        dry_run=args.dry_run,
+    )
+    for relative in removed:
+        print(relative)
+    print(f"{'Would remove' if args.dry_run else 'Removed'} {len(removed)} artifacts")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+import threading
+import time
+from typing import Dict
+from .configuration import (
+    LLM_AIMD_DECREASE,
+    LLM_AIMD_ENABLED,
+    LLM_AIMD_INCREASE,
+    LLM_AIMD_INITIAL,
+    LLM_AIMD_LATENCY_FACTOR,
+    LLM_AIMD_MAX,
+    LLM_AIMD_MIN,
+    logger,
+)
+from .metrics import set_gauge
+
+# Smoothing of the per-model latency baseline, and successes needed before spikes are judged
+LATENCY_ALPHA = 0.1
+LATENCY_MIN_SAMPLES = 10
+
+class _ModelLimit:
+    __slots__ = ("limit", "in_flight", "latency", "samples", "decreased_at")
+
+    def __init__(self, limit: float):
+        self.limit = limit
+        self.in_flight = 0
+        # Moving average of successful call latencies
+        self.latency = 0.0
+        self.samples = 0
+        self.decreased_at = 0.0
+
+class AIMDLimiter:
+    """Per-model limit on calls in flight, adjusted by additive increase / multiplicative decrease
+
+    Every successful call raises the model's limit by `increase / limit`,
+    i.e. by `increase` once a full window of calls succeeds. A quota error
+    (429), a timeout, or a success slower than `latency_factor` times the
+    model's average latency multiplies it by `decrease`. Only calls started
+    after the last decrease can cause another, so one burst of 429s from a
+    full window halves the limit once. Limits stay within [minimum, maximum]
+    and are published as the llm_concurrency_limit gauge.
+    """
+
+    def __init__(self, initial: float = LLM_AIMD_INITIAL, minimum: float = LLM_AIMD_MIN,
+                 maximum: float = LLM_AIMD_MAX, increase: float = LLM_AIMD_INCREASE,
+                 decrease: float = LLM_AIMD_DECREASE, latency_factor: float = LLM_AIMD_LATENCY_FACTOR,
+                 enabled: bool = LLM_AIMD_ENABLED):
+        self.minimum = max(1.0, minimum)
+        self.maximum = max(self.minimum, maximum)
+        self.initial = min(max(initial, self.minimum), self.maximum)
+        self.increase = increase
+        self.decrease = decrease
+        self.latency_factor = latency_factor
+        self.enabled = enabled
+        self._models: Dict[str, _ModelLimit] = {}
+        self._lock = threading.Lock()
+
+    def _model(self, model: str) -> _ModelLimit:
+        state = self._models.get(model)
+        if state is None:
+            state = self._models[model] = _ModelLimit(self.initial)
+            self._publish(model, state)
+        return state
+
+    def _publish(self, model: str, state: _ModelLimit) -> None:
+        set_gauge("llm_concurrency_limit", model, int(state.limit))
+        set_gauge("llm_in_flight", model, state.in_flight)
+
+    def limit(self, model: str) -> int:
+        with self._lock:
+            return int(self._model(model).limit)
+
+    def has_capacity(self, model: str) -> bool:
+        if not self.enabled:
+            return True
+        with self._lock:
+            state = self._model(model)
+            return state.in_flight < int(state.limit)
+
+    def start(self, model: str) -> None:
+        """Count a call as in flight (the scheduler calls this when it grants a slot)"""
+        with self._lock:
+            state = self._model(model)
+            state.in_flight += 1
+            self._publish(model, state)
+
+    def finish(self, model: str) -> None:
+        with self._lock:
+            state = self._model(model)
+            state.in_flight -= 1
+            self._publish(model, state)
+
+    def on_success(self, model: str, started: float, latency: float) -> None:
+        """Additive increase, or a decrease if the call was a latency spike
+
+        `started` is the monotonic time the attempt began.
+        """
+        with self._lock:
+            state = self._model(model)
+            if state.samples >= LATENCY_MIN_SAMPLES and latency > self.latency_factor * state.latency > 0:
+                spike = True
+            else:
+                spike = False
+                state.latency = latency if not state.samples else (
+                    (1 - LATENCY_ALPHA) * state.latency + LATENCY_ALPHA * latency)
+                state.samples += 1
+                state.limit = min(self.maximum, state.limit + self.increase / state.limit)
+                self._publish(model, state)
+        if spike:
+            self._decrease(model, started, f"{latency:.1f}s latency")
+
+    def on_overload(self, model: str, started: float, reason: str = "429") -> None:
+        """Multiplicative decrease after a quota error or timeout"""
+        self._decrease(model, started, reason)
+
+    def _decrease(self, model: str, started: float, reason: str) -> None:
+        with self._lock:
+            state = self._model(model)
+            if started < state.decreased_at:
+                return
+            previous = state.limit
+            state.limit = max(self.minimum, state.limit * self.decrease)
+            state.decreased_at = time.monotonic()
+            current = state.limit
+            self._publish(model, state)
+        logger.info("[LLM] %s concurrency limit %d -> %d (%s)", model, previous, current, reason)
+
+    def stats(self) -> Dict[str, Dict]:
+        with self._lock:
+            return {
+                model: {"limit": int(state.limit), "in_flight": state.in_flight, "latency_s": round(state.latency, 3)}
+                for model, state in self._models.items()
+            }
@@ -1,30 +1,35 @@
 import os
 import logging
+import threading
+from collections.abc import Mapping
+from functools import lru_cache
 from typing import Dict
-from google.oauth2 import service_account
-from langchain_google_genai import GoogleGenerativeAIEmbeddings, ChatGoogleGenerativeAI
-from google.cloud import aiplatform
 from tenacity import retry, stop_after_attempt, wait_exponential
 from dotenv import load_dotenv
-
-# Logging configuration
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    datefmt='%Y-%m-%d %H:%M:%S'
-)
-
-logger = logging.getLogger(__name__)
+from .logs import configure_payloads, setup_logging
 
 # Load environment variables
 load_dotenv()
 
+# Logging configuration (logs.py): records go through a queue to a listener
+# thread that formats and writes them, and carry the run/node/chunk
+# correlation fields. Large payloads logged with log_payload are truncated to
+# LOG_PAYLOAD_CHARS and sampled to LOG_SAMPLE_RATE records per second per call site
+LOG_LEVEL = os.getenv("RISK_AGENT_LOG_LEVEL", "INFO")
+LOG_QUEUE_ENABLED = os.getenv("RISK_AGENT_LOG_QUEUE", "1") == "1"
+LOG_SAMPLE_RATE = float(os.getenv("RISK_AGENT_LOG_SAMPLE_RATE", "1"))
+LOG_PAYLOAD_CHARS = int(os.getenv("RISK_AGENT_LOG_PAYLOAD_CHARS", "200"))
+setup_logging(LOG_LEVEL, use_queue=LOG_QUEUE_ENABLED)
+configure_payloads(LOG_SAMPLE_RATE, LOG_PAYLOAD_CHARS)
+
+logger = logging.getLogger(__name__)
+
 # Suppress gRPC and TensorFlow warnings
 os.environ['TF_CPP_MIN_LOG_LEVEL'] = '2'
 logging.getLogger('absl').setLevel(logging.ERROR)
 
 # Configuration constants
-CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache")
+CACHE_DIR = os.getenv("RISK_AGENT_CACHE_DIR") or os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache")
 os.makedirs(CACHE_DIR, exist_ok=True)
 
 RISK_ANALYSIS_QUERIES = {
@@ -35,65 +40,280 @@ RISK_ANALYSIS_QUERIES = {
     "selection": ["CRITÉRIOS DE SELEÇÃO DO FORNECEDOR"]
 }
 
-# Google Cloud configuration
-GOOGLE_CREDENTIALS_PATH = os.getenv('GOOGLE_CLOUD_CREDENTIALS_PATH')
-if not GOOGLE_CREDENTIALS_PATH:
-    raise ValueError("GOOGLE_CLOUD_CREDENTIALS_PATH environment variable is not set")
+# LLM call path: per-attempt timeout, overall deadline, backoff and hedging
+LLM_CALL_TIMEOUT = float(os.getenv("LLM_CALL_TIMEOUT", "120"))
+LLM_CALL_DEADLINE = float(os.getenv("LLM_CALL_DEADLINE", "600"))
+LLM_MAX_ATTEMPTS = int(os.getenv("LLM_MAX_ATTEMPTS", "4"))
+LLM_BACKOFF_BASE = float(os.getenv("LLM_BACKOFF_BASE", "2"))
+LLM_BACKOFF_MAX = float(os.getenv("LLM_BACKOFF_MAX", "60"))
+LLM_HEDGE_ENABLED = os.getenv("LLM_HEDGE", "0") == "1"
+LLM_HEDGE_QUANTILE = float(os.getenv("LLM_HEDGE_QUANTILE", "0.95"))
+LLM_HEDGE_MIN_DELAY = float(os.getenv("LLM_HEDGE_MIN_DELAY", "5"))
+LLM_MAX_WORKERS = int(os.getenv("LLM_MAX_WORKERS", "32"))
 
-credentials = service_account.Credentials.from_service_account_file(
-    GOOGLE_CREDENTIALS_PATH
-)
+# Adaptive per-model concurrency (concurrency.py): each model starts with
+# LLM_AIMD_INITIAL calls in flight, gains LLM_AIMD_INCREASE for every window
+# of successful calls and is multiplied by LLM_AIMD_DECREASE on a 429, a
+# timeout, or a call slower than LLM_AIMD_LATENCY_FACTOR times its average
+# (0: ignore latency). Limits stay between LLM_AIMD_MIN and LLM_AIMD_MAX
+LLM_AIMD_ENABLED = os.getenv("LLM_AIMD_ENABLED", "1") == "1"
+LLM_AIMD_INITIAL = float(os.getenv("LLM_AIMD_INITIAL", "8"))
+LLM_AIMD_MIN = float(os.getenv("LLM_AIMD_MIN", "1"))
+LLM_AIMD_MAX = float(os.getenv("LLM_AIMD_MAX", str(LLM_MAX_WORKERS)))
+LLM_AIMD_INCREASE = float(os.getenv("LLM_AIMD_INCREASE", "1"))
+LLM_AIMD_DECREASE = float(os.getenv("LLM_AIMD_DECREASE", "0.5"))
+LLM_AIMD_LATENCY_FACTOR = float(os.getenv("LLM_AIMD_LATENCY_FACTOR", "3"))
 
-# Initialize Google Cloud SDK
-aiplatform.init(
-    project="gen-lang-client-0178129527",
-    location="us-central1",
-    credentials=credentials
-)
+# LLM call scheduler (scheduler.py): at most SCHEDULER_SLOTS agent calls run
+# at once, SCHEDULER_RESERVED_SLOTS of them only for interactive jobs. Jobs
+# without an explicit priority ("interactive" or "batch") use the default, and
+# a job stops getting calls after SCHEDULER_JOB_TOKEN_BUDGET tokens (0: no limit)
+SCHEDULER_SLOTS = int(os.getenv("RISK_AGENT_SCHEDULER_SLOTS", str(LLM_MAX_WORKERS)))
+SCHEDULER_RESERVED_SLOTS = int(os.getenv("RISK_AGENT_SCHEDULER_RESERVED_SLOTS", "4"))
+SCHEDULER_DEFAULT_PRIORITY = os.getenv("RISK_AGENT_DEFAULT_PRIORITY", "interactive")
+SCHEDULER_JOB_TOKEN_BUDGET = int(os.getenv("RISK_AGENT_JOB_TOKEN_BUDGET", "0"))
+
+# Single-flight coalescing (singleflight.py): identical agent and embedding
+# requests issued while one is already in flight wait for its result instead
+# of calling the provider again
+SINGLE_FLIGHT_ENABLED = os.getenv("RISK_AGENT_SINGLE_FLIGHT", "1") == "1"
+
+# Client-side rate limits on agent calls; disable for offline benchmarking
+RATE_LIMITS_ENABLED = os.getenv("RISK_AGENT_RATE_LIMITS", "1") == "1"
+
+# Documents analysed concurrently by the batch entry point
+BATCH_WORKERS = int(os.getenv("RISK_AGENT_BATCH_WORKERS", "4"))
 
-# Initialize embeddings
-embeddings = GoogleGenerativeAIEmbeddings(
-    model="models/embedding-001",
-    credentials=credentials,
-    project="gen-lang-client-0178129527"
+# Pre-ingestion worker (ingest.py): documents dropped in INGEST_INBOX are
+# parsed, embedded, indexed and searched ahead of analysis, INGEST_WORKERS at
+# a time, scanning every INGEST_POLL_INTERVAL seconds. Files modified in the
+# last INGEST_SETTLE_S seconds may still be being copied and are left for later.
+# INGEST_EXTENSIONS lists the file types load_pages can read (PDFs and text exports)
+INGEST_INBOX = os.getenv("RISK_AGENT_INGEST_INBOX", "")
+INGEST_WORKERS = int(os.getenv("RISK_AGENT_INGEST_WORKERS", "2"))
+INGEST_POLL_INTERVAL = float(os.getenv("RISK_AGENT_INGEST_POLL_INTERVAL", "10"))
+INGEST_SETTLE_S = float(os.getenv("RISK_AGENT_INGEST_SETTLE_S", "5"))
+INGEST_EXTENSIONS = tuple(ext.strip().lower() for ext in os.getenv("RISK_AGENT_INGEST_EXTENSIONS", ".pdf,.txt").split(",")
+                          if ext.strip())
+
+# Stage memoization: graph nodes whose inputs, prompt and model settings are
+# unchanged return their stored output from CACHE_DIR/stages
+STAGE_CACHE_ENABLED = os.getenv("RISK_AGENT_STAGE_CACHE", "1") == "1"
+
+# Prompt prefix caching: the static instructions of the Creator and Evaluator
+# prompts are uploaded once per model as provider cached content (kept for
+# PROMPT_CACHE_TTL seconds) and each call only sends the variable suffix.
+# Gemini only caches prompts of at least PROMPT_CACHE_MIN_TOKENS tokens, which
+# the current prefixes (about 600 tokens) are not, so this is off by default
+PROMPT_CACHE_ENABLED = os.getenv("RISK_AGENT_PROMPT_CACHE", "0") == "1"
+PROMPT_CACHE_TTL = int(os.getenv("RISK_AGENT_PROMPT_CACHE_TTL", "3600"))
+PROMPT_CACHE_MIN_TOKENS = int(os.getenv("RISK_AGENT_PROMPT_CACHE_MIN_TOKENS", "4096"))
+
+# Graph state keeps texts of at least BLOB_MIN_SIZE characters (e.g. RAG
+# contexts) in the content-addressed store CACHE_DIR/blobs and only passes
+# references around, so state copies and checkpoints stay small
+BLOB_MIN_SIZE = int(os.getenv("RISK_AGENT_BLOB_MIN_SIZE", "1024"))
+BLOB_CACHE_SIZE = int(os.getenv("RISK_AGENT_BLOB_CACHE_SIZE", "256"))
+
+# Disk budget for CACHE_DIR: after a new index is written, the least recently
+# used artifacts beyond CACHE_MAX_MB are evicted, and with CACHE_MAX_AGE_DAYS
+# set (off by default) those unused for that long too (0 disables either
+# limit). Evicted blobs take the stage entries that refer to them along, but
+# checkpoints referring to them can no longer be resumed, so age eviction is
+# only safe where paused threads are not kept that long.
+# See `python -m src.assistant.cache_manifest`
+CACHE_MAX_MB = float(os.getenv("RISK_AGENT_CACHE_MAX_MB", "4096"))
+CACHE_MAX_AGE_DAYS = float(os.getenv("RISK_AGENT_CACHE_MAX_AGE_DAYS", "0"))
+
+# Report export (export.py): formats written by main and batch (json, jsonl,
+# parquet, xlsx) and the rows materialized per write, so export memory does
+# not grow with the report or the batch portfolio
+EXPORT_FORMATS = [name.strip() for name in os.getenv("RISK_AGENT_EXPORT_FORMATS", "json").split(",") if name.strip()]
+EXPORT_BATCH_SIZE = int(os.getenv("RISK_AGENT_EXPORT_BATCH_SIZE", "1000"))
+
+# In-memory LRUs that keep recently used vector stores and RAG contexts warm
+VECTORSTORE_CACHE_SIZE = int(os.getenv("RISK_AGENT_VECTORSTORE_CACHE_SIZE", "8"))
+CONTEXT_CACHE_SIZE = int(os.getenv("RISK_AGENT_CONTEXT_CACHE_SIZE", "64"))
+
+# Analysis service (service.py): listen address and concurrently running jobs
+SERVICE_HOST = os.getenv("RISK_AGENT_SERVICE_HOST", "127.0.0.1")
+SERVICE_PORT = int(os.getenv("RISK_AGENT_SERVICE_PORT", "8080"))
+SERVICE_WORKERS = int(os.getenv("RISK_AGENT_SERVICE_WORKERS", "16"))
+
+# Opt-in per-node profiling: "1"/"all" profiles every graph node, or a comma-separated
+# list of node names. pstats and tracemalloc snapshots go to PROFILE_DIR
+PROFILE_NODES = os.getenv("RISK_AGENT_PROFILE", "")
+PROFILE_DIR = os.getenv("RISK_AGENT_PROFILE_DIR") or os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "risk_analysis", "profiles"
 )
 
-# Model initialization with retries
+# Google Cloud configuration. Credentials, the SDK and the model clients are
+# initialized on first use, so importing the package stays cheap. In offline
+# mode (RISK_AGENT_OFFLINE=1) no credentials are required and runs are served
+# from CACHE_DIR; touching a provider then raises a clear error.
+GOOGLE_PROJECT = "gen-lang-client-0178129527"
+GOOGLE_LOCATION = "us-central1"
+EMBEDDING_MODEL = "models/embedding-001"
+OFFLINE_MODE = os.getenv("RISK_AGENT_OFFLINE", "0") == "1"
+
+# "google" for the Gemini endpoints, "fake" for the deterministic offline
+# stand-ins in fakes.py (configured through RISK_AGENT_FAKE_* variables)
+LLM_BACKEND = os.getenv("RISK_AGENT_BACKEND", "google")
+
+class ProviderUnavailableError(RuntimeError):
+    """Raised when a provider is needed but cannot be initialized (e.g. offline mode)"""
+
+@lru_cache(maxsize=None)
+def get_credentials():
+    """Load service account credentials and initialize the Google Cloud SDK"""
+    if OFFLINE_MODE:
+        raise ProviderUnavailableError("Provider access is disabled in offline mode (RISK_AGENT_OFFLINE=1)")
+
+    credentials_path = os.getenv('GOOGLE_CLOUD_CREDENTIALS_PATH')
+    if not credentials_path:
+        raise ValueError("GOOGLE_CLOUD_CREDENTIALS_PATH environment variable is not set")
+
+    from google.oauth2 import service_account
+    from google.cloud import aiplatform
+
+    credentials = service_account.Credentials.from_service_account_file(credentials_path)
+
+    # Initialize Google Cloud SDK
+    aiplatform.init(
+        project=GOOGLE_PROJECT,
+        location=GOOGLE_LOCATION,
+        credentials=credentials
+    )
+    return credentials
+
+_embeddings_override = None
+
+def set_embeddings(embeddings) -> None:
+    """Replace the process-wide embeddings client (e.g. with a fake)"""
+    global _embeddings_override
+    _embeddings_override = _coalesce_embeddings(embeddings)
+
+def get_embeddings():
+    """Return the embeddings client, creating it on first use"""
+    if _embeddings_override is not None:
+        return _embeddings_override
+    return _coalesce_embeddings(_create_embeddings())
+
+def _coalesce_embeddings(embeddings):
+    if not SINGLE_FLIGHT_ENABLED or embeddings is None:
+        return embeddings
+    from .singleflight import coalescing_embeddings
+    return coalescing_embeddings(embeddings)
+
+@lru_cache(maxsize=None)
+def _create_embeddings():
+    if LLM_BACKEND == "fake":
+        from .fakes import create_fake_embeddings
+        return create_fake_embeddings()
+
+    from langchain_google_genai import GoogleGenerativeAIEmbeddings
+
+    return GoogleGenerativeAIEmbeddings(
+        model=EMBEDDING_MODEL,
+        credentials=get_credentials(),
+        project=GOOGLE_PROJECT
+    )
+
+# Generation settings of each model client. Stage memoization (stages.py)
+# hashes these, so changing a model or its parameters re-runs its stages.
+MODEL_SETTINGS = {
+    "small_model": {
+        "model": "gemini-2.0-flash",
+        "temperature": 0.3,
+        "max_output_tokens": 8192,
+        "top_p": 0.95,
+        "top_k": 40,
+    },
+    "large_model": {
+        "model": "gemini-2.0-pro-exp-02-05",
+        "temperature": 0.3,
+        "max_output_tokens": 8192,
+        "top_p": 0.95,
+        "top_k": 40,
+    },
+    "thinking_model": {
+        "model": "gemini-2.0-flash-thinking-exp-01-21",
+        "temperature": 0.3,
+        "max_output_tokens": 8192,
+        "top_p": 0.95,
+        "top_k": 40,
+    },
+}
+
+# Model initialization with retries. Client-side retries are left to the
+# deadline-aware call path in llm.py, so each client makes a single attempt.
 @retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=4, max=10))
 def initialize_models() -> Dict:
     """Initialize and return model configurations"""
+    from langchain_google_genai import ChatGoogleGenerativeAI
+
     return {
-        "small_model": ChatGoogleGenerativeAI(
-            model="gemini-2.0-flash",
-            temperature=0.3,
-            max_output_tokens=8192,
-            top_p=0.95,
-            top_k=40
-            ),
-        "large_model": ChatGoogleGenerativeAI(
-            model="gemini-2.0-pro-exp-02-05",
-            temperature=0.3,
-            max_output_tokens=8192,
-            top_p=0.95,
-            top_k=40
-        ),
-        "thinking_model": ChatGoogleGenerativeAI(
-            model="gemini-2.0-flash-thinking-exp-01-21",
-            temperature=0.3,
-            max_output_tokens=8192,
-            top_p=0.95,
-            top_k=40
-        )
+        name: ChatGoogleGenerativeAI(**settings, timeout=LLM_CALL_TIMEOUT, max_retries=1)
+        for name, settings in MODEL_SETTINGS.items()
     }
 
-# Initialize models
-models = initialize_models()
+class LazyModels(Mapping):
+    """Read-only mapping of model clients, initialized on first access"""
+
+    def __init__(self, factory):
+        self._factory = factory
+        self._models = None
+        self._lock = threading.Lock()
+
+    def _load(self) -> Dict:
+        if self._models is None:
+            with self._lock:
+                if self._models is None:
+                    self._models = self._factory()
+        return self._models
+
+    def set(self, models: Dict) -> None:
+        """Replace the model clients (e.g. with fakes), skipping the factory"""
+        with self._lock:
+            self._models = dict(models)
+
+    def __getitem__(self, key):
+        return self._load()[key]
+
+    def __iter__(self):
+        return iter(self._load())
+
+    def __len__(self) -> int:
+        return len(self._load())
+
+def create_models() -> Dict:
+    """Initialize provider credentials, then the model clients"""
+    if LLM_BACKEND == "fake":
+        from .fakes import create_fake_models
+        return create_fake_models()
+
+    get_credentials()
+    return initialize_models()
+
+# Models are created when first looked up, e.g. models["small_model"]
+models = LazyModels(create_models)
 
 # Export commonly used items
 __all__ = [
     'logger',
-    'embeddings',
+    'get_embeddings',
+    'set_embeddings',
     'models',
+    'LLM_BACKEND',
+    'OFFLINE_MODE',
     'CACHE_DIR',
-    'RISK_ANALYSIS_QUERIES'
+    'RISK_ANALYSIS_QUERIES',
+    'LLM_CALL_TIMEOUT',
+    'LLM_CALL_DEADLINE',
+    'LLM_MAX_ATTEMPTS',
+    'LLM_HEDGE_ENABLED',
+    'PROFILE_NODES',
+    'PROFILE_DIR',
+    'MODEL_SETTINGS',
+    'STAGE_CACHE_ENABLED'
 ]
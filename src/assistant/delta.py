@@ -0,0 +1,111 @@
+import hashlib
+import json
+import os
+import re
+from typing import Dict, List, Optional, Sequence, Tuple
+from .records import RiskTable
+
+SNAPSHOT_VERSION = 1
+_WHITESPACE = re.compile(r"\s+")
+_SOURCE_TRAILER = re.compile(r"\[Fonte: [^\]]*\]")
+_RISK_NUMBER = re.compile(r"(\d+)$")
+
+def context_hash(context) -> str:
+    """Hash of a retrieved context, insensitive to whitespace and layout changes
+
+    The `[Fonte: file, Página: n]` trailer is ignored, so a revision saved
+    under a new name or with shifted pages still matches unchanged text.
+    """
+    text = context.content if hasattr(context, "content") else str(context)
+    text = _SOURCE_TRAILER.sub("", text)
+    return hashlib.sha256(_WHITESPACE.sub(" ", text).strip().encode("utf-8")).hexdigest()[:16]
+
+def snapshot_path(report_file: str) -> str:
+    """Snapshot stored next to a JSON report: report.json -> report.snapshot.json"""
+    return os.path.splitext(report_file)[0] + ".snapshot.json"
+
+class RunSnapshot:
+    """What a later delta run needs from a finished run
+
+    `contexts` maps each retrieved context's hash to the Ids of the risks
+    generated from it; `risks` is the final (evaluated and optimized) report.
+    """
+
+    def __init__(self, contexts: Dict[str, List[str]], risks: RiskTable, input_file: str = ""):
+        self.contexts = contexts
+        self.risks = risks
+        self.input_file = input_file
+
+    @classmethod
+    def from_state(cls, state: Dict) -> "RunSnapshot":
+        return cls(dict(state.get("context_risks") or {}), state["risk_list"], state.get("input_file", ""))
+
+    @classmethod
+    def load(cls, path: str) -> "RunSnapshot":
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        if data.get("version") != SNAPSHOT_VERSION:
+            raise ValueError(f"Unsupported snapshot version in {path}: {data.get('version')}")
+        return cls(data["contexts"], RiskTable.from_records(data["risks"]), data.get("input_file", ""))
+
+    def save(self, path: str) -> None:
+        data = {
+            "version": SNAPSHOT_VERSION,
+            "input_file": self.input_file,
+            "contexts": self.contexts,
+            "risks": self.risks.to_records(),
+        }
+        tmp_file = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_file, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_file, path)
+
+    def next_risk_number(self) -> int:
+        """First risk number not used by this run, so new risks never reuse an Id"""
+        numbers = [int(match.group(1)) for risk_id in self.risks.column("Id")
+                   if risk_id and (match := _RISK_NUMBER.search(str(risk_id)))]
+        used = [int(match.group(1)) for ids in self.contexts.values() for risk_id in ids
+                if (match := _RISK_NUMBER.search(str(risk_id)))]
+        return max(numbers + used, default=0) + 1
+
+class ContextDiff:
+    """Contexts of a new document version compared against a previous run"""
+
+    def __init__(self, contexts: Sequence, snapshot: RunSnapshot):
+        self.hashes = [context_hash(context) for context in contexts]
+        self.changed = [context for context, h in zip(contexts, self.hashes) if h not in snapshot.contexts]
+        self.changed_hashes = [h for h in self.hashes if h not in snapshot.contexts]
+
+        # Carry over the final risks of every unchanged context, keeping their Ids
+        final_ids = set(snapshot.risks.column("Id"))
+        self.carried_contexts = {
+            h: [risk_id for risk_id in snapshot.contexts[h] if risk_id in final_ids]
+            for h in dict.fromkeys(self.hashes) if h in snapshot.contexts
+        }
+        carried_ids = {risk_id for ids in self.carried_contexts.values() for risk_id in ids}
+        self.carried = snapshot.risks.take([
+            i for i, risk_id in enumerate(snapshot.risks.column("Id")) if risk_id in carried_ids
+        ])
+
+    @property
+    def carried_ids(self) -> List[str]:
+        return self.carried.column("Id")
+
+    def summary(self) -> str:
+        return (f"{len(self.changed)} of {len(self.hashes)} contexts changed, "
+                f"{len(self.carried)} risks carried over")
+
+def split_carried(table: RiskTable, carried_ids: Sequence[str]) -> Tuple[RiskTable, RiskTable]:
+    """Split a risk table into (carried over, new) rows"""
+    carried_ids = set(carried_ids)
+    ids = table.column("Id")
+    carried = [i for i, risk_id in enumerate(ids) if risk_id in carried_ids]
+    new = [i for i, risk_id in enumerate(ids) if risk_id not in carried_ids]
+    return table.take(carried), table.take(new)
+
+def merge_carried(carried: RiskTable, new: RiskTable) -> RiskTable:
+    """Carried-over risks first, then the new ones"""
+    return RiskTable.concat([carried, new])
+
+def load_baseline(path: Optional[str]) -> Optional[RunSnapshot]:
+    return RunSnapshot.load(path) if path else None
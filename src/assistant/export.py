@@ -0,0 +1,204 @@
+import json
+import os
+import threading
+from typing import Dict, List, Optional, Sequence
+from .configuration import EXPORT_BATCH_SIZE, EXPORT_FORMATS, logger
+from .records import IMPACT_FIELDS, RISK_FIELDS, RiskTable
+from .wire import plain_scalar
+
+# Column types of the tabular formats; fields not listed are written as text
+INTEGER_FIELDS = ["Probabilidade"] + IMPACT_FIELDS
+FLOAT_FIELDS = ["Impacto Geral", "Pontuação Geral"]
+
+class _StreamWriter:
+    """Base of the format writers: rows go to a temporary file, renamed into place on close"""
+
+    extension = ""
+
+    def __init__(self, path: str, fields: Sequence[str]):
+        self.path = path
+        self.fields = list(fields)
+        self.tmp_file = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+    def write(self, table: RiskTable) -> None:
+        raise NotImplementedError
+
+    def _finish(self) -> None:
+        raise NotImplementedError
+
+    def close(self) -> None:
+        self._finish()
+        os.replace(self.tmp_file, self.path)
+
+    def abort(self) -> None:
+        try:
+            self._finish()
+        except Exception:
+            pass
+        if os.path.exists(self.tmp_file):
+            os.remove(self.tmp_file)
+
+class JsonWriter(_StreamWriter):
+    """JSON array written one record at a time, formatted as json.dump(records, indent=2)"""
+
+    extension = ".json"
+
+    def __init__(self, path: str, fields: Sequence[str]):
+        super().__init__(path, fields)
+        self._file = open(self.tmp_file, "w", encoding="utf-8")
+        self._count = 0
+
+    def write(self, table: RiskTable) -> None:
+        for record in table.to_records():
+            text = json.dumps(record, ensure_ascii=False, indent=2).replace("\n", "\n  ")
+            self._file.write(("[\n  " if not self._count else ",\n  ") + text)
+            self._count += 1
+
+    def _finish(self) -> None:
+        if not self._file.closed:
+            self._file.write("\n]" if self._count else "[]")
+            self._file.close()
+
+class JsonlWriter(_StreamWriter):
+    """One JSON record per line, flushed after every write"""
+
+    extension = ".jsonl"
+
+    def __init__(self, path: str, fields: Sequence[str]):
+        super().__init__(path, fields)
+        self._file = open(self.tmp_file, "w", encoding="utf-8")
+
+    def write(self, table: RiskTable) -> None:
+        self._file.writelines(json.dumps(record, ensure_ascii=False) + "\n" for record in table.to_records())
+        self._file.flush()
+
+    def _finish(self) -> None:
+        if not self._file.closed:
+            self._file.close()
+
+class ParquetWriter(_StreamWriter):
+    """Parquet file with one row group per write (requires pyarrow)"""
+
+    extension = ".parquet"
+
+    def __init__(self, path: str, fields: Sequence[str]):
+        super().__init__(path, fields)
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        self._pa = pa
+        self.schema = pa.schema([
+            (name, pa.int64() if name in INTEGER_FIELDS else pa.float64() if name in FLOAT_FIELDS else pa.string())
+            for name in self.fields
+        ])
+        self._writer = pq.ParquetWriter(self.tmp_file, self.schema)
+
+    def _column(self, table: RiskTable, name: str, type_):
+        values = [plain_scalar(value) for value in table.column(name)]
+        if type_ == self._pa.string():
+            values = [None if value is None else str(value) for value in values]
+        return self._pa.array(values, type=type_)
+
+    def write(self, table: RiskTable) -> None:
+        if len(table):
+            columns = [self._column(table, field.name, field.type) for field in self.schema]
+            self._writer.write_table(self._pa.Table.from_arrays(columns, schema=self.schema))
+
+    def _finish(self) -> None:
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+class XlsxWriter(_StreamWriter):
+    """Excel sheet in openpyxl write-only mode, so rows are not kept in memory"""
+
+    extension = ".xlsx"
+
+    def __init__(self, path: str, fields: Sequence[str]):
+        super().__init__(path, fields)
+        from openpyxl import Workbook
+
+        self._workbook = Workbook(write_only=True)
+        self._sheet = self._workbook.create_sheet("Riscos")
+        self._sheet.append(self.fields)
+
+    def write(self, table: RiskTable) -> None:
+        columns = [table.column(name) for name in self.fields]
+        for row in zip(*columns):
+            self._sheet.append([plain_scalar(value) for value in row])
+
+    def _finish(self) -> None:
+        if self._workbook is not None:
+            self._workbook.save(self.tmp_file)
+            self._workbook = None
+
+WRITERS = {writer.extension[1:]: writer for writer in (JsonWriter, JsonlWriter, ParquetWriter, XlsxWriter)}
+
+class ReportExporter:
+    """Writes risk tables to a report in several formats as they are finalized
+
+    Each format goes to `base_path` plus its extension. JSON and JSONL keep
+    every field of a record; Parquet and XLSX have one column per `fields`
+    entry, in that order. Tables are written in
+    slices of EXPORT_BATCH_SIZE rows and nothing is kept after a write, so
+    memory does not grow with the report. Files appear on `close()`; on an
+    exception inside the `with` block the partial files are removed.
+    """
+
+    def __init__(self, base_path: str, formats: Sequence[str] = EXPORT_FORMATS,
+                 fields: Sequence[str] = RISK_FIELDS):
+        unknown = sorted(set(formats) - set(WRITERS))
+        if unknown:
+            raise ValueError(f"Unknown export formats: {unknown} (supported: {sorted(WRITERS)})")
+        self.writers: List[_StreamWriter] = []
+        self.rows = 0
+        self._lock = threading.Lock()
+        try:
+            for name in dict.fromkeys(formats):
+                self.writers.append(WRITERS[name](base_path + WRITERS[name].extension, fields))
+        except Exception:
+            self.abort()
+            raise
+
+    @property
+    def paths(self) -> Dict[str, str]:
+        return {writer.extension[1:]: writer.path for writer in self.writers}
+
+    def write(self, table: RiskTable) -> None:
+        with self._lock:
+            for start in range(0, len(table), EXPORT_BATCH_SIZE):
+                batch = table.slice(start, start + EXPORT_BATCH_SIZE)
+                for writer in self.writers:
+                    writer.write(batch)
+            self.rows += len(table)
+
+    def close(self) -> None:
+        with self._lock:
+            for writer in self.writers:
+                writer.close()
+
+    def abort(self) -> None:
+        with self._lock:
+            for writer in self.writers:
+                writer.abort()
+
+    def __enter__(self) -> "ReportExporter":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+def export_report(table: RiskTable, base_path: str, formats: Sequence[str] = EXPORT_FORMATS,
+                  fields: Optional[Sequence[str]] = None) -> Dict[str, str]:
+    """Write one risk table in the given formats and return the file per format"""
+    try:
+        with ReportExporter(base_path, formats, fields or RISK_FIELDS) as exporter:
+            exporter.write(table)
+        return exporter.paths
+    except Exception as e:
+        logger.error(f"Error exporting report {base_path}: {str(e)}")
+        raise
@@ -0,0 +1,334 @@
+import hashlib
+import json
+import math
+import os
+import random
+import re
+import threading
+import time
+import asyncio
+from typing import Any, Dict, List, Optional
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from pydantic import Field, PrivateAttr
+from .wire import CATEGORY_CODES, EVALUATOR_INPUT_ROW, OPTIMIZER_INPUT_ROW, SCORE_ROW, decode_rows
+
+CATEGORIES = [
+    "Planejamento da Contratação",
+    "Seleção do Fornecedor",
+    "Gestão Contratual",
+    "Solução Tecnológica",
+]
+
+IMPACTS = ["Impacto Financeiro", "Impacto no Cronograma", "Impacto Reputacional"]
+
+def _digest(*parts: Any) -> int:
+    data = "\x1f".join(str(part) for part in parts).encode("utf-8")
+    return int.from_bytes(hashlib.sha256(data).digest()[:8], "big")
+
+def _between(text: str, open_tag: str, close_tag: str) -> Optional[str]:
+    """Return the text inside the last open_tag ... close_tag block"""
+    start = text.rfind(open_tag)
+    if start < 0:
+        return None
+    end = text.find(close_tag, start)
+    return text[start + len(open_tag):end if end >= 0 else None].strip()
+
+# Prompt prefixes registered by FakeChatModel.create_cached_content, by name
+_cached_contents: Dict[str, str] = {}
+
+def _approx_tokens(text: str) -> int:
+    return max(1, len(text) // 4)
+
+class LatencyModel:
+    """Log-normal latency with an optional slow tail
+
+    Args:
+        median: Median latency in seconds (0 disables sleeping)
+        sigma: Log-normal shape; larger values mean a heavier spread
+        tail_probability: Chance that a call lands in the slow tail
+        tail_multiplier: Latency multiplier applied to tail calls
+    """
+
+    def __init__(self, median: float = 0.0, sigma: float = 0.5,
+                 tail_probability: float = 0.0, tail_multiplier: float = 10.0):
+        self.median = median
+        self.sigma = sigma
+        self.tail_probability = tail_probability
+        self.tail_multiplier = tail_multiplier
+
+    def sample(self, rng: random.Random) -> float:
+        if self.median <= 0:
+            return 0.0
+        latency = self.median * math.exp(rng.gauss(0.0, self.sigma))
+        if self.tail_probability and rng.random() < self.tail_probability:
+            latency *= self.tail_multiplier
+        return latency
+
+    def __repr__(self) -> str:
+        return (f"LatencyModel(median={self.median}, sigma={self.sigma}, "
+                f"tail_probability={self.tail_probability}, tail_multiplier={self.tail_multiplier})")
+
+class FakeRateLimitError(Exception):
+    """Simulated provider quota error (HTTP 429)"""
+
+    def __init__(self, message: str = "429 Resource has been exhausted (fake)", retry_after: float = 1.0):
+        super().__init__(message)
+        self.code = 429
+        self.retry_after = retry_after
+
+class FakeChatModel(BaseChatModel):
+    """Deterministic offline stand-in for the Gemini chat models
+
+    The response depends only on the prompt, so identical prompts produce
+    identical, schema-valid risk JSON for the Creator, Evaluator and
+    Optimizer prompts. Latency, 429 errors and truncated outputs are drawn
+    from a per-call random stream seeded by `seed`. With a `capacity`, calls
+    beyond that many in flight are rejected with a 429 right away, like a
+    provider quota; it can be changed while calls run.
+    """
+
+    model: str = "fake-gemini"
+    latency: LatencyModel = Field(default_factory=LatencyModel)
+    error_rate: float = 0.0
+    truncation_rate: float = 0.0
+    retry_after: float = 1.0
+    seed: int = 0
+    capacity: int = 0
+
+    _calls: int = PrivateAttr(default=0)
+    _in_flight: int = PrivateAttr(default=0)
+    _lock: Any = PrivateAttr(default_factory=threading.Lock)
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-chat-model"
+
+    @property
+    def _identifying_params(self) -> Dict[str, Any]:
+        return {"model": self.model, "seed": self.seed}
+
+    def _admit(self) -> None:
+        with self._lock:
+            if self.capacity and self._in_flight >= self.capacity:
+                raise FakeRateLimitError(f"429 Quota of {self.capacity} concurrent requests exceeded (fake)",
+                                         retry_after=self.retry_after)
+            self._in_flight += 1
+
+    def _leave(self) -> None:
+        with self._lock:
+            self._in_flight -= 1
+
+    def _next_rng(self) -> random.Random:
+        with self._lock:
+            self._calls += 1
+            call = self._calls
+        return random.Random(_digest(self.seed, self.model, call))
+
+    def create_cached_content(self, text: str, ttl: Optional[int] = None) -> str:
+        """Local stand-in for provider cached content: later calls may pass the name as `cached_content`"""
+        name = f"cachedContents/fake-{_digest(self.model, text):016x}"
+        _cached_contents[name] = text
+        return name
+
+    def respond(self, prompt: str) -> str:
+        """Build the deterministic response text for a rendered prompt"""
+        if "<Sessão do Termo de Referência>" in prompt:
+            return self._identify(_between(prompt, "<Sessão do Termo de Referência>", "</Sessão do Termo de Referência>") or "")
+        risks = self._parse_risks(_between(prompt, "<LISTA DE RISCOS>", "</LISTA DE RISCOS>") or "[]")
+        if "ESCALAS DE AVALIAÇÃO" in prompt:
+            return self._evaluate(risks)
+        return self._optimize(risks)
+
+    @staticmethod
+    def _parse_risks(text: str) -> List[Dict]:
+        """Risks from a <LISTA DE RISCOS> block of compact rows (or verbose objects)"""
+        try:
+            risks = json.loads(text)
+        except json.JSONDecodeError:
+            return []
+        if not isinstance(risks, list):
+            return []
+        layouts = {len(EVALUATOR_INPUT_ROW): EVALUATOR_INPUT_ROW, len(OPTIMIZER_INPUT_ROW): OPTIMIZER_INPUT_ROW}
+        return [
+            record for row in risks
+            for record in decode_rows([row], layouts.get(len(row), []) if isinstance(row, list) else [])
+            if isinstance(record, dict)
+        ]
+
+    def _identify(self, context: str) -> str:
+        words = re.findall(r"\w{6,}", context) or ["requisitos"]
+        seed = _digest(self.seed, context)
+        rows = []
+        for i in range(2 + seed % 4):
+            h = _digest(seed, i)
+            keyword = words[h % len(words)].lower()
+            rows.append([
+                CATEGORY_CODES[CATEGORIES[(h >> 8) % len(CATEGORIES)]],
+                f"Falha relacionada a {keyword} (caso {h % 10000:04d}), comprometendo a execução do contrato.",
+            ])
+        return "```json\n" + self._rows(rows) + "\n```"
+
+    @staticmethod
+    def _rows(rows: List[List]) -> str:
+        return "[\n" + ",\n".join(json.dumps(row, ensure_ascii=False, separators=(",", ":")) for row in rows) + "\n]"
+
+    def _scores(self, risk: Dict) -> Dict:
+        h = _digest(self.seed, risk.get("Id"), risk.get("Risco"))
+        scores = {"Probabilidade": 1 + h % 5}
+        for i, name in enumerate(IMPACTS):
+            scores[name] = (h >> (8 * (i + 1))) % 6
+        return scores
+
+    def _evaluate(self, risks: List[Dict]) -> str:
+        rows = []
+        for risk in risks:
+            scores = self._scores(risk)
+            rows.append([risk.get("Id")] + [scores[name] for name in SCORE_ROW[1:]])
+        return self._rows(rows)
+
+    def _optimize(self, risks: List[Dict]) -> str:
+        # Keep the evaluated scores, filling missing ones; totals and levels are scored locally
+        rows = []
+        for risk in risks:
+            scores = self._scores(risk)
+            rows.append([risk.get("Id")] + [
+                risk.get(name) if risk.get(name) is not None else scores[name] for name in SCORE_ROW[1:]
+            ])
+        return self._rows(rows)
+
+    def _prepare(self, messages: List[BaseMessage], cached_content: Optional[str] = None):
+        """Render the prompt and draw this call's fate: (prompt, text, delay, error, cached tokens)"""
+        prompt = "\n".join(str(message.content) for message in messages)
+        cached_tokens = 0
+        if cached_content:
+            if cached_content not in _cached_contents:
+                raise ValueError(f"404 Cached content {cached_content} not found (fake)")
+            prefix = _cached_contents[cached_content]
+            prompt = f"{prefix}\n{prompt}"
+            cached_tokens = _approx_tokens(prefix)
+        rng = self._next_rng()
+        delay = self.latency.sample(rng)
+        if self.error_rate and rng.random() < self.error_rate:
+            return prompt, None, delay, FakeRateLimitError(retry_after=self.retry_after), cached_tokens
+        text = self.respond(prompt)
+        if self.truncation_rate and rng.random() < self.truncation_rate:
+            text = text[:rng.randint(1, max(1, len(text) - 1))]
+        return prompt, text, delay, None, cached_tokens
+
+    @staticmethod
+    def _result(prompt: str, text: str, cached_tokens: int = 0) -> ChatResult:
+        # Like Gemini, input tokens include the cached ones, reported as cache reads
+        usage = {
+            "input_tokens": _approx_tokens(prompt),
+            "output_tokens": _approx_tokens(text),
+        }
+        usage["total_tokens"] = usage["input_tokens"] + usage["output_tokens"]
+        if cached_tokens:
+            usage["input_token_details"] = {"cache_read": cached_tokens}
+        message = AIMessage(content=text, usage_metadata=usage)
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                  run_manager=None, cached_content: Optional[str] = None, **kwargs: Any) -> ChatResult:
+        prompt, text, delay, error, cached_tokens = self._prepare(messages, cached_content)
+        self._admit()
+        try:
+            if delay:
+                time.sleep(delay)
+        finally:
+            self._leave()
+        if error:
+            raise error
+        return self._result(prompt, text, cached_tokens)
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                         run_manager=None, cached_content: Optional[str] = None, **kwargs: Any) -> ChatResult:
+        prompt, text, delay, error, cached_tokens = self._prepare(messages, cached_content)
+        self._admit()
+        try:
+            if delay:
+                await asyncio.sleep(delay)
+        finally:
+            self._leave()
+        if error:
+            raise error
+        return self._result(prompt, text, cached_tokens)
+
+class FakeEmbeddings(Embeddings):
+    """Deterministic hash-based embeddings
+
+    Words are feature-hashed into a fixed number of signed buckets and the
+    vector is L2-normalized, so texts sharing vocabulary end up close
+    together and similarity search behaves plausibly.
+    """
+
+    def __init__(self, size: int = 768, latency: Optional[LatencyModel] = None, seed: int = 0):
+        self.size = size
+        self.latency = latency or LatencyModel()
+        self.seed = seed
+        self._rng = random.Random(seed)
+
+    def _embed(self, text: str) -> List[float]:
+        vector = [0.0] * self.size
+        for word in re.findall(r"\w+", text.lower()):
+            h = _digest(self.seed, word)
+            vector[h % self.size] += 1.0 if (h >> 32) & 1 else -1.0
+        norm = math.sqrt(sum(v * v for v in vector)) or 1.0
+        return [v / norm for v in vector]
+
+    def _sleep(self) -> None:
+        delay = self.latency.sample(self._rng)
+        if delay:
+            time.sleep(delay)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        self._sleep()
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        self._sleep()
+        return self._embed(text)
+
+def _env_latency(prefix: str) -> LatencyModel:
+    return LatencyModel(
+        median=float(os.getenv(f"{prefix}_LATENCY", "0")),
+        sigma=float(os.getenv(f"{prefix}_LATENCY_SIGMA", "0.5")),
+        tail_probability=float(os.getenv(f"{prefix}_TAIL_PROBABILITY", "0")),
+        tail_multiplier=float(os.getenv(f"{prefix}_TAIL_MULTIPLIER", "10")),
+    )
+
+def create_fake_models(latency: Optional[LatencyModel] = None, error_rate: Optional[float] = None,
+                       truncation_rate: Optional[float] = None, seed: Optional[int] = None,
+                       capacity: Optional[int] = None) -> Dict:
+    """Fake stand-ins for `configuration.models`, configured from RISK_AGENT_FAKE_* by default"""
+    options = {
+        "latency": latency or _env_latency("RISK_AGENT_FAKE"),
+        "error_rate": float(os.getenv("RISK_AGENT_FAKE_ERROR_RATE", "0")) if error_rate is None else error_rate,
+        "truncation_rate": float(os.getenv("RISK_AGENT_FAKE_TRUNCATION_RATE", "0")) if truncation_rate is None else truncation_rate,
+        "seed": int(os.getenv("RISK_AGENT_FAKE_SEED", "0")) if seed is None else seed,
+        "capacity": int(os.getenv("RISK_AGENT_FAKE_CAPACITY", "0")) if capacity is None else capacity,
+    }
+    return {
+        "small_model": FakeChatModel(model="fake-gemini-2.0-flash", **options),
+        "large_model": FakeChatModel(model="fake-gemini-2.0-pro", **options),
+        "thinking_model": FakeChatModel(model="fake-gemini-2.0-flash-thinking", **options),
+    }
+
+def create_fake_embeddings(latency: Optional[LatencyModel] = None, seed: Optional[int] = None) -> FakeEmbeddings:
+    """Fake stand-in for `configuration.get_embeddings()`"""
+    return FakeEmbeddings(
+        latency=latency or _env_latency("RISK_AGENT_FAKE_EMBEDDING"),
+        seed=int(os.getenv("RISK_AGENT_FAKE_SEED", "0")) if seed is None else seed,
+    )
+
+def use_fake_backend(**options) -> None:
+    """Swap the process-wide models and embeddings for the fake backend"""
+    from . import configuration
+
+    configuration.models.set(create_fake_models(**options))
+    configuration.set_embeddings(create_fake_embeddings(
+        seed=options.get("seed"),
+    ))
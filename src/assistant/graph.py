@@ -1,88 +1,204 @@
+import asyncio
 import logging
-from typing import Dict
+from typing import Dict, Optional, Tuple
+from langchain_core.runnables import RunnableLambda
 from langgraph.graph import StateGraph, END
 from .state import State
+from .records import RiskTable
 from .agents.creator import CreatorAgent
 from .agents.evaluator import EvaluatorAgent 
 from .agents.optimizator import OptimizationAgent
-from .utils import load_and_process_pdf, perform_rag_search
-from .configuration import RISK_ANALYSIS_QUERIES, logger, models
-import json
+from .blobs import to_blobs
+from .delta import ContextDiff, load_baseline, merge_carried, split_carried
+from .utils import (
+    CONTEXT_FORMAT_VERSION,
+    SPLITTER_CHUNK_OVERLAP,
+    SPLITTER_CHUNK_SIZE,
+    get_document_hash,
+    load_contexts,
+    resolve_file_path,
+)
+from .configuration import (
+    EMBEDDING_MODEL,
+    LLM_BACKEND,
+    MODEL_SETTINGS,
+    RISK_ANALYSIS_QUERIES,
+    STAGE_CACHE_ENABLED,
+    logger,
+    models,
+)
+from .metrics import instrument_node
+from .profiling import new_profile_dir, profile_node, profiled_nodes
+from .prompts import CREATOR_PROMPT, EVALUATOR_PROMPT, OPTIMIZER_PROMPT
+from .scoring import load_scoring_config
+from .stages import memoize_node
+
+def _check_created(update: Dict) -> Dict:
+    if not update or not update.get("risk_list"):
+        raise ValueError("Failed to generate report content")
+    return update
+
+def _create_failed(e: Exception) -> Dict:
+    error_msg = f"Error in create_report: {str(e)}"
+    logger.error(error_msg)
+    return {
+        "risk_list": RiskTable(),
+        "risk_analysis": RiskTable(),
+        "iteration": 0,
+        "token_usage": {"generation": 0},
+        "validation_errors": [error_msg],
+    }
+
+def _plan_delta(state: State) -> Tuple[Dict, Optional[ContextDiff]]:
+    """In delta mode, restrict the creator to contexts that changed since the baseline run"""
+    snapshot = load_baseline(state.get("baseline_file"))
+    if snapshot is None:
+        return state, None
+    diff = ContextDiff(state.get("context") or [], snapshot)
+    logger.info(f"[Delta] {diff.summary()}")
+    return {**state, "context": diff.changed, "next_risk_id": snapshot.next_risk_number()}, diff
+
+def _apply_delta(update: Dict, diff: Optional[ContextDiff]) -> Dict:
+    """Merge the carried-over risks of unchanged contexts into the creator's update"""
+    if diff is None:
+        return update
+    update = dict(update)
+    update["risk_list"] = merge_carried(diff.carried, update.get("risk_list", RiskTable()))
+    update["context_risks"] = {**diff.carried_contexts, **update.get("context_risks", {})}
+    update["carried_ids"] = diff.carried_ids
+    return update
+
+def _nothing_changed() -> Dict:
+    logger.info("[Delta] No context changed, reusing every risk of the baseline run")
+    return {"risk_list": RiskTable(), "iteration": 1, "token_usage": {"generation": 0}}
 
 def create_report(state: State) -> Dict:
     """Node function for creating initial risk report"""
     try:
+        creator_state, diff = _plan_delta(state)
+        if diff is not None and not diff.changed:
+            return _check_created(_apply_delta(_nothing_changed(), diff))
         creator = CreatorAgent(models["small_model"])
-        update = creator.generate(state)
-        
-        if not update or not update.get("risk_list"):
-            raise ValueError("Failed to generate report content")
-                
-        additional_update = {
-            "token_usage": {"generation": len(update["risk_list"])},
-        }
-        update.update(additional_update)
-        return update
-        
+        return _check_created(_apply_delta(creator.generate(creator_state), diff))
+    except Exception as e:
+        return _create_failed(e)
+
+async def acreate_report(state: State) -> Dict:
+    """Async node function for creating initial risk report"""
+    try:
+        creator_state, diff = _plan_delta(state)
+        if diff is not None and not diff.changed:
+            return _check_created(_apply_delta(_nothing_changed(), diff))
+        creator = CreatorAgent(models["small_model"])
+        return _check_created(_apply_delta(await creator.agenerate(creator_state), diff))
     except Exception as e:
-        error_msg = f"Error in create_report: {str(e)}"
-        logger.error(error_msg)
-        return {
-            "risk_list": "",
-            "risk_analysis": [],
-            "iteration": 0,
-            "token_usage": {"generation": 0},
-        }
+        return _create_failed(e)
+
+def _only_new(state: State, field: str) -> Tuple[Optional[RiskTable], Dict]:
+    """In delta mode, split off carried-over risks so agents only see new ones"""
+    if not state.get("carried_ids"):
+        return None, state
+    carried, new = split_carried(state[field], state["carried_ids"])
+    return carried, {**state, field: new}
+
+def _with_carried(update: Dict, carried: Optional[RiskTable], field: str) -> Dict:
+    if carried is None or field not in update:
+        return update
+    return {**update, field: merge_carried(carried, update[field])}
+
+def _skipped(state: State, field: str, stage: str) -> Dict:
+    """Update for a stage with no new risks to process in delta mode"""
+    return {field: RiskTable(), "iteration": state["iteration"] + 1, "token_usage": {stage: 0}}
+
+def _check_evaluate_input(state: State) -> None:
+    if not state.get("risk_list"):
+        raise ValueError("No report content to evaluate")
+
+def _check_evaluated(update: Dict) -> Dict:
+    if not update:
+        raise ValueError("Failed to generate evaluation result")
+    return update
+
+def _node_failed(node: str, state: State, e: Exception) -> Dict:
+    """Fallback update that keeps the current report when a node fails"""
+    error_msg = f"Error in {node}: {str(e)}"
+    logger.error(error_msg)
+    return {
+        "risk_list": state.get("risk_list", RiskTable()),
+        "risk_analysis": state.get("risk_analysis", RiskTable()),
+        "iteration": state.get("iteration", 0),
+        "validation_errors": [error_msg],
+    }
 
 def evaluate_report(state: State) -> Dict:
     """Node function for evaluating risks"""
     try:
-        if not state.get("risk_list"):
-            raise ValueError("No report content to evaluate")
-            
-        evaluator = EvaluatorAgent(models["large_model"])
-        update = evaluator.evaluate(state)
-        
-        if not update:
-            raise ValueError("Failed to generate evaluation result")
-        
-        return update
-        
+        _check_evaluate_input(state)
+        carried, new_state = _only_new(state, "risk_list")
+        if carried is not None and not len(new_state["risk_list"]):
+            update = _skipped(state, "risk_analysis", "evaluation")
+        else:
+            evaluator = EvaluatorAgent(models["large_model"])
+            update = evaluator.evaluate(new_state)
+        return _check_evaluated(_with_carried(update, carried, "risk_analysis"))
+    except Exception as e:
+        return _node_failed("evaluate_report", state, e)
+
+async def aevaluate_report(state: State) -> Dict:
+    """Async node function for evaluating risks"""
+    try:
+        _check_evaluate_input(state)
+        carried, new_state = _only_new(state, "risk_list")
+        if carried is not None and not len(new_state["risk_list"]):
+            update = _skipped(state, "risk_analysis", "evaluation")
+        else:
+            evaluator = EvaluatorAgent(models["large_model"])
+            update = await evaluator.aevaluate(new_state)
+        return _check_evaluated(_with_carried(update, carried, "risk_analysis"))
     except Exception as e:
-        error_msg = f"Error in evaluate_report: {str(e)}"
-        logger.error(error_msg)
-        return {
-            "risk_list": state.get("risk_list", ""),
-            "risk_analysis": state.get("risk_analysis", []),
-            "iteration": state.get("iteration", 0),
-            "validation_errors": state.get("validation_errors", []),
-            "token_usage": state.get("token_usage", {}),
-        }
+        return _node_failed("evaluate_report", state, e)
+
+def _check_optimize_input(state: State) -> None:
+    if not state.get("risk_list") or not state.get("risk_analysis"):
+        raise ValueError("Missing required state: risk_list or risk_analysis")
+
+def _check_optimized(update: Dict) -> Dict:
+    if not update.get("risk_list"):
+        raise ValueError("Failed to generate optimized report")
+    return update
 
 def optimize_report(state: State) -> Dict:
     """Node function for optimizing risk analysis"""
     try:
-        if not state.get("risk_list") or not state.get("risk_analysis"):
-            raise ValueError("Missing required state: risk_list or risk_analysis")
-            
-        optimizer = OptimizationAgent(models["small_model"])
-        update = optimizer.optimize(state)
-        
-        if not update.get("risk_list"):
-            raise ValueError("Failed to generate optimized report")
-                
-        return update
-        
+        _check_optimize_input(state)
+        carried, new_state = _only_new(state, "risk_analysis")
+        if carried is not None and not len(new_state["risk_analysis"]):
+            update = _skipped(state, "risk_list", "optimization")
+        else:
+            optimizer = OptimizationAgent(models["small_model"])
+            update = optimizer.optimize(new_state)
+        return _check_optimized(_with_carried(update, carried, "risk_list"))
     except Exception as e:
-        error_msg = f"Error in optimize_report: {str(e)}"
-        logger.error(error_msg)
-        return {
-            "risk_list": state.get("risk_list", ""),
-            "risk_analysis": state.get("risk_analysis", []),
-            "iteration": state.get("iteration", 0),
-            "validation_errors": state.get("validation_errors", []),
-            "token_usage": state.get("token_usage", {}),
-        }
+        return _node_failed("optimize_report", state, e)
+
+async def aoptimize_report(state: State) -> Dict:
+    """Async node function for optimizing risk analysis"""
+    try:
+        _check_optimize_input(state)
+        carried, new_state = _only_new(state, "risk_analysis")
+        if carried is not None and not len(new_state["risk_analysis"]):
+            update = _skipped(state, "risk_list", "optimization")
+        else:
+            optimizer = OptimizationAgent(models["small_model"])
+            update = await optimizer.aoptimize(new_state)
+        return _check_optimized(_with_carried(update, carried, "risk_list"))
+    except Exception as e:
+        return _node_failed("optimize_report", state, e)
+
+def _load_failed(e: Exception) -> Dict:
+    error_msg = f"Error loading document: {str(e)}"
+    logger.error(error_msg)
+    return {"validation_errors": [error_msg]}
 
 def load_document(state: State) -> Dict:
     """Initial node that loads and processes document"""
@@ -90,40 +206,91 @@ def load_document(state: State) -> Dict:
         if not state.get("input_file"):
             raise ValueError("No input file provided")
             
-        # Load and process document
-        vectorstore = load_and_process_pdf(state["input_file"])
+        # Load and process document, then perform RAG search (cached per document)
+        contexts = load_contexts(state["input_file"], RISK_ANALYSIS_QUERIES)
         
-        # Perform RAG search
-        contexts = perform_rag_search(vectorstore, RISK_ANALYSIS_QUERIES)
-        
-        return {
-            "context": contexts,
-            "token_usage": {"search": sum(len(c) for c in contexts)}
-        }
+        return {"context": to_blobs(contexts)}
         
     except Exception as e:
-        error_msg = f"Error loading document: {str(e)}"
-        logger.error(error_msg)
-        return {"validation_errors": [error_msg]}
+        return _load_failed(e)
+
+async def aload_document(state: State) -> Dict:
+    """Async initial node; parsing, embedding and FAISS search run in a worker thread"""
+    try:
+        if not state.get("input_file"):
+            raise ValueError("No input file provided")
+
+        contexts = await asyncio.to_thread(
+            lambda: to_blobs(load_contexts(state["input_file"], RISK_ANALYSIS_QUERIES))
+        )
+
+        return {"context": contexts}
+
+    except Exception as e:
+        return _load_failed(e)
+
+# What each node's output depends on, for stage memoization. Upstream outputs
+# are hashed by content, so a node only re-runs when its own inputs change.
+STAGE_INPUTS = {
+    "load_document": lambda state: [
+        get_document_hash(resolve_file_path(state["input_file"])), RISK_ANALYSIS_QUERIES,
+        EMBEDDING_MODEL, SPLITTER_CHUNK_SIZE, SPLITTER_CHUNK_OVERLAP, LLM_BACKEND, CONTEXT_FORMAT_VERSION,
+    ],
+    "create_report": lambda state: [
+        state.get("context"), CREATOR_PROMPT, MODEL_SETTINGS["small_model"], LLM_BACKEND,
+        get_document_hash(state["baseline_file"]) if state.get("baseline_file") else None,
+    ],
+    "evaluate_report": lambda state: [
+        state.get("risk_list"), state.get("iteration"), state.get("carried_ids"), EVALUATOR_PROMPT,
+        MODEL_SETTINGS["large_model"], LLM_BACKEND, load_scoring_config(),
+    ],
+    "optimize_report": lambda state: [
+        state.get("risk_analysis"), state.get("iteration"), state.get("carried_ids"), OPTIMIZER_PROMPT,
+        MODEL_SETTINGS["small_model"], LLM_BACKEND, load_scoring_config(),
+    ],
+}
 
 def get_initial_state() -> Dict:
     """Returns minimal required state to start workflow"""
     return {
         "input_file": "",
-        "risk_list": "",
+        "risk_list": RiskTable(),
         "iteration": 0
     }
 
-def create_workflow() -> StateGraph:
-    """Creates and configures the workflow graph"""
+def create_workflow(profile: Optional[str] = None, memoize: Optional[bool] = None) -> StateGraph:
+    """Creates and configures the workflow graph
+
+    Args:
+        profile: Nodes to profile ("all" or comma-separated names); defaults to RISK_AGENT_PROFILE
+        memoize: Reuse stored node outputs when inputs are unchanged; defaults to RISK_AGENT_STAGE_CACHE
+    """
     # Create workflow graph
     workflow = StateGraph(State)
 
-    # Add nodes
-    workflow.add_node("load_document", load_document)
-    workflow.add_node("create_report", create_report)
-    workflow.add_node("evaluate_report", evaluate_report)
-    workflow.add_node("optimize_report", optimize_report)
+    # Each node has a sync and an async implementation: `invoke` runs the
+    # former, `ainvoke`/`astream` the latter on the caller's event loop
+    nodes = [
+        ("load_document", load_document, aload_document),
+        ("create_report", create_report, acreate_report),
+        ("evaluate_report", evaluate_report, aevaluate_report),
+        ("optimize_report", optimize_report, aoptimize_report),
+    ]
+
+    # Profiling wrappers are only added when requested, so disabled profiling costs nothing
+    profiled = profiled_nodes(profile, [name for name, _, _ in nodes])
+    profile_dir = new_profile_dir() if profiled else None
+    memoize = STAGE_CACHE_ENABLED if memoize is None else memoize
+
+    # Add nodes, each timed and tagged so its LLM calls are attributed to it
+    for name, node, anode in nodes:
+        if name in profiled:
+            node = profile_node(name, node, profile_dir)
+            anode = profile_node(name, anode, profile_dir)
+        if memoize:
+            node = memoize_node(name, node, STAGE_INPUTS[name])
+            anode = memoize_node(name, anode, STAGE_INPUTS[name])
+        workflow.add_node(name, RunnableLambda(instrument_node(name, node), afunc=instrument_node(name, anode), name=name))
 
     # Set entry point
     workflow.set_entry_point("load_document")
@@ -0,0 +1,199 @@
+import argparse
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from typing import Dict, List, Optional, Tuple
+from .cache_manifest import get_manifest
+from .configuration import (
+    CACHE_DIR,
+    INGEST_EXTENSIONS,
+    INGEST_INBOX,
+    INGEST_POLL_INTERVAL,
+    INGEST_SETTLE_S,
+    INGEST_WORKERS,
+    RISK_ANALYSIS_QUERIES,
+    logger,
+)
+from .logs import log_context
+from .metrics import instrument_node, set_gauge
+from .utils import contexts_key, get_document_hash, index_fingerprint, load_contexts
+
+def is_ingested(file_path: str, queries: Dict[str, List[str]] = RISK_ANALYSIS_QUERIES) -> bool:
+    """Whether load_contexts(file_path, queries) is served from the cache
+
+    Only hashes the file and reads the manifest: nothing is parsed or embedded.
+    """
+    fingerprint = index_fingerprint()
+    document_text = get_manifest(CACHE_DIR).lookup_document(get_document_hash(file_path), fingerprint)
+    if document_text is None:
+        return False
+    key = contexts_key(f"{document_text}-{fingerprint}", os.path.basename(file_path), queries)
+    return os.path.exists(os.path.join(CACHE_DIR, f"{key}.contexts.json"))
+
+def ingest_document(file_path: str, queries: Dict[str, List[str]] = RISK_ANALYSIS_QUERIES) -> bool:
+    """Parse, split, embed, index and search a document into the cache
+
+    Returns False if it was already there. The analysis of the same file
+    (same name and content) then finds its contexts in the cache, so the
+    load_document node neither parses nor calls the embedding provider.
+    """
+    if is_ingested(file_path, queries):
+        return False
+    load_contexts(file_path, queries)
+    return True
+
+class IngestWorker:
+    """Watches an inbox directory and ingests every new or changed document
+
+    The inbox is scanned every `poll_interval` seconds (polling works on
+    network shares and needs no extra dependency). A file is picked up once
+    it has not been modified for `settle_s` seconds, and again whenever its
+    size or modification time change. Failed documents are retried only
+    after they change. Documents run `workers` at a time, off the analysis
+    critical path, and share the process-wide embeddings client and caches.
+    """
+
+    def __init__(self, inbox: str, queries: Dict[str, List[str]] = RISK_ANALYSIS_QUERIES,
+                 workers: int = INGEST_WORKERS, poll_interval: float = INGEST_POLL_INTERVAL,
+                 settle_s: float = INGEST_SETTLE_S, extensions: Tuple[str, ...] = INGEST_EXTENSIONS):
+        self.inbox = inbox
+        self.queries = queries
+        self.extensions = extensions
+        self.poll_interval = poll_interval
+        self.settle_s = settle_s
+        # Status per document path: signature (size, mtime), status, timings and error
+        self.documents: Dict[str, Dict] = {}
+        self._futures: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="ingest")
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _documents(self) -> List[str]:
+        paths = []
+        for directory, _, files in os.walk(self.inbox):
+            paths.extend(os.path.join(directory, name) for name in files if name.lower().endswith(self.extensions))
+        return sorted(paths)
+
+    def _signature(self, path: str) -> Optional[Tuple[int, int]]:
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return None
+        if time.time() - stat.st_mtime < self.settle_s:
+            return None
+        return stat.st_size, stat.st_mtime_ns
+
+    def scan(self) -> List[str]:
+        """Queue every settled document that is new or changed since its last ingestion"""
+        queued = []
+        for path in self._documents():
+            signature = self._signature(path)
+            if signature is None:
+                continue
+            with self._lock:
+                known = self.documents.get(path)
+                if path in self._futures or (known and known["signature"] == list(signature)):
+                    continue
+                self.documents[path] = {"signature": list(signature), "status": "queued", "error": None}
+                self._futures[path] = self._executor.submit(self._ingest, path)
+            queued.append(path)
+        if queued:
+            logger.info("[Ingest] Queued %d documents from %s", len(queued), self.inbox)
+        self._publish()
+        return queued
+
+    def _ingest(self, path: str) -> None:
+        started = time.time()
+        self._update(path, status="running", started_at=started)
+        try:
+            with log_context(ingest=os.path.basename(path)):
+                built = instrument_node("ingest_document", ingest_document)(path, self.queries)
+            wall_s = time.time() - started
+            self._update(path, status="done" if built else "cached", wall_s=wall_s)
+            if built:
+                logger.info("[Ingest] %s ready in %.1fs", os.path.basename(path), wall_s)
+        except Exception as e:
+            self._update(path, status="failed", error=str(e), wall_s=time.time() - started)
+            logger.error("[Ingest] %s failed: %s", os.path.basename(path), e, exc_info=True)
+        finally:
+            with self._lock:
+                self._futures.pop(path, None)
+            self._publish()
+
+    def _update(self, path: str, **fields) -> None:
+        with self._lock:
+            self.documents[path].update(fields)
+
+    def _publish(self) -> None:
+        counts = self.counts()
+        for status in ("queued", "running", "done", "cached", "failed"):
+            set_gauge("ingest_documents", status, counts.get(status, 0))
+
+    def counts(self) -> Dict[str, int]:
+        """Number of documents per status"""
+        with self._lock:
+            counts: Dict[str, int] = {}
+            for entry in self.documents.values():
+                counts[entry["status"]] = counts.get(entry["status"], 0) + 1
+            return counts
+
+    def run_once(self) -> Dict[str, int]:
+        """Scan the inbox and wait until every queued document is ingested"""
+        self.scan()
+        with self._lock:
+            futures = list(self._futures.values())
+        wait(futures)
+        return self.counts()
+
+    def run_forever(self) -> None:
+        logger.info("[Ingest] Watching %s every %.0fs", self.inbox, self.poll_interval)
+        while not self._stop.is_set():
+            try:
+                self.scan()
+            except OSError as e:
+                logger.error("[Ingest] Cannot scan %s: %s", self.inbox, e)
+            self._stop.wait(self.poll_interval)
+
+    def start(self) -> "IngestWorker":
+        """Watch the inbox on a background thread"""
+        self._thread = threading.Thread(target=self.run_forever, name="ingest-watch", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self, wait_for_documents: bool = False) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+        self._executor.shutdown(wait=wait_for_documents, cancel_futures=not wait_for_documents)
+
+def main():
+    parser = argparse.ArgumentParser(description="Index documents dropped in an inbox directory ahead of analysis")
+    parser.add_argument("inbox", nargs="?", default=INGEST_INBOX, help="Directory to watch (default: RISK_AGENT_INGEST_INBOX)")
+    parser.add_argument("--workers", type=int, default=INGEST_WORKERS, help="Documents ingested concurrently")
+    parser.add_argument("--interval", type=float, default=INGEST_POLL_INTERVAL, help="Seconds between inbox scans")
+    parser.add_argument("--settle", type=float, default=INGEST_SETTLE_S,
+                        help="Seconds a file must be unmodified before it is ingested")
+    parser.add_argument("--once", action="store_true", help="Ingest what is in the inbox now, then exit")
+    args = parser.parse_args()
+    if not args.inbox:
+        parser.error("no inbox given (argument or RISK_AGENT_INGEST_INBOX)")
+
+    worker = IngestWorker(args.inbox, workers=args.workers, poll_interval=args.interval, settle_s=args.settle)
+    if args.once:
+        counts = worker.run_once()
+        worker.stop(wait_for_documents=True)
+        logger.info("[Ingest] Finished: %s", counts)
+        if counts.get("failed"):
+            raise SystemExit(1)
+        return
+    try:
+        worker.run_forever()
+    except KeyboardInterrupt:
+        logger.info("Shutting down")
+    finally:
+        worker.stop()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,457 @@
+import re
+import random
+import asyncio
+import contextvars
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Any, Callable, Dict, Optional
+from .configuration import (
+    logger,
+    LLM_CALL_TIMEOUT,
+    LLM_CALL_DEADLINE,
+    LLM_MAX_ATTEMPTS,
+    LLM_BACKOFF_BASE,
+    LLM_BACKOFF_MAX,
+    LLM_HEDGE_ENABLED,
+    LLM_HEDGE_QUANTILE,
+    LLM_HEDGE_MIN_DELAY,
+    LLM_MAX_WORKERS,
+)
+from .metrics import extract_cached_tokens, extract_token_usage, record_llm_call, set_gauge
+from .profiling import profile_worker
+from .scheduler import LLM_SCHEDULER, Ticket, estimate_tokens
+
+RETRYABLE_STATUS_CODES = {408, 429, 500, 502, 503, 504}
+RETRYABLE_ERROR_NAMES = {
+    "ResourceExhausted",
+    "TooManyRequests",
+    "ServiceUnavailable",
+    "DeadlineExceeded",
+    "InternalServerError",
+    "GatewayTimeout",
+    "RateLimitError",
+}
+
+# Errors meaning the provider is short of capacity, which lower the model's concurrency limit
+OVERLOAD_STATUS_CODES = {429, 503}
+OVERLOAD_ERROR_NAMES = {"ResourceExhausted", "TooManyRequests", "ServiceUnavailable", "RateLimitError"}
+
+_RETRY_AFTER_PATTERNS = [
+    re.compile(r"retry[-_ ]after[\"']?\s*[:=]\s*[\"']?(\d+(?:\.\d+)?)", re.IGNORECASE),
+    re.compile(r"retry_delay\s*\{\s*seconds:\s*(\d+)", re.IGNORECASE),
+    re.compile(r"retry in (\d+(?:\.\d+)?)\s*s", re.IGNORECASE),
+]
+
+class LLMDeadlineExceeded(TimeoutError):
+    """Raised when an LLM call does not finish within its deadline"""
+
+class LatencyTracker:
+    """Rolling window of successful call latencies, keyed by model"""
+
+    def __init__(self, window: int = 200, min_samples: int = 20):
+        self.window = window
+        self.min_samples = min_samples
+        self._samples: Dict[str, deque] = {}
+        self._lock = threading.Lock()
+
+    def record(self, key: str, latency: float) -> None:
+        with self._lock:
+            self._samples.setdefault(key, deque(maxlen=self.window)).append(latency)
+
+    def quantile(self, key: str, q: float) -> Optional[float]:
+        """Return the q-quantile for key, or None until enough samples exist"""
+        with self._lock:
+            samples = list(self._samples.get(key, ()))
+        if len(samples) < self.min_samples:
+            return None
+        ordered = sorted(samples)
+        index = min(len(ordered) - 1, int(q * len(ordered)))
+        return ordered[index]
+
+def get_status_code(exc: BaseException) -> Optional[int]:
+    """Best-effort HTTP status code of a provider exception"""
+    for attr in ("status_code", "code", "http_status"):
+        value = getattr(exc, attr, None)
+        if callable(value):
+            try:
+                value = value()
+            except Exception:
+                value = None
+        if isinstance(value, int):
+            return value
+    response = getattr(exc, "response", None)
+    status = getattr(response, "status_code", None)
+    return status if isinstance(status, int) else None
+
+def get_retry_after(exc: BaseException) -> Optional[float]:
+    """Extract a server-provided retry delay (in seconds) from an exception"""
+    value = getattr(exc, "retry_after", None)
+    if value is not None:
+        try:
+            return float(value)
+        except (TypeError, ValueError):
+            pass
+
+    response = getattr(exc, "response", None)
+    headers = getattr(response, "headers", None)
+    if headers:
+        try:
+            return float(headers.get("retry-after") or headers.get("Retry-After"))
+        except (TypeError, ValueError):
+            pass
+
+    message = str(exc)
+    for pattern in _RETRY_AFTER_PATTERNS:
+        match = pattern.search(message)
+        if match:
+            return float(match.group(1))
+    return None
+
+def is_retryable(exc: BaseException) -> bool:
+    """Whether an exception is a transient provider failure worth retrying"""
+    if isinstance(exc, (TimeoutError, ConnectionError)):
+        return True
+    if get_status_code(exc) in RETRYABLE_STATUS_CODES:
+        return True
+    return any(cls.__name__ in RETRYABLE_ERROR_NAMES for cls in type(exc).__mro__)
+
+def is_overload(exc: BaseException) -> bool:
+    """Whether an exception signals quota exhaustion or overload rather than a bad request"""
+    if isinstance(exc, TimeoutError):
+        return True
+    if get_status_code(exc) in OVERLOAD_STATUS_CODES:
+        return True
+    return any(cls.__name__ in OVERLOAD_ERROR_NAMES for cls in type(exc).__mro__)
+
+def backoff_delay(attempt: int, retry_after: Optional[float] = None,
+                  base: float = LLM_BACKOFF_BASE, cap: float = LLM_BACKOFF_MAX) -> float:
+    """Exponential backoff with jitter; a server retry-after always wins"""
+    if retry_after is not None:
+        return max(0.0, retry_after)
+    ceiling = min(cap, base * (2 ** attempt))
+    return ceiling / 2 + random.uniform(0, ceiling / 2)
+
+def model_key(llm: Any) -> str:
+    """Stable identifier of a chat model used to key latency statistics"""
+    for attr in ("model", "model_name"):
+        value = getattr(llm, attr, None)
+        if isinstance(value, str):
+            return value
+    return type(llm).__name__
+
+class LLMCaller:
+    """Deadline-aware invoker for LangChain runnables
+
+    Each attempt is bounded by `timeout`; the whole call (attempts plus
+    backoff sleeps) is bounded by `deadline`. With hedging enabled, a
+    duplicate request is fired once an attempt runs longer than the
+    observed p95 latency for that model, and the first result wins.
+
+    Every request at the provider, hedges included, holds its own slot from
+    the LLM scheduler (and so counts against the model's AIMD limit) until
+    it really ends. A sync call the attempt stopped waiting for cannot be
+    interrupted and keeps its pool thread and slot until the provider
+    answers or the client times out; such abandoned calls are counted in
+    the llm_abandoned_calls gauge. The pool has a thread for every scheduler
+    slot, so granted calls never queue behind abandoned ones.
+    """
+
+    def __init__(self, timeout: float = LLM_CALL_TIMEOUT, deadline: float = LLM_CALL_DEADLINE,
+                 max_attempts: int = LLM_MAX_ATTEMPTS, hedge: bool = LLM_HEDGE_ENABLED,
+                 hedge_quantile: float = LLM_HEDGE_QUANTILE, hedge_min_delay: float = LLM_HEDGE_MIN_DELAY,
+                 max_workers: int = LLM_MAX_WORKERS):
+        self.timeout = timeout
+        self.deadline = deadline
+        self.max_attempts = max_attempts
+        self.hedge = hedge
+        self.hedge_quantile = hedge_quantile
+        self.hedge_min_delay = hedge_min_delay
+        self.latencies = LatencyTracker()
+        self._executor = ThreadPoolExecutor(max_workers=max(max_workers, LLM_SCHEDULER.slots),
+                                            thread_name_prefix="llm-call")
+        self._abandoned = 0
+        self._abandoned_lock = threading.Lock()
+
+    def hedge_delay(self, key: str) -> Optional[float]:
+        if not self.hedge:
+            return None
+        quantile = self.latencies.quantile(key, self.hedge_quantile)
+        if quantile is None:
+            return None
+        return max(self.hedge_min_delay, quantile)
+
+    def _track(self, call, key: str, ticket: Ticket, unwrap: Callable[[Any], Any] = lambda result: result) -> None:
+        """Report a call's outcome to the AIMD limiter and give its slot back once it ends
+
+        A call cancelled before it started only gives its slot back.
+        """
+        started = time.monotonic()
+
+        def done(call) -> None:
+            response = None
+            if not call.cancelled():
+                error = call.exception()
+                if error is None:
+                    response = unwrap(call.result())
+                # Reported before the slot is handed on, so the next grant sees the adjusted limit
+                self._adapt(key, started, error)
+            LLM_SCHEDULER.release(ticket, sum(extract_token_usage(response)) if response is not None else 0)
+
+        call.add_done_callback(done)
+
+    def _submit(self, runnable, inputs: Dict, key: str, ticket: Ticket):
+        """Run runnable.invoke on the pool under ticket, reporting how long it waited to start"""
+        submitted = time.monotonic()
+        context = contextvars.copy_context()
+
+        def run():
+            queue_wait = time.monotonic() - submitted
+            return queue_wait, profile_worker(lambda: runnable.invoke(inputs))
+
+        try:
+            future = self._executor.submit(context.run, run)
+        except BaseException:
+            # Nothing will end the call, e.g. the pool was shut down: the slot goes back here
+            LLM_SCHEDULER.release(ticket)
+            raise
+        self._track(future, key, ticket, unwrap=lambda result: result[1])
+        return future
+
+    def _hedge_ticket(self, key: str, cost: int) -> Optional[Ticket]:
+        ticket = LLM_SCHEDULER.try_acquire(cost, model=key)
+        if ticket is None:
+            logger.info("[LLM] Not hedging %s request: no free slot within the concurrency limits", key)
+        return ticket
+
+    def _abandon(self, futures, key: str) -> None:
+        """Stop waiting for calls; those already running keep their thread and slot until they end"""
+        running = [future for future in futures if not future.cancel()]
+        if not running:
+            return
+        with self._abandoned_lock:
+            self._abandoned += len(running)
+            abandoned = self._abandoned
+        set_gauge("llm_abandoned_calls", "all", abandoned)
+        logger.warning("[LLM] Abandoned %d running %s calls (%d abandoned calls still hold pool threads)",
+                       len(running), key, abandoned)
+        for future in running:
+            future.add_done_callback(self._reclaim)
+
+    def _reclaim(self, future) -> None:
+        with self._abandoned_lock:
+            self._abandoned -= 1
+            abandoned = self._abandoned
+        set_gauge("llm_abandoned_calls", "all", abandoned)
+
+    def _attempt(self, runnable, inputs: Dict, key: str, timeout: float, stats: Dict, ticket: Ticket):
+        start = time.monotonic()
+        pending = {self._submit(runnable, inputs, key, ticket)}
+        hedge_at = self.hedge_delay(key)
+        hedged = False
+        last_error = None
+
+        while pending:
+            elapsed = time.monotonic() - start
+            remaining = timeout - elapsed
+            if remaining <= 0:
+                break
+            wait_for = remaining
+            if not hedged and hedge_at is not None:
+                wait_for = min(remaining, max(0.0, hedge_at - elapsed))
+
+            done, pending = wait(pending, timeout=wait_for, return_when=FIRST_COMPLETED)
+            for future in done:
+                error = future.exception()
+                if error is None:
+                    self.latencies.record(key, time.monotonic() - start)
+                    self._abandon(pending, key)
+                    queue_wait, response = future.result()
+                    stats["queue_wait_s"] += queue_wait
+                    return response
+                last_error = error
+
+            if not hedged and hedge_at is not None and pending and time.monotonic() - start >= hedge_at:
+                # Hedge at most once per attempt, and only into a free slot
+                hedged = True
+                hedge_ticket = self._hedge_ticket(key, ticket.cost)
+                if hedge_ticket is not None:
+                    logger.info("[LLM] Hedging %s request after %.1fs", key, hedge_at)
+                    pending.add(self._submit(runnable, inputs, key, hedge_ticket))
+                    stats["hedges"] += 1
+
+        if last_error is not None and not pending:
+            raise last_error
+        self._abandon(pending, key)
+        self._timed_out(key, start)
+        raise LLMDeadlineExceeded(f"{key} call exceeded {timeout:.1f}s")
+
+    def invoke(self, runnable, inputs: Dict, key: str = "default", deadline: Optional[float] = None):
+        """Invoke runnable with per-attempt timeout, backoff and optional hedging
+
+        Every attempt waits for its own slot from the LLM scheduler, which
+        its request gives back when it ends, so slots are free during backoff
+        sleeps and fair queuing, reserved slots and the model's adaptive
+        concurrency limit only see calls actually at the provider. Slot
+        waits count as queue time and against the deadline, which defaults
+        to the caller's.
+        """
+        deadline = self.deadline if deadline is None else deadline
+        start = time.monotonic()
+        stats = {"queue_wait_s": 0.0, "hedges": 0}
+        attempt = 0
+        cost = estimate_tokens(inputs)
+        try:
+            while True:
+                ticket = LLM_SCHEDULER.acquire(cost, timeout=self._remaining(key, start, deadline), model=key)
+                stats["queue_wait_s"] += ticket.waited_s
+                timeout = self._attempt_timeout(key, start, deadline, ticket)
+                try:
+                    response = self._attempt(runnable, inputs, key, timeout, stats, ticket)
+                    break
+                except Exception as e:
+                    error = e
+                attempt += 1
+                time.sleep(self._retry_delay(error, key, attempt, start, deadline))
+        except Exception:
+            record_llm_call(key, wall_s=time.monotonic() - start, retries=attempt, error=True, **stats)
+            raise
+
+        self._record_success(response, key, start, attempt, stats)
+        return response
+
+    @staticmethod
+    def _remaining(key: str, start: float, deadline: float) -> float:
+        remaining = deadline - (time.monotonic() - start)
+        if remaining <= 0:
+            raise LLMDeadlineExceeded(f"{key} call exceeded deadline of {deadline:.1f}s")
+        return remaining
+
+    def _attempt_timeout(self, key: str, start: float, deadline: float, ticket: Ticket) -> float:
+        """Timeout of an attempt about to start; gives the ticket back if the deadline passed"""
+        try:
+            return min(self.timeout, self._remaining(key, start, deadline))
+        except LLMDeadlineExceeded:
+            LLM_SCHEDULER.release(ticket)
+            raise
+
+    @staticmethod
+    def _adapt(key: str, started: float, error: Optional[BaseException] = None) -> None:
+        """Feed a call's outcome to the model's AIMD concurrency limit"""
+        limiter = LLM_SCHEDULER.limiter
+        if error is None:
+            limiter.on_success(key, started, time.monotonic() - started)
+        elif is_overload(error):
+            limiter.on_overload(key, started, type(error).__name__)
+
+    @staticmethod
+    def _timed_out(key: str, attempt_start: float) -> None:
+        # Calls still running past the attempt timeout report their own outcome when they end
+        LLM_SCHEDULER.limiter.on_overload(key, attempt_start, "timeout")
+
+    def _retry_delay(self, error: Exception, key: str, attempt: int, start: float, deadline: float) -> float:
+        """Backoff before the next attempt; re-raises when the error is final or the deadline is near"""
+        if attempt >= self.max_attempts or not is_retryable(error):
+            raise error
+        delay = backoff_delay(attempt - 1, get_retry_after(error))
+        if delay >= deadline - (time.monotonic() - start):
+            raise error
+        logger.warning("[LLM] %s attempt %d failed (%s), retrying in %.1fs", key, attempt, type(error).__name__, delay)
+        return delay
+
+    @staticmethod
+    def _record_success(response, key: str, start: float, attempt: int, stats: Dict) -> None:
+        prompt_tokens, completion_tokens = extract_token_usage(response)
+        record_llm_call(
+            key,
+            wall_s=time.monotonic() - start,
+            retries=attempt,
+            prompt_tokens=prompt_tokens,
+            completion_tokens=completion_tokens,
+            cached_prompt_tokens=extract_cached_tokens(response),
+            **stats
+        )
+
+    def _astart(self, runnable, inputs: Dict, key: str, ticket: Ticket) -> asyncio.Task:
+        task = asyncio.ensure_future(runnable.ainvoke(inputs))
+        self._track(task, key, ticket)
+        return task
+
+    async def _aattempt(self, runnable, inputs: Dict, key: str, timeout: float, stats: Dict, ticket: Ticket):
+        start = time.monotonic()
+        pending = {self._astart(runnable, inputs, key, ticket)}
+        hedge_at = self.hedge_delay(key)
+        hedged = False
+        last_error = None
+
+        try:
+            while pending:
+                elapsed = time.monotonic() - start
+                remaining = timeout - elapsed
+                if remaining <= 0:
+                    break
+                wait_for = remaining
+                if not hedged and hedge_at is not None:
+                    wait_for = min(remaining, max(0.0, hedge_at - elapsed))
+
+                done, pending = await asyncio.wait(pending, timeout=wait_for, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    error = task.exception()
+                    if error is None:
+                        self.latencies.record(key, time.monotonic() - start)
+                        return task.result()
+                    last_error = error
+
+                if not hedged and hedge_at is not None and pending and time.monotonic() - start >= hedge_at:
+                    hedged = True
+                    hedge_ticket = self._hedge_ticket(key, ticket.cost)
+                    if hedge_ticket is not None:
+                        logger.info("[LLM] Hedging %s request after %.1fs", key, hedge_at)
+                        pending.add(self._astart(runnable, inputs, key, hedge_ticket))
+                        stats["hedges"] += 1
+        finally:
+            # Cancelled tasks stop their requests and give their slots back
+            for task in pending:
+                task.cancel()
+
+        if last_error is not None and not pending:
+            raise last_error
+        self._timed_out(key, start)
+        raise LLMDeadlineExceeded(f"{key} call exceeded {timeout:.1f}s")
+
+    async def ainvoke(self, runnable, inputs: Dict, key: str = "default", deadline: Optional[float] = None):
+        """Async invoke with the same scheduling, timeout, backoff and hedging rules, without a thread per call"""
+        deadline = self.deadline if deadline is None else deadline
+        start = time.monotonic()
+        stats = {"queue_wait_s": 0.0, "hedges": 0}
+        attempt = 0
+        cost = estimate_tokens(inputs)
+        try:
+            while True:
+                ticket = await LLM_SCHEDULER.aacquire(cost, timeout=self._remaining(key, start, deadline), model=key)
+                stats["queue_wait_s"] += ticket.waited_s
+                timeout = self._attempt_timeout(key, start, deadline, ticket)
+                try:
+                    response = await self._aattempt(runnable, inputs, key, timeout, stats, ticket)
+                    break
+                except Exception as e:
+                    error = e
+                attempt += 1
+                await asyncio.sleep(self._retry_delay(error, key, attempt, start, deadline))
+        except Exception:
+            record_llm_call(key, wall_s=time.monotonic() - start, retries=attempt, error=True, **stats)
+            raise
+
+        self._record_success(response, key, start, attempt, stats)
+        return response
+
+llm_caller = LLMCaller()
+
+def invoke_llm(runnable, inputs: Dict, key: str = "default", deadline: Optional[float] = None):
+    """Invoke runnable through the shared deadline-aware caller"""
+    return llm_caller.invoke(runnable, inputs, key=key, deadline=deadline)
+
+async def ainvoke_llm(runnable, inputs: Dict, key: str = "default", deadline: Optional[float] = None):
+    """Async counterpart of invoke_llm"""
+    return await llm_caller.ainvoke(runnable, inputs, key=key, deadline=deadline)
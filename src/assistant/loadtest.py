@@ -0,0 +1,239 @@
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional
+
+PACKAGE_DIR = Path(__file__).resolve().parent
+DOCUMENT_PATH = PACKAGE_DIR / "documents" / "TERMO_DE_REFERENCIA.pdf"
+
+STAGES = ("load_document", "create_report", "evaluate_report", "optimize_report")
+PERCENTILES = (50, 95, 99)
+DEFAULT_LEVELS = [1, 2, 4, 8, 16]
+
+def percentile(values: List[float], q: float) -> float:
+    """Nearest-rank q-th percentile (0 for no values)"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = int(-(-len(ordered) * q // 100))
+    return ordered[min(len(ordered) - 1, max(0, rank - 1))]
+
+def percentiles(values: List[float]) -> Dict[str, float]:
+    return {f"p{q}": round(percentile(values, q), 4) for q in PERCENTILES}
+
+def write_documents(directory: str, count: int, tag: str, pages: int = 0) -> List[str]:
+    """Write `count` distinct synthetic documents built from the sample document's pages
+
+    Every page is stamped with the document's tag and number, so documents
+    have different text, indexes, contexts and prompts. As in production,
+    only the embeddings of the RAG queries are shared between them.
+    """
+    with open(DOCUMENT_PATH, "r", encoding="utf-8", errors="replace") as f:
+        sample = [page.strip() for page in f.read().split("\f") if page.strip()]
+    os.makedirs(directory, exist_ok=True)
+    paths = []
+    for i in range(count):
+        path = os.path.join(directory, f"{tag}-{i:04d}.pdf")
+        text = "\f".join(
+            f"Documento sintético {tag}-{i}, página {p + 1}.\n{sample[(i + p) % len(sample)]}"
+            for p in range(pages or len(sample))
+        )
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(text)
+        paths.append(path)
+    return paths
+
+def configure_backend(args: argparse.Namespace) -> None:
+    """Install fake models and embeddings with the requested latency and 429 behaviour"""
+    from . import configuration
+    from .fakes import LatencyModel, create_fake_embeddings, create_fake_models
+
+    latency = LatencyModel(args.latency, args.latency_sigma, args.tail_probability, args.tail_multiplier)
+    fake_models = create_fake_models(latency=latency, error_rate=args.error_rate, seed=args.seed,
+                                     capacity=args.capacity)
+    for model in fake_models.values():
+        model.retry_after = args.retry_after
+    configuration.models.set(fake_models)
+    configuration.set_embeddings(create_fake_embeddings(
+        latency=LatencyModel(args.embedding_latency, args.latency_sigma), seed=args.seed,
+    ))
+
+def _document_result(run, final_state: Optional[Dict], wall_s: float, error: Optional[str] = None) -> Dict:
+    data = run.to_dict()
+    tokens: Dict[str, int] = {}
+    llm = dict.fromkeys(("calls", "retries", "errors", "coalesced"), 0)
+    for stats in data["llm"]:
+        tokens[stats["node"]] = tokens.get(stats["node"], 0) + stats["prompt_tokens"] + stats["completion_tokens"]
+        for field in llm:
+            llm[field] += stats[field]
+    risks = len(final_state.get("risk_list") or []) if final_state else 0
+    return {
+        "ok": error is None and risks > 0,
+        "error": error or (None if risks else "no risks"),
+        "wall_s": wall_s,
+        "stages": {node: stats["wall_s"] for node, stats in data["nodes"].items()},
+        "tokens": tokens,
+        "llm": llm,
+    }
+
+def run_document(path: str, doc_id: str, priority: str) -> Dict:
+    """Analyse one document through the compiled graph, as the batch CLI does"""
+    from .main import get_agent
+    from .metrics import start_run
+    from .records import RiskTable
+    from .scheduler import job_context
+
+    start = time.monotonic()
+    final_state, error = None, None
+    with start_run(doc_id) as run, job_context(doc_id, priority):
+        try:
+            final_state = get_agent().invoke({"input_file": path, "risk_list": RiskTable(), "iteration": 0})
+        except Exception as e:
+            error = str(e)
+    return _document_result(run, final_state, time.monotonic() - start, error)
+
+async def arun_document(path: str, doc_id: str, priority: str) -> Dict:
+    """Async counterpart of run_document, as the service runs its jobs"""
+    from .main import get_agent
+    from .metrics import start_run
+    from .records import RiskTable
+    from .scheduler import job_context
+
+    start = time.monotonic()
+    final_state, error = None, None
+    with start_run(doc_id) as run, job_context(doc_id, priority):
+        try:
+            final_state = await get_agent().ainvoke({"input_file": path, "risk_list": RiskTable(), "iteration": 0})
+        except Exception as e:
+            error = str(e)
+    return _document_result(run, final_state, time.monotonic() - start, error)
+
+def run_level(concurrency: int, paths: List[str], mode: str, priority: str) -> Dict:
+    """Analyse every path with `concurrency` documents in flight and summarize the level"""
+    from .concurrency import AIMDLimiter
+    from .scheduler import LLM_SCHEDULER
+
+    # Every level starts from the configured concurrency limits instead of what the last one learned
+    LLM_SCHEDULER.limiter = AIMDLimiter()
+    doc_ids = [os.path.splitext(os.path.basename(path))[0] for path in paths]
+    start = time.monotonic()
+    if mode == "async":
+        async def run_all():
+            slots = asyncio.Semaphore(concurrency)
+
+            async def run_one(path: str, doc_id: str) -> Dict:
+                async with slots:
+                    return await arun_document(path, doc_id, priority)
+
+            return await asyncio.gather(*(run_one(path, doc_id) for path, doc_id in zip(paths, doc_ids)))
+
+        results = asyncio.run(run_all())
+    else:
+        with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="loadtest") as executor:
+            results = list(executor.map(lambda item: run_document(item[0], item[1], priority), zip(paths, doc_ids)))
+    wall_s = time.monotonic() - start
+    return summarize(concurrency, results, wall_s, LLM_SCHEDULER.limiter.stats())
+
+def summarize(concurrency: int, results: List[Dict], wall_s: float, limits: Dict[str, Dict]) -> Dict:
+    done = [result for result in results if result["ok"]]
+    stages = {}
+    for stage in STAGES:
+        tokens = sum(result["tokens"].get(stage, 0) for result in results)
+        stages[stage] = {
+            **percentiles([result["stages"][stage] for result in done if stage in result["stages"]]),
+            "tokens_per_s": round(tokens / wall_s, 1) if wall_s else 0.0,
+        }
+    tokens = sum(sum(result["tokens"].values()) for result in results)
+    return {
+        "concurrency": concurrency,
+        "documents": len(results),
+        "failed": len(results) - len(done),
+        "wall_s": round(wall_s, 3),
+        "documents_per_hour": round(len(done) / wall_s * 3600, 1) if wall_s else 0.0,
+        "latency_s": percentiles([result["wall_s"] for result in done]),
+        "tokens_per_s": round(tokens / wall_s, 1) if wall_s else 0.0,
+        "llm": {field: sum(result["llm"][field] for result in results) for field in ("calls", "retries", "errors", "coalesced")},
+        "concurrency_limits": {model: stats["limit"] for model, stats in limits.items()},
+        "stages": stages,
+        "errors": sorted({result["error"] for result in results if result["error"]})[:5],
+    }
+
+def print_tables(levels: List[Dict], out=sys.stdout) -> None:
+    print(f"{'concurrency':>11} {'docs':>5} {'failed':>6} {'docs/hour':>10} {'p50 (s)':>8} {'p95 (s)':>8} "
+          f"{'p99 (s)':>8} {'tokens/s':>9} {'LLM calls':>9} {'retries':>7}", file=out)
+    for level in levels:
+        latency = level["latency_s"]
+        print(f"{level['concurrency']:>11} {level['documents']:>5} {level['failed']:>6} "
+              f"{level['documents_per_hour']:>10.1f} {latency['p50']:>8.2f} {latency['p95']:>8.2f} "
+              f"{latency['p99']:>8.2f} {level['tokens_per_s']:>9.1f} {level['llm']['calls']:>9} "
+              f"{level['llm']['retries']:>7}", file=out)
+    print(file=out)
+    print(f"{'concurrency':>11} {'stage':<16} {'p50 (s)':>8} {'p95 (s)':>8} {'p99 (s)':>8} {'tokens/s':>9}", file=out)
+    for level in levels:
+        for stage, stats in level["stages"].items():
+            print(f"{level['concurrency']:>11} {stage:<16} {stats['p50']:>8.2f} {stats['p95']:>8.2f} "
+                  f"{stats['p99']:>8.2f} {stats['tokens_per_s']:>9.1f}", file=out)
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Load test the compiled workflow against the offline fake backend",
+        epilog="Each concurrency level analyses its own fresh synthetic documents (built from the sample "
+               "Termo de Referência), so caches start cold and levels are comparable. Capacity models a "
+               "provider quota: calls beyond that many in flight per model get a 429."
+    )
+    parser.add_argument("--concurrency", type=int, nargs="+", default=DEFAULT_LEVELS,
+                        help="Documents in flight at each level of the sweep")
+    parser.add_argument("--documents", type=int, default=0,
+                        help="Documents per level (default: twice the concurrency, at least 4)")
+    parser.add_argument("--pages", type=int, default=0, help="Pages per synthetic document (default: the sample's)")
+    parser.add_argument("--mode", choices=["async", "thread"], default="async",
+                        help="Run documents on one event loop (like the service) or on threads (like the batch CLI)")
+    parser.add_argument("--priority", choices=["interactive", "batch"], default="batch", help="Scheduler priority of the documents")
+    parser.add_argument("--latency", type=float, default=0.5, help="Median fake LLM latency in seconds")
+    parser.add_argument("--latency-sigma", type=float, default=0.5, help="Log-normal spread of the latencies")
+    parser.add_argument("--tail-probability", type=float, default=0.0, help="Chance of a slow-tail LLM call")
+    parser.add_argument("--tail-multiplier", type=float, default=10.0, help="Latency multiplier of slow-tail calls")
+    parser.add_argument("--embedding-latency", type=float, default=0.05, help="Median fake embedding latency in seconds")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of LLM calls failing with a random 429")
+    parser.add_argument("--capacity", type=int, default=0, help="Concurrent calls per model before 429s (0: unlimited)")
+    parser.add_argument("--retry-after", type=float, default=1.0, help="Retry-after seconds of the injected 429s")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the fake backend")
+    parser.add_argument("--output", help="Write the results to this JSON file")
+    args = parser.parse_args()
+
+    # Same isolation as the benchmarks: no provider access, no quota sleeps, a
+    # throwaway cache, and no stored stage outputs, so every stage really runs.
+    # Only errors are logged, since every injected 429 logs a retry warning
+    os.environ.setdefault("RISK_AGENT_BACKEND", "fake")
+    os.environ.setdefault("RISK_AGENT_OFFLINE", "1")
+    os.environ.setdefault("RISK_AGENT_RATE_LIMITS", "0")
+    os.environ.setdefault("RISK_AGENT_STAGE_CACHE", "0")
+    os.environ.setdefault("RISK_AGENT_CACHE_DIR", tempfile.mkdtemp(prefix="loadtest-cache-"))
+    os.environ.setdefault("RISK_AGENT_LOG_LEVEL", "ERROR")
+
+    configure_backend(args)
+    workdir = tempfile.mkdtemp(prefix="loadtest-docs-")
+    levels = []
+    for concurrency in args.concurrency:
+        count = args.documents or max(4, 2 * concurrency)
+        paths = write_documents(os.path.join(workdir, f"c{concurrency}"), count, f"c{concurrency}", args.pages)
+        level = run_level(concurrency, paths, args.mode, args.priority)
+        levels.append(level)
+        print(f"concurrency {concurrency}: {level['documents_per_hour']:.0f} docs/hour, "
+              f"p95 {level['latency_s']['p95']:.2f}s, {level['failed']} failed", file=sys.stderr)
+
+    print_tables(levels)
+    if args.output:
+        config = {name: value for name, value in vars(args).items() if name != "output"}
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"config": config, "levels": levels}, f, indent=2, ensure_ascii=False)
+        print(f"\nResults written to: {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+import atexit
+import copy
+import logging
+import queue
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from logging.handlers import QueueHandler, QueueListener
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+LOG_FORMAT = "%(asctime)s - %(levelname)s - %(correlation)s%(message)s"
+DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+# Correlation fields (run, node, chunk...) of the code currently executing. Context
+# variables follow asyncio tasks and the LLM worker pool, which copies the context
+_log_fields: ContextVar[Tuple[Tuple[str, str], ...]] = ContextVar("log_fields", default=())
+
+@contextmanager
+def log_context(**fields: Any) -> Iterator[None]:
+    """Tag every record logged inside the block with the given fields, e.g. chunk="3/12" """
+    current = dict(_log_fields.get())
+    current.update((name, str(value)) for name, value in fields.items())
+    token = _log_fields.set(tuple(current.items()))
+    try:
+        yield
+    finally:
+        _log_fields.reset(token)
+
+def correlation_id() -> str:
+    """Current correlation fields as "run=... chunk=...", empty outside any log_context"""
+    return " ".join(f"{name}={value}" for name, value in _log_fields.get())
+
+class CorrelationFilter(logging.Filter):
+    """Adds `record.correlation` ("[run=... chunk=...] " or "") for the log format"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        fields = correlation_id()
+        record.correlation = f"[{fields}] " if fields else ""
+        return True
+
+class _DeferredQueueHandler(QueueHandler):
+    """Queue handler that only merges the message arguments in the logging thread
+
+    Timestamps, tracebacks (exc_info) and stream I/O are formatted by the
+    listener thread. Records never leave the process, so they are not made
+    picklable as the standard QueueHandler does.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+_listener: Optional[QueueListener] = None
+_installed: Optional[logging.Handler] = None
+_setup_lock = threading.Lock()
+
+def setup_logging(level: str = "INFO", use_queue: bool = True) -> None:
+    """Configure the root logger; safe to call again to change the settings
+
+    With use_queue, records are put on an in-process queue and written to
+    stderr by a QueueListener thread, so logging calls on worker threads and
+    the event loop never block on I/O. The listener is flushed at exit.
+    """
+    global _listener, _installed
+    with _setup_lock:
+        root = logging.getLogger()
+        if _installed is not None:
+            root.removeHandler(_installed)
+        if _listener is not None:
+            _listener.stop()
+            _listener = None
+
+        stream = logging.StreamHandler()
+        stream.setFormatter(logging.Formatter(LOG_FORMAT, DATE_FORMAT))
+        if use_queue:
+            log_queue: "queue.SimpleQueue[logging.LogRecord]" = queue.SimpleQueue()
+            handler: logging.Handler = _DeferredQueueHandler(log_queue)
+            _listener = QueueListener(log_queue, stream, respect_handler_level=True)
+            _listener.start()
+        else:
+            handler = stream
+        # Filters run in the calling thread, where the correlation context variables are set
+        handler.addFilter(CorrelationFilter())
+        root.addHandler(handler)
+        root.setLevel(level.upper() if isinstance(level, str) else level)
+        _installed = handler
+
+@atexit.register
+def _stop_listener() -> None:
+    """Flush queued records; a stopped listener cannot be stopped again, so it is dropped"""
+    global _listener
+    with _setup_lock:
+        if _listener is not None:
+            _listener.stop()
+            _listener = None
+
+class RateSampler:
+    """Lets through at most `rate` events per second per key and counts the others"""
+
+    def __init__(self, rate: float):
+        self.rate = rate
+        self._last: Dict[str, float] = {}
+        self._suppressed: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def allow(self, key: str) -> Optional[int]:
+        """None if the event is dropped, else the number dropped since the last one let through"""
+        now = time.monotonic()
+        with self._lock:
+            last = self._last.get(key)
+            if self.rate > 0 and last is not None and now - last < 1.0 / self.rate:
+                self._suppressed[key] = self._suppressed.get(key, 0) + 1
+                return None
+            self._last[key] = now
+            return self._suppressed.pop(key, 0)
+
+_payload_sampler = RateSampler(1.0)
+_payload_chars = 200
+
+def configure_payloads(rate: float, max_chars: int) -> None:
+    """Set the sampling rate (per second per key) and truncation of log_payload"""
+    global _payload_sampler, _payload_chars
+    _payload_sampler = RateSampler(rate)
+    _payload_chars = max_chars
+
+def log_payload(logger: logging.Logger, key: str, msg: str, *payloads: Any, level: int = logging.DEBUG) -> None:
+    """Log large values (contexts, raw responses) truncated and rate-sampled per key
+
+    Nothing is converted or truncated unless the level is enabled and the
+    sampler lets the record through; dropped records are counted in the next one.
+    """
+    if not logger.isEnabledFor(level):
+        return
+    suppressed = _payload_sampler.allow(key)
+    if suppressed is None:
+        return
+    args = tuple(str(payload)[:_payload_chars] for payload in payloads)
+    if suppressed:
+        msg += " (%d similar records dropped)"
+        args += (suppressed,)
+    logger.log(level, msg, *args, stacklevel=2)
@@ -1,54 +1,84 @@
 import os
 import json
-from src.assistant.configuration import logger
-from src.assistant.graph import create_workflow
+import argparse
+from functools import lru_cache
+from src.assistant.configuration import EXPORT_FORMATS, logger
+from src.assistant.records import RiskTable
+from src.assistant.metrics import start_run
+from src.assistant.delta import RunSnapshot, snapshot_path
+from src.assistant.export import WRITERS, export_report
+from src.assistant.scheduler import job_context
 
-# Initialize workflow graph
-workflow = create_workflow()
-agent = workflow.compile()
+@lru_cache(maxsize=None)
+def get_agent():
+    """Compile the workflow graph on first use"""
+    from src.assistant.graph import create_workflow
+    return create_workflow().compile()
+
+def __getattr__(name):
+    # `agent` is compiled lazily so importing this module stays cheap
+    if name == "agent":
+        return get_agent()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 # Export the agent for LangGraph Studio
 __all__ = ["agent"]
 
-def main():
+def main(argv=None):
+    # Get script directory and set up paths
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    parser = argparse.ArgumentParser(description="Analyse the risks of a Termo de Referência")
+    parser.add_argument("--input", default=os.path.join(script_dir, "documents", "TERMO_DE_REFERENCIA.pdf"),
+                        help="Document to analyse")
+    parser.add_argument("--output-dir", default=os.path.join(script_dir, "risk_analysis"),
+                        help="Where the report, its snapshot and run metrics are written")
+    parser.add_argument("--baseline", help="Snapshot of a previous run; only changed contexts are re-analysed")
+    parser.add_argument("--formats", nargs="+", choices=sorted(WRITERS), default=EXPORT_FORMATS,
+                        help="Report formats to write (default: RISK_AGENT_EXPORT_FORMATS)")
+    args = parser.parse_args(argv)
+
     try:
-        # Get script directory and set up paths
-        script_dir = os.path.dirname(os.path.abspath(__file__))
-        input_file = os.path.join(script_dir, "documents", "TERMO_DE_REFERENCIA.pdf")
-        output_dir = os.path.join(script_dir, "risk_analysis")
+        input_file = args.input
+        output_dir = args.output_dir
         
         logger.info(f"Using input file: {input_file}")
         
-        # Run the workflow
-        final_state = agent.invoke({
+        initial_state = {
             "input_file": input_file,
-            "risk_list": "",
+            "risk_list": RiskTable(),
             "iteration": 0
-        })
+        }
+        if args.baseline:
+            logger.info(f"Delta mode against baseline: {args.baseline}")
+            initial_state["baseline_file"] = args.baseline
+
+        # Run the workflow, collecting per-node and per-model metrics
+        with start_run() as run_metrics, job_context(run_metrics.run_id):
+            final_state = get_agent().invoke(initial_state)
         
         logger.info("Workflow completed successfully")
         
         # Save output
         os.makedirs(output_dir, exist_ok=True)
-        output_file = os.path.join(output_dir, "risk_analysis_report.json")
+        run_metrics.write(os.path.join(output_dir, "run_metrics.json"))
+        run_metrics.write(os.path.join(output_dir, "run_metrics.prom"))
+        report_base = os.path.join(output_dir, "risk_analysis_report")
         
-        # Parse the final risk list from the state
-        try:
-            # The risk_list should already be a JSON string from the optimizer
-            final_risks = json.loads(final_state["risk_list"])
-            
-            # Write with proper formatting
-            with open(output_file, "w", encoding="utf-8") as f:
-                json.dump(final_risks, f, ensure_ascii=False, indent=2)
-            
-            logger.info(f"Report saved to: {output_file}")
-            logger.info(f"Report contains {len(final_risks)} risks")
-            logger.info(f"Token usage by stage: {json.dumps(final_state['token_usage'], indent=2)}")
-            
-        except json.JSONDecodeError as e:
-            logger.error(f"Failed to parse final risks: {str(e)}")
-            logger.error(f"Raw content: {final_state['risk_list'][:500]}")
-            raise
+        # The risk_list is a RiskTable from the optimizer; JSON is produced only here
+        final_risks = final_state["risk_list"]
+        if not len(final_risks):
+            raise ValueError("Workflow produced no risks")
+
+        # Stream the report in each requested format (risk_analysis_report.<ext>)
+        exported = export_report(final_risks, report_base, args.formats)
+
+        # The snapshot lets the next version of this document run in delta mode
+        RunSnapshot.from_state(final_state).save(snapshot_path(report_base + ".json"))
+
+        logger.info(f"Report saved to: {', '.join(exported.values())}")
+        logger.info(f"Report contains {len(final_risks)} risks")
+        logger.info(f"Token usage by stage: {json.dumps(final_state.get('token_usage', {}), indent=2)}")
+        logger.info(f"Provider token totals: {run_metrics.token_totals()}")
             
         if final_state.get("validation_errors"):
             logger.warning(f"Validation errors: {final_state['validation_errors']}")
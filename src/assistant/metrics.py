@@ -0,0 +1,253 @@
+import asyncio
+import functools
+import json
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, Optional, Tuple
+from .logs import log_context
+
+def _escape_label(value: Any) -> str:
+    """Escape a label value for the Prometheus text format"""
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+class RunMetrics:
+    """Thread-safe collector of node and LLM call metrics for one run
+
+    Node stats are keyed by node name; LLM stats by (node, model). Gauges
+    hold point-in-time values such as concurrency limits.
+    """
+
+    LLM_FIELDS = ("calls", "coalesced", "errors", "retries", "hedges", "wall_s", "queue_wait_s",
+                  "prompt_tokens", "completion_tokens", "cached_prompt_tokens")
+
+    def __init__(self, run_id: Optional[str] = None):
+        self.run_id = run_id or uuid.uuid4().hex[:12]
+        self.started_at = time.time()
+        self.finished_at: Optional[float] = None
+        self.nodes: Dict[str, Dict[str, float]] = {}
+        self.llm: Dict[Tuple[str, str], Dict[str, float]] = {}
+        self.gauges: Dict[Tuple[str, str], float] = {}
+        self._lock = threading.Lock()
+
+    def _node_stats(self, node: str) -> Dict[str, float]:
+        return self.nodes.setdefault(node, {"calls": 0, "errors": 0, "wall_s": 0.0, "cache_hits": 0, "cache_misses": 0})
+
+    def record_node(self, node: str, wall_s: float, error: bool = False) -> None:
+        with self._lock:
+            stats = self._node_stats(node)
+            stats["calls"] += 1
+            stats["errors"] += int(error)
+            stats["wall_s"] += wall_s
+
+    def record_llm(self, node: str, model: str, wall_s: float, queue_wait_s: float = 0.0,
+                   retries: int = 0, hedges: int = 0, prompt_tokens: int = 0,
+                   completion_tokens: int = 0, cached_prompt_tokens: int = 0, error: bool = False,
+                   coalesced: int = 0) -> None:
+        with self._lock:
+            stats = self.llm.setdefault((node, model), dict.fromkeys(self.LLM_FIELDS, 0))
+            # Requests served by another caller's call are counted apart from provider calls
+            stats["calls"] += int(not coalesced)
+            stats["coalesced"] += coalesced
+            stats["errors"] += int(error)
+            stats["retries"] += retries
+            stats["hedges"] += hedges
+            stats["wall_s"] += wall_s
+            stats["queue_wait_s"] += queue_wait_s
+            stats["prompt_tokens"] += prompt_tokens
+            stats["completion_tokens"] += completion_tokens
+            stats["cached_prompt_tokens"] += cached_prompt_tokens
+
+    def record_cache(self, node: str, hit: bool) -> None:
+        with self._lock:
+            self._node_stats(node)["cache_hits" if hit else "cache_misses"] += 1
+
+    def set_gauge(self, name: str, label: str, value: float) -> None:
+        with self._lock:
+            self.gauges[(name, label)] = value
+
+    def token_totals(self) -> Dict[str, int]:
+        """Prompt, completion and cached prompt tokens summed over all LLM calls"""
+        with self._lock:
+            return {
+                field: int(sum(s[field] for s in self.llm.values()))
+                for field in ("prompt_tokens", "completion_tokens", "cached_prompt_tokens")
+            }
+
+    def to_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "run_id": self.run_id,
+                "started_at": self.started_at,
+                "finished_at": self.finished_at,
+                "wall_s": (self.finished_at or time.time()) - self.started_at,
+                "nodes": {name: dict(stats) for name, stats in self.nodes.items()},
+                "llm": [
+                    {"node": node, "model": model, **stats}
+                    for (node, model), stats in self.llm.items()
+                ],
+                "gauges": [
+                    {"name": name, "label": label, "value": value}
+                    for (name, label), value in self.gauges.items()
+                ],
+            }
+
+    def to_json(self, indent: Optional[int] = 2) -> str:
+        return json.dumps(self.to_dict(), indent=indent)
+
+    def to_prometheus(self, prefix: str = "risk_agent") -> str:
+        """Render the metrics in the Prometheus text exposition format"""
+        data = self.to_dict()
+        lines = []
+
+        def family(name: str, kind: str, help_text: str, samples):
+            lines.append(f"# HELP {prefix}_{name} {help_text}")
+            lines.append(f"# TYPE {prefix}_{name} {kind}")
+            for labels, value in samples:
+                rendered = ",".join(f'{key}="{_escape_label(val)}"' for key, val in
+                                    {"run_id": data["run_id"], **labels}.items())
+                lines.append(f"{prefix}_{name}{{{rendered}}} {value}")
+
+        family("node_calls_total", "counter", "Graph node executions",
+               [({"node": n}, s["calls"]) for n, s in data["nodes"].items()])
+        family("node_errors_total", "counter", "Graph node executions that raised",
+               [({"node": n}, s["errors"]) for n, s in data["nodes"].items()])
+        family("node_seconds_total", "counter", "Wall time spent in graph nodes",
+               [({"node": n}, round(s["wall_s"], 6)) for n, s in data["nodes"].items()])
+        family("node_cache_hits_total", "counter", "Graph node executions served from the stage cache",
+               [({"node": n}, s["cache_hits"]) for n, s in data["nodes"].items()])
+        family("node_cache_misses_total", "counter", "Graph node executions that missed the stage cache",
+               [({"node": n}, s["cache_misses"]) for n, s in data["nodes"].items()])
+
+        help_texts = {
+            "calls": "LLM calls",
+            "coalesced": "LLM requests served by an identical call already in flight",
+            "errors": "LLM calls that failed after retries",
+            "retries": "LLM call retries",
+            "hedges": "Hedged duplicate LLM requests",
+            "wall_s": "Wall time spent in LLM calls",
+            "queue_wait_s": "Time LLM calls waited for a scheduler slot and a worker before starting",
+            "prompt_tokens": "Prompt tokens reported by the provider",
+            "completion_tokens": "Completion tokens reported by the provider",
+            "cached_prompt_tokens": "Prompt tokens served from cached prompt prefixes",
+        }
+        for field, help_text in help_texts.items():
+            name = field[:-2] + "_seconds" if field.endswith("_s") else field
+            family(f"llm_{name}_total", "counter", help_text, [
+                ({"node": s["node"], "model": s["model"]}, round(s[field], 6))
+                for s in data["llm"]
+            ])
+
+        for name in sorted({g["name"] for g in data["gauges"]}):
+            family(name, "gauge", name.replace("_", " ").capitalize(), [
+                ({"label": g["label"]}, g["value"]) for g in data["gauges"] if g["name"] == name
+            ])
+        return "\n".join(lines) + "\n"
+
+    def write(self, path: str) -> None:
+        """Write the metrics as JSON, or Prometheus text for .prom/.txt paths"""
+        text = self.to_prometheus() if path.endswith((".prom", ".txt")) else self.to_json()
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(text)
+
+# Process-wide totals, plus the collector of the run currently executing
+PROCESS_METRICS = RunMetrics(run_id="process")
+_current_run: ContextVar[Optional[RunMetrics]] = ContextVar("current_run", default=None)
+_current_node: ContextVar[str] = ContextVar("current_node", default="")
+
+def current_run() -> Optional[RunMetrics]:
+    return _current_run.get()
+
+def current_node() -> str:
+    return _current_node.get()
+
+def _collectors():
+    run = _current_run.get()
+    return (PROCESS_METRICS, run) if run is not None else (PROCESS_METRICS,)
+
+@contextmanager
+def start_run(run_id: Optional[str] = None) -> Iterator[RunMetrics]:
+    """Collect metrics for everything executed inside the block, logged with its run id"""
+    metrics = RunMetrics(run_id)
+    token = _current_run.set(metrics)
+    try:
+        with log_context(run=metrics.run_id):
+            yield metrics
+    finally:
+        metrics.finished_at = time.time()
+        _current_run.reset(token)
+
+def record_llm_call(model: str, **stats) -> None:
+    node = _current_node.get() or "unknown"
+    for collector in _collectors():
+        collector.record_llm(node, model, **stats)
+
+def record_cache(node: str, hit: bool) -> None:
+    for collector in _collectors():
+        collector.record_cache(node, hit)
+
+def set_gauge(name: str, label: str, value: float) -> None:
+    for collector in _collectors():
+        collector.set_gauge(name, label, value)
+
+def extract_token_usage(response: Any) -> Tuple[int, int]:
+    """Provider-reported (prompt, completion) token counts of a chat response"""
+    usage = getattr(response, "usage_metadata", None)
+    if usage:
+        return int(usage.get("input_tokens", 0)), int(usage.get("output_tokens", 0))
+    metadata = getattr(response, "response_metadata", None) or {}
+    usage = metadata.get("usage_metadata") or metadata.get("token_usage") or {}
+    prompt = usage.get("prompt_token_count", usage.get("prompt_tokens", 0))
+    completion = usage.get("candidates_token_count", usage.get("completion_tokens", 0))
+    return int(prompt or 0), int(completion or 0)
+
+def extract_cached_tokens(response: Any) -> int:
+    """Prompt tokens the provider read from cached content instead of the request"""
+    usage = getattr(response, "usage_metadata", None)
+    if usage:
+        return int((usage.get("input_token_details") or {}).get("cache_read", 0) or 0)
+    metadata = getattr(response, "response_metadata", None) or {}
+    usage = metadata.get("usage_metadata") or {}
+    return int(usage.get("cached_content_token_count", 0) or 0)
+
+def instrument_node(name: str, func):
+    """Wrap a graph node (sync or async) so its wall time and LLM calls are attributed to it"""
+    def record(start: float, failed: bool) -> None:
+        elapsed = time.perf_counter() - start
+        for collector in _collectors():
+            collector.record_node(name, elapsed, error=failed)
+
+    if asyncio.iscoroutinefunction(func):
+        @functools.wraps(func)
+        async def async_wrapper(state, *args, **kwargs):
+            token = _current_node.set(name)
+            start = time.perf_counter()
+            failed = False
+            try:
+                with log_context(node=name):
+                    return await func(state, *args, **kwargs)
+            except Exception:
+                failed = True
+                raise
+            finally:
+                record(start, failed)
+                _current_node.reset(token)
+        return async_wrapper
+
+    @functools.wraps(func)
+    def wrapper(state, *args, **kwargs):
+        token = _current_node.set(name)
+        start = time.perf_counter()
+        failed = False
+        try:
+            with log_context(node=name):
+                return func(state, *args, **kwargs)
+        except Exception:
+            failed = True
+            raise
+        finally:
+            record(start, failed)
+            _current_node.reset(token)
+    return wrapper
@@ -0,0 +1,207 @@
+import asyncio
+import contextlib
+import cProfile
+import functools
+import io
+import itertools
+import os
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+from contextvars import ContextVar
+from typing import Callable, Dict, Iterable, List, Optional, Set, TypeVar
+from .configuration import PROFILE_DIR, PROFILE_NODES, logger
+
+# Before Python 3.12 each thread has its own profiler hook, so nodes on different
+# threads are profiled concurrently. From 3.12 cProfile uses sys.monitoring, which
+# allows one profiler per process, and profiled calls are serialized on this lock
+PROCESS_WIDE_PROFILER = sys.version_info >= (3, 12)
+_profile_lock = threading.Lock()
+
+# tracemalloc is process-wide: the first profiled call starts it, the last one stops it
+_tracing_lock = threading.Lock()
+_tracing = {"users": 0, "started": False}
+
+def _start_tracing() -> None:
+    with _tracing_lock:
+        if not _tracing["users"] and not tracemalloc.is_tracing():
+            tracemalloc.start(25)
+            _tracing["started"] = True
+        _tracing["users"] += 1
+
+def _stop_tracing() -> None:
+    with _tracing_lock:
+        _tracing["users"] -= 1
+        if not _tracing["users"] and _tracing["started"]:
+            tracemalloc.stop()
+            _tracing["started"] = False
+
+# Profiles of LLM pool calls submitted by the sync node being profiled. The
+# pool copies the submitting context, so worker threads see the node's list
+_worker_profiles: ContextVar[Optional[List[cProfile.Profile]]] = ContextVar("worker_profiles", default=None)
+
+T = TypeVar("T")
+
+def profile_worker(fn: Callable[[], T]) -> T:
+    """Run fn, profiled into the submitting node's profile when that node is being profiled
+
+    Used by the LLM call pool: cProfile only sees the thread it runs on, so
+    without this a sync node's profile would leave out its model calls.
+    """
+    profiles = _worker_profiles.get()
+    if profiles is None:
+        return fn()
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError:
+        # Python 3.12+ allows one active profiler per process: the node's
+        return fn()
+    try:
+        return fn()
+    finally:
+        profiler.disable()
+        profiles.append(profiler)
+
+# Per event loop thread: async node calls in flight, and the one being
+# profiled with the number of other node calls that overlapped it
+_loops: Dict[int, Dict] = {}
+_loops_lock = threading.Lock()
+
+def _enter_loop_node() -> Optional[Dict[str, int]]:
+    """Count an async node call on this thread's loop; return a profile session if it can be profiled"""
+    thread = threading.get_ident()
+    with _loops_lock:
+        loop = _loops.setdefault(thread, {"calls": 0, "profile": None})
+        loop["calls"] += 1
+        if loop["profile"] is not None:
+            loop["profile"]["overlapped"] += 1
+            return None
+        if PROCESS_WIDE_PROFILER and not _profile_lock.acquire(blocking=False):
+            return None
+        # Calls already awaiting on the loop overlap this profile too
+        loop["profile"] = {"overlapped": loop["calls"] - 1}
+        return loop["profile"]
+
+def _exit_loop_node(profiled: bool) -> None:
+    thread = threading.get_ident()
+    with _loops_lock:
+        loop = _loops[thread]
+        loop["calls"] -= 1
+        if profiled:
+            loop["profile"] = None
+            if PROCESS_WIDE_PROFILER:
+                _profile_lock.release()
+        if not loop["calls"]:
+            del _loops[thread]
+
+def profiled_nodes(setting: Optional[str] = None, nodes: Iterable[str] = ()) -> Set[str]:
+    """Resolve a RISK_AGENT_PROFILE style setting into the set of node names to profile"""
+    setting = (PROFILE_NODES if setting is None else setting).strip()
+    if not setting or setting == "0":
+        return set()
+    if setting.lower() in ("1", "all", "true"):
+        return set(nodes)
+    return {name.strip() for name in setting.split(",") if name.strip()}
+
+def new_profile_dir(base_dir: Optional[str] = None) -> str:
+    """Timestamped directory for one run's profiles"""
+    path = os.path.join(base_dir or PROFILE_DIR, time.strftime("%Y%m%d-%H%M%S"))
+    os.makedirs(path, exist_ok=True)
+    return path
+
+def profile_node(name: str, func, output_dir: str, top: int = 25):
+    """Wrap a graph node with cProfile and tracemalloc
+
+    Each call writes `<node>-<n>.pstats`, a tracemalloc snapshot
+    `<node>-<n>.tracemalloc` and a short text summary of the hottest functions
+    and largest allocation sites to output_dir. Sync nodes running on
+    different threads are profiled concurrently (one at a time on Python
+    3.12+); allocations and peak memory are process-wide, so they include
+    whatever ran alongside the node. LLM calls a sync node runs on the call
+    pool are profiled on their worker threads and merged into its profile;
+    on Python 3.12+ they are left out when the profiler cannot be shared.
+
+    An async node is profiled on its event loop's thread from its start to
+    its end, so the profile covers the whole loop: every coroutine that runs
+    while the node awaits is recorded too. One async node per loop is
+    profiled at a time; profiled-node calls overlapping it run unprofiled
+    and are counted in its summary.
+    """
+    calls = itertools.count(1)
+
+    def begin():
+        stem = os.path.join(output_dir, f"{name}-{next(calls)}")
+        _start_tracing()
+        return stem, cProfile.Profile(), time.perf_counter()
+
+    def end(stem, profiler, start, scope=None, workers=()):
+        elapsed = time.perf_counter() - start
+        try:
+            snapshot = tracemalloc.take_snapshot()
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            _stop_tracing()
+        try:
+            _write_profile(stem, name, profiler, snapshot, elapsed, peak, top, scope, workers)
+        except Exception as e:
+            logger.error(f"[Profile] Failed to write profile for {name}: {str(e)}")
+
+    if asyncio.iscoroutinefunction(func):
+        @functools.wraps(func)
+        async def async_wrapper(state, *args, **kwargs):
+            loop_profile = _enter_loop_node()
+            try:
+                if loop_profile is None:
+                    return await func(state, *args, **kwargs)
+                session = begin()
+                profiler = session[1]
+                profiler.enable()
+                try:
+                    return await func(state, *args, **kwargs)
+                finally:
+                    profiler.disable()
+                    end(*session, scope=f"whole event loop, {loop_profile['overlapped']} other node calls overlapped")
+            finally:
+                _exit_loop_node(loop_profile is not None)
+        return async_wrapper
+
+    @functools.wraps(func)
+    def wrapper(state, *args, **kwargs):
+        with _profile_lock if PROCESS_WIDE_PROFILER else contextlib.nullcontext():
+            session = begin()
+            workers: List[cProfile.Profile] = []
+            token = _worker_profiles.set(workers)
+            try:
+                return session[1].runcall(func, state, *args, **kwargs)
+            finally:
+                _worker_profiles.reset(token)
+                # Calls still running on the pool after the node returned are not included
+                workers = list(workers)
+                end(*session, scope=f"node thread and {len(workers)} LLM pool calls" if workers else None,
+                    workers=workers)
+    return wrapper
+
+def _write_profile(stem: str, name: str, profiler: cProfile.Profile, snapshot,
+                   elapsed: float, peak: int, top: int, scope: Optional[str] = None,
+                   workers: Iterable[cProfile.Profile] = ()) -> None:
+    stream = io.StringIO()
+    stats = pstats.Stats(profiler, *workers, stream=stream)
+    stats.dump_stats(f"{stem}.pstats")
+    snapshot.dump(f"{stem}.tracemalloc")
+
+    stream.write(f"node: {name}\n")
+    if scope:
+        stream.write(f"scope: {scope}\n")
+    stream.write(f"wall: {elapsed:.3f}s\npeak traced memory: {peak / (1024 * 1024):.2f} MiB\n\n")
+    stats.sort_stats("cumulative").print_stats(top)
+    stream.write("\nTop allocation sites:\n")
+    for stat in snapshot.statistics("lineno")[:top]:
+        stream.write(f"{stat}\n")
+    with open(f"{stem}.txt", "w", encoding="utf-8") as f:
+        f.write(stream.getvalue())
+
+    scope_note = f" ({scope})" if scope else ""
+    logger.info(f"[Profile] {name}{scope_note}: {elapsed:.3f}s, peak {peak / (1024 * 1024):.1f} MiB -> {stem}.pstats")
@@ -0,0 +1,127 @@
+import asyncio
+import threading
+import time
+from typing import Any, Dict, Optional, Tuple
+from .configuration import (
+    PROMPT_CACHE_ENABLED,
+    PROMPT_CACHE_MIN_TOKENS,
+    PROMPT_CACHE_TTL,
+    logger,
+)
+from .llm import model_key
+from .prompts import PromptParts
+
+# Experimental and thinking models cannot use cached content; only stable Gemini models can
+UNCACHEABLE_MODEL_MARKERS = ("-exp", "thinking")
+
+def supports_cached_content(model: str) -> bool:
+    return not any(marker in model for marker in UNCACHEABLE_MODEL_MARKERS)
+
+def _create_gemini_cache(llm: Any, prefix: str, ttl: int, min_tokens: int = PROMPT_CACHE_MIN_TOKENS) -> Optional[str]:
+    """Create the cached content through the chat model's own client, so the
+    name is valid on the API its calls go to"""
+    model = llm.model.removeprefix("models/")
+    if not supports_cached_content(model):
+        logger.info(f"[PromptCache] {model}: no cached content for experimental models, sending full prompts")
+        return None
+
+    # Gemini rejects cached content below a minimum size; skip the upload instead of failing it
+    tokens = llm.get_num_tokens(prefix)
+    if tokens < min_tokens:
+        logger.info(f"[PromptCache] {model}: prompt prefix has {tokens} tokens, below the "
+                    f"{min_tokens} cacheable minimum, sending full prompts")
+        return None
+
+    from langchain_core.messages import HumanMessage
+    from langchain_google_genai import create_context_cache
+
+    return create_context_cache(llm, [HumanMessage(content=prefix)], ttl=f"{ttl}s")
+
+def create_cached_content(llm: Any, prefix: str, ttl: int) -> Optional[str]:
+    """Upload a prompt prefix as provider cached content and return its name
+
+    Models exposing `create_cached_content` (the fake backend) handle it
+    themselves. Returns None when the provider or model has no cached
+    content or rejects the prefix (e.g. below its minimum cacheable size).
+    """
+    try:
+        create = getattr(llm, "create_cached_content", None)
+        if create is not None:
+            return create(prefix, ttl=ttl)
+        if type(llm).__name__ == "ChatGoogleGenerativeAI":
+            return _create_gemini_cache(llm, prefix, ttl)
+    except Exception as e:
+        logger.warning(f"[PromptCache] {model_key(llm)}: cached content unavailable, sending full prompts ({str(e)})")
+    return None
+
+class PromptCache:
+    """Cached content names per (model, prefix digest), refreshed before they expire
+
+    Failed uploads are remembered for the same period, so an unsupported
+    model costs one attempt per TTL rather than one per call. Concurrent
+    chunks needing the same entry share one upload; other entries are not
+    held up by it.
+    """
+
+    def __init__(self, ttl: int = PROMPT_CACHE_TTL):
+        self.ttl = ttl
+        self._entries: Dict[Tuple[str, str], Tuple[Optional[str], float]] = {}
+        self._lock = threading.Lock()
+        self._upload_locks: Dict[Tuple[str, str], threading.Lock] = {}
+
+    def _fresh(self, key: Tuple[str, str]) -> Optional[Tuple[Optional[str], float]]:
+        """The (name, refresh time) entry of key, unless it is due for a refresh"""
+        with self._lock:
+            entry = self._entries.get(key)
+        return entry if entry is not None and entry[1] > time.monotonic() else None
+
+    def lookup(self, llm: Any, parts: PromptParts) -> Optional[Tuple[Optional[str], float]]:
+        """The fresh entry for llm and parts, without uploading; None when an upload is due"""
+        return self._fresh((model_key(llm), parts.digest))
+
+    def get(self, llm: Any, parts: PromptParts) -> Optional[str]:
+        key = (model_key(llm), parts.digest)
+        entry = self._fresh(key)
+        if entry is not None:
+            return entry[0]
+
+        with self._lock:
+            upload_lock = self._upload_locks.setdefault(key, threading.Lock())
+        with upload_lock:
+            # A caller that waited on this lock finds the entry the previous holder stored
+            entry = self._fresh(key)
+            if entry is not None:
+                return entry[0]
+            name = create_cached_content(llm, parts.prefix, self.ttl)
+            if name:
+                logger.info(f"[PromptCache] {key[0]}: cached prompt prefix {parts.digest} as {name}")
+            with self._lock:
+                self._entries[key] = (name, time.monotonic() + self.ttl * 0.9)
+            return name
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+PROMPT_CACHE = PromptCache()
+
+def _bind(prompt, llm, parts: PromptParts, name: Optional[str]):
+    if name is None:
+        return prompt | llm
+    return parts.suffix | llm.bind(cached_content=name)
+
+def prompt_chain(prompt, llm, parts: Optional[PromptParts] = None):
+    """`prompt | llm`, or `suffix | llm` bound to the cached prefix when one is available"""
+    if parts is None or not PROMPT_CACHE_ENABLED:
+        return prompt | llm
+    return _bind(prompt, llm, parts, PROMPT_CACHE.get(llm, parts))
+
+async def aprompt_chain(prompt, llm, parts: Optional[PromptParts] = None):
+    """Async prompt_chain; only an upload runs in a worker thread"""
+    if parts is None or not PROMPT_CACHE_ENABLED:
+        return prompt | llm
+    entry = PROMPT_CACHE.lookup(llm, parts)
+    if entry is not None:
+        return _bind(prompt, llm, parts, entry[0])
+    name = await asyncio.to_thread(PROMPT_CACHE.get, llm, parts)
+    return _bind(prompt, llm, parts, name)
@@ -1,4 +1,28 @@
-from langchain_core.prompts import ChatPromptTemplate
+import hashlib
+from langchain_core.prompts import ChatPromptTemplate, PromptTemplate
+
+class PromptParts:
+    """A single-message prompt split into a static prefix and a variable suffix
+
+    `prefix` is the rendered text before the paragraph holding the variable
+    (instructions, scales, example output) and is identical for every call;
+    `suffix` is the template for the rest.
+    """
+
+    def __init__(self, prefix: str, suffix: ChatPromptTemplate):
+        self.prefix = prefix
+        self.suffix = suffix
+        self.digest = hashlib.sha256(prefix.encode("utf-8")).hexdigest()[:16]
+
+def split_prompt(prompt: ChatPromptTemplate, variable: str) -> PromptParts:
+    """Split prompt at the last blank line before `{variable}`"""
+    template = prompt.messages[0].prompt.template
+    position = template.index("{" + variable + "}")
+    cut = template.rfind("\n\n", 0, position)
+    prefix = PromptTemplate.from_template(template[:cut])
+    if cut < 0 or prefix.input_variables:
+        raise ValueError(f"Prompt has no static prefix before {{{variable}}}")
+    return PromptParts(prefix.format(), ChatPromptTemplate.from_template(template[cut:].lstrip("\n")))
 
 CREATOR_PROMPT = ChatPromptTemplate.from_template(
     """Você é um especialista em análise de riscos 
@@ -7,12 +31,12 @@ CREATOR_PROMPT = ChatPromptTemplate.from_template(
     SIGNIFICATIVOS que possam afetar a contratação e a implementação bem-sucedida 
     da solução de TIC para o objeto.
 
-    Você irá relacionar os riscos às seguintes categorias:
-    - Planejamento da Contratação: Riscos relacionados à especificação e planejamento da contratação.
-    - Seleção do Fornecedor: Riscos que precisam tratados no momento que 
+    Você irá relacionar os riscos às seguintes categorias (código entre parênteses):
+    - Planejamento da Contratação (PC): Riscos relacionados à especificação e planejamento da contratação.
+    - Seleção do Fornecedor (SF): Riscos que precisam tratados no momento que 
      a proposta do fornecedor for selecionada.
-    - Gestão Contratual: Riscos que podem ocorrer durante a execução do contrato.
-    - Solução Tecnológica: Riscos que estão vinculados as tecnologias e não podem 
+    - Gestão Contratual (GC): Riscos que podem ocorrer durante a execução do contrato.
+    - Solução Tecnológica (ST): Riscos que estão vinculados as tecnologias e não podem 
     ser classificados em Planejamento da Contratação ou Seleção do Fornecedor.
 
     Metodologia a ser seguida (utilize a cadeia de pensamento passo a passo):
@@ -34,22 +58,14 @@ CREATOR_PROMPT = ChatPromptTemplate.from_template(
 
     Após concluir a análise, apresente a lista de riscos, 
     onde cada risco deve ser descrito como um evento específico. 
-    Utilize o formato abaixo para a saída:
+    Utilize o formato abaixo para a saída: um array JSON com uma linha
+    [código da categoria, descrição do risco] por risco.
 
     Exemplo de saída:
     [
-        {{
-            "Risco": "Atraso na entrega do componente de hardware crítico X devido a problemas de produção do fornecedor.",
-            "Relacionado ao": "Planejamento da Contratação"
-        }},
-        {{
-            "Risco": "Alteração do escopo dos serviços a serem contratados devido a mudanças nos requisitos do Termo de Referência.",
-            "Relacionado ao": "Planejamento da Contratação"
-        }},
-        {{
-            "Risco": "Falta de clareza nos requisitos técnicos específicos, resultando em falhas na integração com sistemas existentes.",
-            "Relacionado ao": "Solução Tecnológica"
-        }}
+    ["PC","Atraso na entrega do componente de hardware crítico X devido a problemas de produção do fornecedor."],
+    ["PC","Alteração do escopo dos serviços a serem contratados devido a mudanças nos requisitos do Termo de Referência."],
+    ["ST","Falta de clareza nos requisitos técnicos específicos, resultando em falhas na integração com sistemas existentes."]
     ]
 
     Observação: Não inclua o campo "Id" na saída, ele será adicionado automaticamente.
@@ -111,41 +127,18 @@ EVALUATOR_PROMPT = ChatPromptTemplate.from_template(
         Atribua uma pontuação de 1 a 5.
 
     3. **Compilação dos Resultados:**  
-    - Para cada risco, acrescente na lista de riscos os seguintes campos:
-        - A pontuação de probabilidade  
-        - A pontuação de impacto financeiro  
-        - A pontuação de impacto no cronograma  
-        - A pontuação de impacto reputacional
+    - A <LISTA DE RISCOS> tem uma linha [Id, código da categoria, risco] por risco
+      (PC = Planejamento da Contratação, SF = Seleção do Fornecedor,
+      GC = Gestão Contratual, ST = Solução Tecnológica).
+    - Para cada risco, retorne uma linha com o Id e as pontuações, nesta ordem:
+      [Id, Probabilidade, Impacto Financeiro, Impacto no Cronograma, Impacto Reputacional]
+    - Não repita o texto do risco nem a categoria.
 
     <EXEMPLO DE SAÍDA>
     [
-        {{
-            "Id": "R01",
-            "Risco": "Atraso na entrega do componente de hardware crítico X devido a problemas de produção do fornecedor.",
-            "Relacionado ao": "Planejamento da Contratação",
-            "Probabilidade": 4,
-            "Impacto Financeiro": 2,
-            "Impacto no Cronograma": 0,
-            "Impacto Reputacional": 1
-        }},
-        {{
-            "Id": "R02",
-            "Risco": "Alteração do escopo dos serviços a serem contratados devido a mudanças nos requisitos do Termo de Referência.",
-            "Relacionado ao": "Planejamento da Contratação",
-            "Probabilidade": 3,
-            "Impacto Financeiro": 0,
-            "Impacto no Cronograma": 2,
-            "Impacto Reputacional": 3
-        }},
-        {{
-            "Id": "R03",
-            "Risco": "Falta de clareza nos requisitos técnicos específicos, resultando em falhas na integração com sistemas existentes.",
-            "Relacionado ao": "Qualidade da Solução",
-            "Probabilidade": 2,
-            "Impacto Financeiro": 3,
-            "Impacto no Cronograma": 1,
-            "Impacto Reputacional": 0
-        }}
+    ["R01",4,2,0,1],
+    ["R02",3,0,2,3],
+    ["R03",2,3,1,0]
     ]
     </EXEMPLO DE SAÍDA>
 
@@ -164,7 +157,7 @@ OPTIMIZER_PROMPT = ChatPromptTemplate.from_template(
     """Você é um especialista em otimizar levantamentos de riscos. 
     Sua tarefa é calcular a pontuação final e classificar o nível de cada risco.
     
-    IMPORTANTE: Retorne apenas o array JSON com os riscos otimizados, sem explicações adicionais.
+    IMPORTANTE: Retorne apenas o array JSON com as linhas dos riscos otimizados, sem explicações adicionais.
     
     1. **Cálculo da Pontuação Geral**  
     Pontuação Geral = (Soma dos Impactos) * Probabilidade
@@ -177,65 +170,28 @@ OPTIMIZER_PROMPT = ChatPromptTemplate.from_template(
         - **Baixo:** se Pontuação Geral <= 10
 
     3. **Validação e Completação dos Campos Obrigatórios**  
-    Verifique se o JSON de entrada contém os seguintes campos para cada risco:
-        - Id  
-        - Risco  
-        - Relacionado ao  
-        - Probabilidade  
-        - Impacto Financeiro  
-        - Impacto no Cronograma  
-        - Impacto Reputacional  
-        - Impacto Geral  
-        - Pontuação Geral  
-        - Nível de Risco  
-
-    Caso algum campo esteja ausente ou vazio, preencha-o com um valor adequado. 
+    A <LISTA DE RISCOS> tem uma linha por risco com os campos
+    [Id, código da categoria, Risco, Probabilidade, Impacto Financeiro,
+    Impacto no Cronograma, Impacto Reputacional]
+    (PC = Planejamento da Contratação, SF = Seleção do Fornecedor,
+    GC = Gestão Contratual, ST = Solução Tecnológica).
+
+    Caso alguma pontuação esteja ausente ou vazia, preencha-a com um valor adequado. 
     Faça a sua experiente avaliação. LEMBRE: campos em NULL para Impacto são relativos a 
     impactos não relevantes.
 
     4. **Geração do Arquivo JSON Final**  
-    Após realizar os cálculos e validações, gere um arquivo JSON 
-    contendo a lista completa dos riscos 
-    com todos os campos preenchidos, seguindo o exemplo abaixo:
+    Após realizar os cálculos e validações, gere um array JSON com uma linha por risco
+    contendo o Id e as pontuações revisadas, nesta ordem:
+    [Id, Probabilidade, Impacto Financeiro, Impacto no Cronograma, Impacto Reputacional]
+    Não repita o texto do risco nem a categoria; a Pontuação Geral e o Nível de Risco
+    são recalculados localmente a partir dessas pontuações.
 
     <EXEMPLO DE SAÍDA>
     [
-        {{
-            "Id": "R01",
-            "Risco": "Atraso na entrega do componente de hardware crítico X devido a problemas de produção do fornecedor.",
-            "Relacionado ao": "Planejamento da Contratação",
-            "Probabilidade": 4,
-            "Impacto Financeiro": 2,
-            "Impacto no Cronograma": 0,
-            "Impacto Reputacional": 1,
-            "Impacto Geral": 3,
-            "Pontuação Geral": 12,
-            "Nível de Risco": "Alto"
-        }},
-        {{
-            "Id": "R02",
-            "Risco": "Alteração do escopo dos serviços a serem contratados devido a mudanças nos requisitos do Termo de Referência.",
-            "Relacionado ao": "Planejamento da Contratação",
-            "Probabilidade": 3,
-            "Impacto Financeiro": 0,
-            "Impacto no Cronograma": 2,
-            "Impacto Reputacional": 3,
-            "Impacto Geral": 5,
-            "Pontuação Geral": 15,
-            "Nível de Risco": "Alto"
-        }},
-        {{
-            "Id": "R03",
-            "Risco": "Falta de clareza nos requisitos técnicos específicos, resultando em falhas na integração com sistemas existentes.",
-            "Relacionado ao": "Qualidade da Solução",
-            "Probabilidade": 2,
-            "Impacto Financeiro": 3,
-            "Impacto no Cronograma": 1,
-            "Impacto Reputacional": 0,
-            "Impacto Geral": 4,
-            "Pontuação Geral": 8,
-            "Nível de Risco": "Médio"
-        }}
+    ["R01",4,2,0,1],
+    ["R02",3,0,2,3],
+    ["R03",2,3,1,0]
     ]
     </EXEMPLO DE SAÍDA>
 
@@ -245,3 +201,7 @@ OPTIMIZER_PROMPT = ChatPromptTemplate.from_template(
     {risk_analysis}
     </LISTA DE RISCOS>"""
 )
+
+# Static prefixes sent once as provider cached content (see prompt_cache.py)
+CREATOR_PROMPT_PARTS = split_prompt(CREATOR_PROMPT, "context")
+EVALUATOR_PROMPT_PARTS = split_prompt(EVALUATOR_PROMPT, "risk_list")
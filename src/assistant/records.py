@@ -0,0 +1,161 @@
+import json
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence
+import numpy as np
+
+RISK_FIELDS = [
+    "Id",
+    "Risco",
+    "Relacionado ao",
+    "Probabilidade",
+    "Impacto Financeiro",
+    "Impacto no Cronograma",
+    "Impacto Reputacional",
+    "Impacto Geral",
+    "Pontuação Geral",
+    "Nível de Risco",
+]
+
+IMPACT_FIELDS = ["Impacto Financeiro", "Impacto no Cronograma", "Impacto Reputacional"]
+
+# Field variants produced by the models, mapped to their canonical name
+FIELD_ALIASES = {
+    "Relacionado": "Relacionado ao",
+}
+
+class RiskTable:
+    """Struct-of-arrays container for risk records
+
+    Each field is stored as one column (a list or NumPy array) so records can
+    flow through the graph without being serialized between stages. JSON is
+    only produced when rendering prompts or exporting reports.
+    """
+
+    __slots__ = ("columns", "_length")
+
+    def __init__(self, columns: Optional[Dict[str, Sequence]] = None):
+        self.columns: Dict[str, Sequence] = dict(columns or {})
+        lengths = {len(values) for values in self.columns.values()}
+        if len(lengths) > 1:
+            raise ValueError(f"Columns have different lengths: {sorted(lengths)}")
+        self._length = lengths.pop() if lengths else 0
+
+    @classmethod
+    def from_records(cls, records: Iterable[Dict]) -> "RiskTable":
+        """Build a table from dict records, normalizing field name variants"""
+        records = list(records)
+        columns: Dict[str, list] = {}
+        for index, record in enumerate(records):
+            for key, value in record.items():
+                alias = key in FIELD_ALIASES
+                key = FIELD_ALIASES.get(key, key)
+                column = columns.get(key)
+                if column is None:
+                    column = columns[key] = [None] * len(records)
+                # Canonical field names win over their variants
+                if not alias or column[index] is None:
+                    column[index] = value
+        return cls(columns)
+
+    @classmethod
+    def from_json(cls, text: str) -> "RiskTable":
+        return cls.from_records(json.loads(text)) if text else cls()
+
+    @classmethod
+    def from_dataframe(cls, df) -> "RiskTable":
+        return cls({
+            name: df[name].astype(object).where(df[name].notna(), None).tolist()
+            for name in df.columns
+        })
+
+    @classmethod
+    def concat(cls, tables: Iterable["RiskTable"]) -> "RiskTable":
+        """Concatenate tables, filling fields missing from a table with None"""
+        tables = [table for table in tables if len(table)]
+        names: List[str] = []
+        for table in tables:
+            names.extend(name for name in table.columns if name not in names)
+        columns = {}
+        for name in names:
+            merged: list = []
+            for table in tables:
+                merged.extend(table.column(name))
+            columns[name] = merged
+        return cls(columns)
+
+    def __len__(self) -> int:
+        return self._length
+
+    def __iter__(self) -> Iterator[Dict]:
+        return iter(self.to_records())
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, RiskTable):
+            return NotImplemented
+        return self.to_records() == other.to_records()
+
+    def __repr__(self) -> str:
+        return f"RiskTable({self._length} risks, fields={list(self.columns)})"
+
+    @property
+    def fields(self) -> List[str]:
+        return list(self.columns)
+
+    def column(self, name: str) -> list:
+        """Return a column as a list, or a column of None if the field is absent"""
+        values = self.columns.get(name)
+        if values is None:
+            return [None] * self._length
+        if isinstance(values, np.ndarray):
+            if values.dtype.kind == "f" and np.isnan(values).any():
+                return [None if v != v else v for v in values.tolist()]
+            return values.tolist()
+        return list(values)
+
+    def numeric(self, name: str) -> np.ndarray:
+        """Return a column as a float array, with NaN for missing values"""
+        values = self.columns.get(name)
+        if values is None:
+            return np.full(self._length, np.nan)
+        if isinstance(values, np.ndarray):
+            return values.astype(float, copy=False)
+        return np.array([np.nan if v is None else v for v in values], dtype=float)
+
+    def assign(self, columns: Dict[str, Sequence]) -> "RiskTable":
+        """Return a new table sharing existing columns, with columns added or replaced"""
+        merged = dict(self.columns)
+        merged.update(columns)
+        return RiskTable(merged)
+
+    def take(self, indices: Sequence[int]) -> "RiskTable":
+        """Return the rows at the given positions"""
+        columns = {}
+        for name, values in self.columns.items():
+            if isinstance(values, np.ndarray):
+                columns[name] = values[list(indices)]
+            else:
+                columns[name] = [values[i] for i in indices]
+        return RiskTable(columns)
+
+    def slice(self, start: int, stop: int) -> "RiskTable":
+        return RiskTable({name: values[start:stop] for name, values in self.columns.items()})
+
+    def to_records(self, fields: Optional[Sequence[str]] = None) -> List[Dict]:
+        """Materialize rows as dicts, skipping missing (None) values"""
+        names = [name for name in (fields or self.columns) if name in self.columns]
+        columns = [self.column(name) for name in names]
+        records = []
+        for row in zip(*columns) if columns else [() for _ in range(self._length)]:
+            records.append({name: value for name, value in zip(names, row) if value is not None})
+        return records
+
+    def to_json(self, fields: Optional[Sequence[str]] = None, indent: Optional[int] = None) -> str:
+        return json.dumps(self.to_records(fields), ensure_ascii=False, indent=indent)
+
+    def to_dataframe(self):
+        import pandas as pd
+        return pd.DataFrame({name: self.column(name) for name in self.columns})
+
+    def to_arrow(self):
+        """Return a pyarrow.Table view of the records (requires pyarrow)"""
+        import pyarrow as pa
+        return pa.table({name: self.column(name) for name in self.columns})
@@ -1,6 +1,7 @@
 import json
-import pandas as pd
 from pathlib import Path
+from ..export import export_report
+from ..records import RiskTable
 from ..utils import process_risk_data
 
 def verify_risk_processing():
@@ -44,8 +45,8 @@ def verify_risk_processing():
         print(df[['Id', 'Pontuação Geral', 'Nível de Risco']].head(10))
         
         # Export to Excel for manual inspection
-        output_path = Path(__file__).parent / "processed_risks.xlsx"
-        df.to_excel(output_path, index=False)
+        output_base = str(Path(__file__).parent / "processed_risks")
+        output_path = export_report(RiskTable.from_dataframe(df), output_base, ["xlsx"])["xlsx"]
         print(f"\nFull results exported to: {output_path}")
 
     except Exception as e:
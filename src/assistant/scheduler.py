@@ -0,0 +1,326 @@
+import asyncio
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Deque, Dict, Iterator, Optional
+from .concurrency import AIMDLimiter
+from .configuration import (
+    SCHEDULER_DEFAULT_PRIORITY,
+    SCHEDULER_JOB_TOKEN_BUDGET,
+    SCHEDULER_RESERVED_SLOTS,
+    SCHEDULER_SLOTS,
+    logger,
+)
+from .metrics import current_run, set_gauge
+
+# Priority classes, served strictly in this order
+PRIORITIES = ("interactive", "batch")
+# Characters per token when estimating the cost of a call before it runs
+CHARS_PER_TOKEN = 4
+
+class TokenBudgetExceeded(RuntimeError):
+    """Raised when a job asks for an LLM call after spending its token budget"""
+
+class SchedulerTimeout(TimeoutError):
+    """Raised when a call is not given a slot within its deadline"""
+
+@dataclass(frozen=True)
+class JobInfo:
+    """Scheduling identity of the work running in the current context"""
+    job_id: str
+    priority: str = SCHEDULER_DEFAULT_PRIORITY
+    token_budget: int = SCHEDULER_JOB_TOKEN_BUDGET
+
+_current_job: ContextVar[Optional[JobInfo]] = ContextVar("current_job", default=None)
+
+@contextmanager
+def job_context(job_id: str, priority: str = SCHEDULER_DEFAULT_PRIORITY,
+                token_budget: int = SCHEDULER_JOB_TOKEN_BUDGET) -> Iterator[JobInfo]:
+    """Schedule every LLM call made inside the block as part of one job
+
+    Outside any job context, calls belong to the current metrics run (or a
+    shared "default" job) with the default priority and no token budget.
+    """
+    if priority not in PRIORITIES:
+        raise ValueError(f"Unknown priority {priority!r} (expected one of {PRIORITIES})")
+    job = JobInfo(job_id, priority, token_budget)
+    token = _current_job.set(job)
+    try:
+        yield job
+    finally:
+        _current_job.reset(token)
+        LLM_SCHEDULER.end_job(job_id)
+
+def current_job() -> JobInfo:
+    job = _current_job.get()
+    if job is not None:
+        return job
+    run = current_run()
+    return JobInfo(run.run_id if run is not None else "default", token_budget=0)
+
+def estimate_tokens(inputs: Dict) -> int:
+    """Rough prompt size of a call from its template inputs"""
+    return max(1, sum(len(str(value)) for value in inputs.values()) // CHARS_PER_TOKEN)
+
+class _JobState:
+    __slots__ = ("info", "waiting", "running", "served", "used", "pending")
+
+    def __init__(self, info: JobInfo, served: float):
+        self.info = info
+        self.waiting: Deque["_Request"] = deque()
+        self.running = 0
+        # Tokens granted so far (virtual time for fair queuing within the priority class)
+        self.served = served
+        # Tokens actually consumed, and estimates of queued and running calls, checked against the budget
+        self.used = 0
+        self.pending = 0
+
+class _Request:
+    __slots__ = ("job", "cost", "model", "granted", "event", "loop", "future")
+
+    def __init__(self, job: _JobState, cost: int, model: str):
+        self.job = job
+        self.cost = cost
+        self.model = model
+        self.granted = False
+        self.event: Optional[threading.Event] = None
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.future: Optional[asyncio.Future] = None
+
+    def wake(self) -> None:
+        if self.event is not None:
+            self.event.set()
+        else:
+            self.loop.call_soon_threadsafe(self._resolve)
+
+    def _resolve(self) -> None:
+        if not self.future.done():
+            self.future.set_result(None)
+
+class Ticket:
+    """A granted slot; pass it back to release() with the tokens the call used"""
+    __slots__ = ("job", "cost", "model", "waited_s")
+
+    def __init__(self, job: _JobState, cost: int, model: str, waited_s: float):
+        self.job = job
+        self.cost = cost
+        self.model = model
+        self.waited_s = waited_s
+
+class LLMScheduler:
+    """Admission of LLM calls by priority class, fair share and token budget
+
+    At most `slots` calls run at once and `reserved` of them are kept for
+    interactive jobs, so a backlog of batch chunks cannot delay an
+    interactive call by more than one call's latency. Interactive requests
+    are always dispatched before batch ones. Within a class, the job that
+    has been granted the fewest tokens goes next (start-time fair queuing),
+    so a 1000-chunk document and a 10-chunk one progress at the same rate.
+    A job whose consumed tokens, plus the estimates of its calls in
+    progress, reach its budget gets TokenBudgetExceeded instead of a slot.
+    Each model also has an adaptive limit on its calls in flight (see
+    AIMDLimiter); requests for a model at its limit wait while requests for
+    other models go ahead.
+    """
+
+    def __init__(self, slots: int = SCHEDULER_SLOTS, reserved: int = SCHEDULER_RESERVED_SLOTS,
+                 limiter: Optional[AIMDLimiter] = None):
+        self.slots = max(1, slots)
+        self.reserved = min(max(0, reserved), self.slots - 1)
+        self.limiter = limiter or AIMDLimiter()
+        self.running = 0
+        self._jobs: Dict[str, _JobState] = {}
+        self._lock = threading.Lock()
+
+    def _job(self, info: JobInfo) -> _JobState:
+        state = self._jobs.get(info.job_id)
+        if state is None:
+            # A newly active job starts level with the least served job of its class
+            peers = [job.served for job in self._jobs.values() if job.info.priority == info.priority]
+            state = self._jobs[info.job_id] = _JobState(info, min(peers) if peers else 0.0)
+        return state
+
+    def _check_budget(self, job: _JobState) -> None:
+        budget = job.info.token_budget
+        if budget and job.used + job.pending >= budget:
+            raise TokenBudgetExceeded(
+                f"Job {job.info.job_id} used {job.used} of its {budget} token budget "
+                f"({job.pending} more reserved by calls in progress)"
+            )
+
+    def _capacity(self, priority: str) -> int:
+        return self.slots if priority == PRIORITIES[0] else self.slots - self.reserved
+
+    def _next(self) -> Optional[_Request]:
+        for priority in PRIORITIES:
+            if self.running >= self._capacity(priority):
+                continue
+            best: Optional[_Request] = None
+            for job in self._jobs.values():
+                if job.info.priority != priority or not job.waiting:
+                    continue
+                if best is not None and job.served >= best.job.served:
+                    continue
+                # The job's oldest request whose model is below its concurrency limit
+                request = next((r for r in job.waiting if self.limiter.has_capacity(r.model)), None)
+                if request is not None:
+                    best = request
+            if best is not None:
+                best.job.waiting.remove(best)
+                return best
+        return None
+
+    def _dispatch(self) -> None:
+        """Grant free slots to waiting requests (called with the lock held)"""
+        while True:
+            request = self._next()
+            if request is None:
+                break
+            request.granted = True
+            self._grant(request.job, request.cost, request.model)
+            request.wake()
+        self._publish()
+
+    def _grant(self, job: _JobState, cost: int, model: str) -> None:
+        self.limiter.start(model)
+        job.running += 1
+        job.served += cost
+        self.running += 1
+
+    def _publish(self) -> None:
+        for priority in PRIORITIES:
+            jobs = [job for job in self._jobs.values() if job.info.priority == priority]
+            set_gauge("scheduler_queued", priority, sum(len(job.waiting) for job in jobs))
+            set_gauge("scheduler_running", priority, sum(job.running for job in jobs))
+
+    def _enqueue(self, cost: int, model: str) -> _Request:
+        job = self._job(current_job())
+        self._check_budget(job)
+        request = _Request(job, cost, model)
+        job.waiting.append(request)
+        job.pending += cost
+        return request
+
+    def _withdraw(self, request: _Request) -> None:
+        """Forget a request whose caller stopped waiting (called with the lock held)"""
+        if request.granted:
+            self._release(request.job, request.cost, request.model, 0)
+        else:
+            request.job.waiting.remove(request)
+            request.job.pending -= request.cost
+            self._forget_if_idle(request.job)
+
+    def acquire(self, cost: int, timeout: Optional[float] = None, model: str = "default") -> Ticket:
+        """Block until the current job may start a call of about `cost` tokens to `model`"""
+        start = time.monotonic()
+        with self._lock:
+            request = self._enqueue(cost, model)
+            request.event = threading.Event()
+            self._dispatch()
+        if not request.event.wait(timeout):
+            with self._lock:
+                if not request.granted:
+                    self._withdraw(request)
+                    raise SchedulerTimeout(f"No LLM slot for job {request.job.info.job_id} within {timeout:.1f}s")
+        return Ticket(request.job, cost, model, time.monotonic() - start)
+
+    async def aacquire(self, cost: int, timeout: Optional[float] = None, model: str = "default") -> Ticket:
+        """Async acquire: waits on the running event loop instead of blocking it"""
+        start = time.monotonic()
+        with self._lock:
+            request = self._enqueue(cost, model)
+            request.loop = asyncio.get_running_loop()
+            request.future = request.loop.create_future()
+            self._dispatch()
+        try:
+            await asyncio.wait_for(request.future, timeout)
+        except asyncio.TimeoutError:
+            with self._lock:
+                # A slot granted just as the wait timed out is kept
+                if not request.granted:
+                    self._withdraw(request)
+                    raise SchedulerTimeout(
+                        f"No LLM slot for job {request.job.info.job_id} within {timeout:.1f}s"
+                    ) from None
+        except BaseException:
+            # Cancelled while queued or right after the grant: give the slot back
+            with self._lock:
+                self._withdraw(request)
+                self._dispatch()
+            raise
+        return Ticket(request.job, cost, model, time.monotonic() - start)
+
+    def try_acquire(self, cost: int, model: str = "default") -> Optional[Ticket]:
+        """A slot for an optional extra call (e.g. a hedge), only if one is free right now
+
+        Returns None instead of queuing when any request is waiting, all
+        slots of the job's class or the model's concurrency limit are taken,
+        or the call would exceed the job's token budget.
+        """
+        with self._lock:
+            job = self._job(current_job())
+            budget = job.info.token_budget
+            if (any(other.waiting for other in self._jobs.values())
+                    or self.running >= self._capacity(job.info.priority)
+                    or not self.limiter.has_capacity(model)
+                    or (budget and job.used + job.pending + cost > budget)):
+                self._forget_if_idle(job)
+                return None
+            job.pending += cost
+            self._grant(job, cost, model)
+            self._publish()
+        return Ticket(job, cost, model, 0.0)
+
+    def _release(self, job: _JobState, cost: int, model: str, tokens: int) -> None:
+        self.limiter.finish(model)
+        job.running -= 1
+        job.pending -= cost
+        self.running -= 1
+        # Charge what the call really used instead of the estimate
+        if tokens:
+            job.used += tokens
+            job.served += tokens - cost
+        self._forget_if_idle(job)
+
+    def release(self, ticket: Ticket, tokens: int = 0) -> None:
+        with self._lock:
+            self._release(ticket.job, ticket.cost, ticket.model, tokens)
+            self._dispatch()
+
+    def charge(self, tokens: int) -> None:
+        """Count tokens the current job used without a slot (e.g. a shared call) against its budget"""
+        info = current_job()
+        if not tokens or not info.token_budget:
+            return
+        with self._lock:
+            self._job(info).used += tokens
+
+    def _forget_if_idle(self, job: _JobState) -> None:
+        # Jobs with a budget are kept until end_job so their spending is not lost
+        if not job.waiting and not job.running and not job.info.token_budget:
+            self._jobs.pop(job.info.job_id, None)
+
+    def end_job(self, job_id: str) -> None:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None and not job.waiting and not job.running:
+                del self._jobs[job_id]
+                logger.debug("[Scheduler] Job %s finished after %d tokens", job_id, job.used)
+
+    def stats(self) -> Dict[str, Dict]:
+        with self._lock:
+            return {
+                job_id: {
+                    "priority": job.info.priority,
+                    "waiting": len(job.waiting),
+                    "running": job.running,
+                    "used_tokens": job.used,
+                    "token_budget": job.info.token_budget,
+                }
+                for job_id, job in self._jobs.items()
+            }
+
+LLM_SCHEDULER = LLMScheduler()
@@ -0,0 +1,189 @@
+import argparse
+import json
+import os
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Sequence
+import numpy as np
+from .records import RiskTable, IMPACT_FIELDS
+
+DOCUMENT_FIELD = "Documento"
+CATEGORY_FIELD = "Relacionado ao"
+
+@dataclass
+class ScoringConfig:
+    """Governance-defined scoring rules
+
+    By default risks are scored as in the original methodology: the overall
+    impact is the plain sum of the three impacts, the score is probability
+    times impact and levels come from the thresholds (<=10 Baixo, <=20 Médio,
+    above Alto). When `matrix` is set, levels come from a probability x
+    impact lookup instead, with rows indexed by probability (1-5) and columns
+    by the impact level (1-5) reduced with `impact_level`.
+    """
+    impact_weights: Dict[str, float] = field(default_factory=lambda: {name: 1.0 for name in IMPACT_FIELDS})
+    labels: List[str] = field(default_factory=lambda: ["Baixo", "Médio", "Alto"])
+    thresholds: List[float] = field(default_factory=lambda: [10.0, 20.0])
+    matrix: Optional[List[List[str]]] = None
+    impact_level: str = "max"
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "ScoringConfig":
+        config = cls(**data)
+        config.validate()
+        return config
+
+    @classmethod
+    def from_file(cls, path: str) -> "ScoringConfig":
+        with open(path, "r", encoding="utf-8") as f:
+            return cls.from_dict(json.load(f))
+
+    def validate(self) -> None:
+        unknown = set(self.impact_weights) - set(IMPACT_FIELDS)
+        if unknown:
+            raise ValueError(f"Unknown impact fields in weights: {sorted(unknown)}")
+        # A missing weight would silently drop that impact from every score
+        missing = [name for name in IMPACT_FIELDS if name not in self.impact_weights]
+        if missing:
+            raise ValueError(f"Missing impact fields in weights: {missing} (use 0 to ignore an impact)")
+        if self.matrix is not None:
+            if len(self.matrix) != 5 or any(len(row) != 5 for row in self.matrix):
+                raise ValueError("Risk matrix must be 5x5 (probability x impact)")
+            unknown = {label for row in self.matrix for label in row} - set(self.labels)
+            if unknown:
+                raise ValueError(f"Unknown labels in risk matrix: {sorted(unknown)}")
+        elif len(self.thresholds) != len(self.labels) - 1:
+            raise ValueError("Thresholds must define one boundary between each pair of labels")
+        if self.impact_level not in ("max", "weighted_mean"):
+            raise ValueError(f"Unknown impact_level: {self.impact_level}")
+
+def load_scoring_config(path: Optional[str] = None) -> ScoringConfig:
+    """Load the scoring config from path or RISK_SCORING_CONFIG, else the defaults"""
+    path = path or os.getenv("RISK_SCORING_CONFIG")
+    return ScoringConfig.from_file(path) if path else ScoringConfig()
+
+def _as_column(values: np.ndarray) -> np.ndarray:
+    """Keep integral results as integers so reports read 11, not 11.0"""
+    if values.size and np.all(np.isfinite(values)) and np.all(values == np.round(values)):
+        return values.astype(np.int64)
+    return values
+
+def score_arrays(probability: np.ndarray, impacts: np.ndarray, config: ScoringConfig):
+    """Vectorized scoring over arrays
+
+    Args:
+        probability: (n,) probabilities on the 1-5 scale
+        impacts: (n, len(IMPACT_FIELDS)) impact scores on the 0-5 scale
+        config: Scoring rules
+
+    Returns:
+        Tuple of overall impact (n,), overall score (n,) and level codes (n,),
+        where level codes index `config.labels` and -1 marks unscorable rows
+    """
+    weights = np.array([config.impact_weights[name] for name in IMPACT_FIELDS])
+    impacts = np.nan_to_num(impacts, nan=0.0)
+    overall_impact = impacts @ weights
+    score = probability * overall_impact
+
+    if config.matrix is None:
+        codes = np.searchsorted(np.asarray(config.thresholds, dtype=float), score, side="left")
+    else:
+        if config.impact_level == "max":
+            level = impacts.max(axis=1)
+        else:
+            level = overall_impact / max(weights.sum(), 1e-9)
+        impact_index = np.clip(np.ceil(level), 1, 5).astype(np.int64) - 1
+        probability_index = np.clip(np.nan_to_num(probability, nan=1.0), 1, 5).astype(np.int64) - 1
+        label_codes = {label: code for code, label in enumerate(config.labels)}
+        grid = np.array([[label_codes[label] for label in row] for row in config.matrix])
+        codes = grid[probability_index, impact_index]
+        # Risks with no applicable impact fall in the lowest level
+        codes = np.where(level > 0, codes, 0)
+
+    codes = np.where(np.isnan(score), -1, codes)
+    return overall_impact, score, codes
+
+def score_risks(table: RiskTable, config: Optional[ScoringConfig] = None) -> RiskTable:
+    """Add Impacto Geral, Pontuação Geral and Nível de Risco to a risk table"""
+    config = config or load_scoring_config()
+    probability = table.numeric("Probabilidade")
+    impacts = np.column_stack([table.numeric(name) for name in IMPACT_FIELDS])
+    overall_impact, score, codes = score_arrays(probability, impacts, config)
+
+    labels = np.array(list(config.labels) + [None], dtype=object)
+    return table.assign({
+        "Impacto Geral": _as_column(overall_impact),
+        "Pontuação Geral": _as_column(score),
+        "Nível de Risco": labels[codes].tolist(),
+    })
+
+def aggregate_risks(table: RiskTable, by: Sequence[str] = (DOCUMENT_FIELD, CATEGORY_FIELD),
+                    config: Optional[ScoringConfig] = None) -> List[Dict]:
+    """Aggregate scored risks per group (e.g. document and category)
+
+    Returns one record per group with the risk count, mean and max score and
+    the number of risks in each level.
+    """
+    config = config or load_scoring_config()
+    if "Pontuação Geral" not in table.columns:
+        table = score_risks(table, config)
+    if not len(table):
+        return []
+
+    keys = list(zip(*[table.column(name) for name in by]))
+    unique_keys = sorted(set(keys), key=lambda key: tuple("" if v is None else str(v) for v in key))
+    index = {key: i for i, key in enumerate(unique_keys)}
+    group = np.fromiter((index[key] for key in keys), dtype=np.int64, count=len(keys))
+
+    score = np.nan_to_num(table.numeric("Pontuação Geral"), nan=0.0)
+    count = np.bincount(group, minlength=len(unique_keys))
+    total = np.bincount(group, weights=score, minlength=len(unique_keys))
+    maximum = np.full(len(unique_keys), -np.inf)
+    np.maximum.at(maximum, group, score)
+
+    levels = np.array(table.column("Nível de Risco"), dtype=object)
+    per_level = {
+        label: np.bincount(group, weights=(levels == label).astype(float), minlength=len(unique_keys))
+        for label in config.labels
+    }
+
+    results = []
+    for i, key in enumerate(unique_keys):
+        record = dict(zip(by, key))
+        record.update({
+            "Riscos": int(count[i]),
+            "Pontuação Média": round(float(total[i] / count[i]), 2),
+            "Pontuação Máxima": float(maximum[i]),
+        })
+        record.update({label: int(per_level[label][i]) for label in config.labels})
+        results.append(record)
+    return results
+
+def rescore_reports(paths: Sequence[str], config: Optional[ScoringConfig] = None) -> RiskTable:
+    """Re-score archived JSON reports under the given config, without any LLM call"""
+    tables = []
+    for path in paths:
+        with open(path, "r", encoding="utf-8") as f:
+            table = RiskTable.from_records(json.load(f))
+        if DOCUMENT_FIELD not in table.columns:
+            document = os.path.splitext(os.path.basename(path))[0]
+            table = table.assign({DOCUMENT_FIELD: [document] * len(table)})
+        tables.append(table)
+    return score_risks(RiskTable.concat(tables), config)
+
+def main():
+    parser = argparse.ArgumentParser(description="Re-score archived risk reports")
+    parser.add_argument("reports", nargs="+", help="JSON report files")
+    parser.add_argument("--config", help="Scoring config JSON (defaults to RISK_SCORING_CONFIG)")
+    parser.add_argument("--output", help="Write re-scored risks to this JSON file")
+    parser.add_argument("--by", nargs="+", default=[DOCUMENT_FIELD, CATEGORY_FIELD], help="Aggregation fields")
+    args = parser.parse_args()
+
+    config = load_scoring_config(args.config)
+    table = rescore_reports(args.reports, config)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(table.to_json(indent=2))
+    print(json.dumps(aggregate_risks(table, args.by, config), ensure_ascii=False, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,333 @@
+import argparse
+import asyncio
+import json
+import os
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+from .configuration import (
+    INGEST_INBOX,
+    SCHEDULER_DEFAULT_PRIORITY,
+    SCHEDULER_JOB_TOKEN_BUDGET,
+    SERVICE_HOST,
+    SERVICE_PORT,
+    SERVICE_WORKERS,
+    logger,
+    models,
+)
+from .metrics import PROCESS_METRICS, start_run
+from .records import RiskTable
+from .scheduler import PRIORITIES, job_context
+
+# Finished jobs kept for polling before the oldest are forgotten
+MAX_FINISHED_JOBS = 256
+
+class Job:
+    """One analysis request, its progress events and its result"""
+
+    def __init__(self, input_file: str, priority: str = SCHEDULER_DEFAULT_PRIORITY,
+                 token_budget: int = SCHEDULER_JOB_TOKEN_BUDGET):
+        self.id = uuid.uuid4().hex[:12]
+        self.input_file = input_file
+        self.priority = priority
+        self.token_budget = token_budget
+        self.status = "queued"
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.events: List[Dict] = []
+        self.result: Optional[List[Dict]] = None
+        self.token_usage: Dict[str, int] = {}
+        self.validation_errors: List[str] = []
+        self.metrics: Optional[Dict] = None
+        self.error: Optional[str] = None
+        self._changed = threading.Condition()
+        self.emit("queued")
+
+    @property
+    def finished(self) -> bool:
+        return self.status in ("done", "failed")
+
+    def emit(self, event: str, **data) -> None:
+        with self._changed:
+            self.events.append({"event": event, "time": time.time(), **data})
+            self._changed.notify_all()
+
+    def wait_for_events(self, seen: int, timeout: float = 15.0) -> List[Dict]:
+        """Block until there are events past `seen` (or the job finished), then return them"""
+        with self._changed:
+            self._changed.wait_for(lambda: len(self.events) > seen or self.finished, timeout=timeout)
+            return self.events[seen:]
+
+    def to_dict(self, include_result: bool = False) -> Dict:
+        data = {
+            "id": self.id,
+            "input_file": self.input_file,
+            "priority": self.priority,
+            "token_budget": self.token_budget,
+            "status": self.status,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "events": len(self.events),
+            "token_usage": self.token_usage,
+            "validation_errors": self.validation_errors,
+            "error": self.error,
+        }
+        if include_result:
+            data["result"] = self.result
+            data["metrics"] = self.metrics
+        return data
+
+class AnalysisService:
+    """Job queue in front of one warm, compiled workflow
+
+    The compiled graph, the model clients, the tokenizer and the in-memory
+    vector store and context LRUs live for the lifetime of the process, so a
+    job for an already indexed document only pays for its LLM calls. Jobs
+    run through the async graph on one event loop thread; `workers` bounds
+    how many run at once.
+    """
+
+    def __init__(self, workers: int = SERVICE_WORKERS):
+        self.jobs: Dict[str, Job] = {}
+        self._lock = threading.Lock()
+        self._loop = asyncio.new_event_loop()
+        self._slots = asyncio.Semaphore(max(1, workers))
+        self._thread = threading.Thread(target=self._loop.run_forever, name="job-loop", daemon=True)
+        self._thread.start()
+        self.ingest_worker = None
+
+    def watch_inbox(self, inbox: str) -> None:
+        """Index documents dropped in inbox in the background, so their jobs skip ingestion"""
+        from .ingest import IngestWorker
+
+        self.ingest_worker = IngestWorker(inbox).start()
+
+    def warm_up(self) -> None:
+        """Compile the graph and load the models and tokenizer before the first job"""
+        from .main import get_agent
+        from .utils import get_tokenizer
+
+        get_agent()
+        get_tokenizer()
+        try:
+            for name in models:
+                models[name]
+        except Exception as e:
+            logger.error(f"[Service] Model warm-up failed, models will load on first use: {str(e)}")
+
+    def submit(self, input_file: str, priority: str = SCHEDULER_DEFAULT_PRIORITY,
+               token_budget: int = SCHEDULER_JOB_TOKEN_BUDGET) -> Job:
+        job = Job(input_file, priority, token_budget)
+        with self._lock:
+            self.jobs[job.id] = job
+            self._forget_finished()
+        asyncio.run_coroutine_threadsafe(self._run(job), self._loop)
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            return self.jobs.get(job_id)
+
+    def list(self) -> List[Job]:
+        with self._lock:
+            return list(self.jobs.values())
+
+    def _forget_finished(self) -> None:
+        finished = [job for job in self.jobs.values() if job.finished]
+        for job in sorted(finished, key=lambda job: job.finished_at)[:-MAX_FINISHED_JOBS or None]:
+            del self.jobs[job.id]
+
+    async def _run(self, job: Job) -> None:
+        async with self._slots:
+            await self._execute(job)
+
+    async def _execute(self, job: Job) -> None:
+        from .main import get_agent
+
+        job.status = "running"
+        job.started_at = time.time()
+        job.emit("started")
+        try:
+            final_state = {}
+            with start_run(job.id) as run_metrics, job_context(job.id, job.priority, job.token_budget):
+                stream = get_agent().astream(
+                    {"input_file": job.input_file, "risk_list": RiskTable(), "iteration": 0},
+                    stream_mode=["updates", "values"],
+                )
+                async for mode, chunk in stream:
+                    if mode == "values":
+                        final_state = chunk
+                        continue
+                    for node in chunk:
+                        job.emit("node_finished", node=node, elapsed_s=time.time() - job.started_at)
+
+            final_risks = final_state.get("risk_list", RiskTable())
+            job.token_usage = dict(final_state.get("token_usage") or {})
+            job.validation_errors = list(final_state.get("validation_errors") or [])
+            job.metrics = run_metrics.to_dict()
+            if not len(final_risks):
+                raise ValueError("Workflow produced no risks")
+
+            job.result = final_risks.to_records()
+            job.status = "done"
+            job.finished_at = time.time()
+            job.emit("done", risks=len(final_risks), wall_s=job.finished_at - job.started_at)
+        except Exception as e:
+            logger.error(f"[Service] Job {job.id} failed: {str(e)}")
+            logger.debug("[Service] Job %s traceback", job.id, exc_info=True)
+            job.error = str(e)
+            job.status = "failed"
+            job.finished_at = time.time()
+            job.emit("failed", error=str(e))
+
+    def shutdown(self) -> None:
+        if self.ingest_worker is not None:
+            self.ingest_worker.stop()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(timeout=5)
+
+class ServiceHandler(BaseHTTPRequestHandler):
+    """HTTP API
+
+    POST /jobs                 {"input_file": "...", "priority": "interactive"|"batch", "token_budget": N}
+                               -> 202 with the job (priority and token_budget are optional)
+    GET  /jobs                 all known jobs
+    GET  /jobs/<id>            job status, result and metrics
+    GET  /jobs/<id>/events     progress events as newline-delimited JSON, streamed until the job ends
+    GET  /metrics              process metrics in the Prometheus text format
+    GET  /health               liveness, cache occupancy and ingestion status per document state
+    """
+
+    service: AnalysisService = None
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        logger.info("[Service] %s " + format, self.address_string(), *args)
+
+    def _send_json(self, status: int, data) -> None:
+        body = json.dumps(data, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_text(self, status: int, text: str) -> None:
+        body = text.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        from .utils import context_cache, vectorstore_cache
+
+        parts = [part for part in self.path.split("?")[0].split("/") if part]
+        if parts == ["health"]:
+            return self._send_json(200, {
+                "status": "ok",
+                "jobs": len(self.service.list()),
+                "vectorstores": len(vectorstore_cache),
+                "contexts": len(context_cache),
+                "ingest": self.service.ingest_worker.counts() if self.service.ingest_worker else None,
+            })
+        if parts == ["metrics"]:
+            return self._send_text(200, PROCESS_METRICS.to_prometheus())
+        if parts == ["jobs"]:
+            return self._send_json(200, [job.to_dict() for job in self.service.list()])
+        if len(parts) in (2, 3) and parts[0] == "jobs":
+            job = self.service.get(parts[1])
+            if job is None:
+                return self._send_json(404, {"error": f"Unknown job: {parts[1]}"})
+            if len(parts) == 2:
+                return self._send_json(200, job.to_dict(include_result=job.finished))
+            if parts[2] == "events":
+                return self._stream_events(job)
+        self._send_json(404, {"error": f"Not found: {self.path}"})
+
+    def do_POST(self):
+        parts = [part for part in self.path.split("?")[0].split("/") if part]
+        if parts != ["jobs"]:
+            return self._send_json(404, {"error": f"Not found: {self.path}"})
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            payload = json.loads(self.rfile.read(length) or b"{}")
+            input_file = payload["input_file"]
+            priority = payload.get("priority", SCHEDULER_DEFAULT_PRIORITY)
+            token_budget = int(payload.get("token_budget", SCHEDULER_JOB_TOKEN_BUDGET))
+        except (ValueError, KeyError, TypeError) as e:
+            return self._send_json(400, {"error": f"Expected a JSON body with input_file: {str(e)}"})
+        if not os.path.exists(input_file):
+            return self._send_json(400, {"error": f"Could not find file at path: {input_file}"})
+        if priority not in PRIORITIES:
+            return self._send_json(400, {"error": f"Unknown priority: {priority} (expected one of {list(PRIORITIES)})"})
+
+        job = self.service.submit(input_file, priority, token_budget)
+        self._send_json(202, job.to_dict())
+
+    def _stream_events(self, job: Job) -> None:
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+
+        seen = 0
+        try:
+            while True:
+                events = job.wait_for_events(seen)
+                for event in events:
+                    self.wfile.write((json.dumps(event, ensure_ascii=False) + "\n").encode("utf-8"))
+                self.wfile.flush()
+                seen += len(events)
+                if job.finished and seen >= len(job.events):
+                    break
+        except (BrokenPipeError, ConnectionResetError):
+            logger.info(f"[Service] Event stream for job {job.id} closed by client")
+
+def create_server(host: str = SERVICE_HOST, port: int = SERVICE_PORT, workers: int = SERVICE_WORKERS,
+                  warm_up: bool = True, inbox: str = INGEST_INBOX) -> ThreadingHTTPServer:
+    """Build the HTTP server and its job queue (call serve_forever to run it)
+
+    With an inbox directory, documents dropped there are indexed while they
+    wait for their analysis (see ingest.py).
+    """
+    service = AnalysisService(workers)
+    if warm_up:
+        service.warm_up()
+    if inbox:
+        service.watch_inbox(inbox)
+    handler = type("BoundServiceHandler", (ServiceHandler,), {"service": service})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    server.service = service
+    return server
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the risk analysis service")
+    parser.add_argument("--host", default=SERVICE_HOST, help="Listen address")
+    parser.add_argument("--port", type=int, default=SERVICE_PORT, help="Listen port")
+    parser.add_argument("--workers", type=int, default=SERVICE_WORKERS, help="Jobs run concurrently on the event loop")
+    parser.add_argument("--no-warm-up", action="store_true", help="Load the graph and models on first job instead")
+    parser.add_argument("--inbox", default=INGEST_INBOX,
+                        help="Directory whose documents are indexed ahead of analysis (default: RISK_AGENT_INGEST_INBOX)")
+    args = parser.parse_args()
+
+    server = create_server(args.host, args.port, args.workers, warm_up=not args.no_warm_up, inbox=args.inbox)
+    logger.info(f"Risk analysis service listening on http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        logger.info("Shutting down")
+    finally:
+        server.service.shutdown()
+        server.server_close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,167 @@
+import asyncio
+import hashlib
+import json
+import threading
+import time
+from concurrent.futures import CancelledError, Future, TimeoutError as FutureTimeout
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple, Type
+from langchain_core.embeddings import Embeddings
+from .metrics import record_llm_call
+
+def request_key(*parts: Any) -> str:
+    """Digest identifying a request by its model, prompt and inputs"""
+    payload = json.dumps(parts, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+class SingleFlight:
+    """Runs one call per key at a time and hands its outcome to concurrent duplicates
+
+    The first caller for a key (the leader) runs the call; callers arriving
+    while it is in flight wait for the same result or exception instead of
+    making their own call. Nothing is kept once the call finishes, so this
+    only removes duplicates that overlap in time, unlike the persistent caches.
+    Sync and async callers of the same key share the call. Exceptions in
+    `retry_on` belong to the leader's own context (e.g. its job's budget or
+    deadline); followers receiving one retry the call instead. A follower
+    given a `timeout` waits at most that long in total, then runs `fn`
+    itself without sharing it.
+    """
+
+    def __init__(self):
+        self._calls: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+
+    def _join(self, key: str) -> Tuple[Future, bool]:
+        with self._lock:
+            future = self._calls.get(key)
+            if future is not None:
+                return future, False
+            future = self._calls[key] = Future()
+            return future, True
+
+    def _finish(self, key: str, future: Future, result: Any = None, error: BaseException = None) -> None:
+        # Forget the call before publishing it, so later callers start a fresh one
+        with self._lock:
+            self._calls.pop(key, None)
+        if error is None:
+            future.set_result(result)
+        elif isinstance(error, Exception):
+            future.set_exception(error)
+        else:
+            # The leader was cancelled or interrupted: followers retry on their own
+            future.cancel()
+
+    def do(self, key: str, fn: Callable[[], Any], retry_on: Tuple[Type[BaseException], ...] = (),
+           timeout: Optional[float] = None) -> Tuple[Any, bool]:
+        """Return (result, shared), where shared means another caller's call was reused"""
+        give_up_at = None if timeout is None else time.monotonic() + timeout
+        while True:
+            future, leader = self._join(key)
+            if leader:
+                try:
+                    result = fn()
+                except BaseException as e:
+                    self._finish(key, future, error=e)
+                    raise
+                self._finish(key, future, result)
+                return result, False
+            try:
+                return future.result(_remaining(give_up_at)), True
+            except (CancelledError, *retry_on):
+                continue
+            except FutureTimeout:
+                if future.done():
+                    raise
+            # Waited as long as this caller can afford: make its own call
+            return fn(), False
+
+    async def ado(self, key: str, fn: Callable[[], Awaitable[Any]], retry_on: Tuple[Type[BaseException], ...] = (),
+                  timeout: Optional[float] = None) -> Tuple[Any, bool]:
+        """Async do: followers wait on the event loop; cancelling one does not affect the call"""
+        give_up_at = None if timeout is None else time.monotonic() + timeout
+        while True:
+            future, leader = self._join(key)
+            if leader:
+                try:
+                    result = await fn()
+                except BaseException as e:
+                    self._finish(key, future, error=e)
+                    raise
+                self._finish(key, future, result)
+                return result, False
+            try:
+                return await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(future)),
+                                              _remaining(give_up_at)), True
+            except asyncio.CancelledError:
+                if not future.cancelled():
+                    raise
+                continue
+            except retry_on:
+                continue
+            except asyncio.TimeoutError:
+                if future.done():
+                    raise
+            return await fn(), False
+
+def _remaining(give_up_at: Optional[float]) -> Optional[float]:
+    return None if give_up_at is None else max(0.0, give_up_at - time.monotonic())
+
+# Shared by every agent, keyed by model, prompt, inputs and priority class
+LLM_FLIGHTS = SingleFlight()
+
+def record_shared(model: str, waited_s: float) -> None:
+    """Count a request served by an identical call already in flight"""
+    record_llm_call(model, wall_s=waited_s, coalesced=1)
+
+class CoalescingEmbeddings(Embeddings):
+    """Embeddings client wrapper that coalesces identical in-flight requests
+
+    Concurrent jobs embed the same RAG queries, and duplicate uploads the
+    same document splits; with this wrapper each distinct request reaches
+    the provider once while it is in flight.
+    """
+
+    def __init__(self, client: Embeddings):
+        self.client = client
+        self.model = getattr(client, "model", type(client).__name__)
+        self._flights = SingleFlight()
+
+    def _call(self, kind: str, payload: Any, fn: Callable[[], Any]) -> Any:
+        start = time.monotonic()
+        result, shared = self._flights.do(request_key(kind, payload), fn)
+        if shared:
+            record_shared(self.model, time.monotonic() - start)
+        return result
+
+    async def _acall(self, kind: str, payload: Any, fn: Callable[[], Awaitable[Any]]) -> Any:
+        start = time.monotonic()
+        result, shared = await self._flights.ado(request_key(kind, payload), fn)
+        if shared:
+            record_shared(self.model, time.monotonic() - start)
+        return result
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self._call("documents", texts, lambda: self.client.embed_documents(texts))
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._call("query", text, lambda: self.client.embed_query(text))
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        return await self._acall("documents", texts, lambda: self.client.aembed_documents(texts))
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return await self._acall("query", text, lambda: self.client.aembed_query(text))
+
+_wrappers: Dict[int, CoalescingEmbeddings] = {}
+_wrappers_lock = threading.Lock()
+
+def coalescing_embeddings(client: Embeddings) -> CoalescingEmbeddings:
+    """The coalescing wrapper of an embeddings client, one per client so all callers share it"""
+    if isinstance(client, CoalescingEmbeddings):
+        return client
+    with _wrappers_lock:
+        # The wrapper holds the client, so its id is not reused while the entry exists
+        wrapper = _wrappers.get(id(client))
+        if wrapper is None:
+            wrapper = _wrappers[id(client)] = CoalescingEmbeddings(client)
+        return wrapper
@@ -0,0 +1,159 @@
+import asyncio
+import dataclasses
+import functools
+import hashlib
+import json
+import os
+import uuid
+from typing import Any, Callable, Dict, List, Optional
+from .blobs import BlobRef, has_blob
+from .configuration import CACHE_DIR, logger
+from .metrics import record_cache
+from .records import RiskTable
+
+STAGE_CACHE_VERSION = 2
+
+def _normalize(value: Any) -> Any:
+    """Reduce a stage input to plain JSON data for hashing"""
+    if isinstance(value, RiskTable):
+        return {"__table__": {name: value.column(name) for name in value.columns}}
+    if dataclasses.is_dataclass(value) and not isinstance(value, type):
+        return _normalize(dataclasses.asdict(value))
+    if hasattr(value, "pretty_repr"):
+        # Prompt templates: hash the rendered template text
+        return value.pretty_repr()
+    if hasattr(value, "content"):
+        # Message objects: hash their text
+        return value.content
+    if isinstance(value, dict):
+        return {str(key): _normalize(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_normalize(item) for item in value]
+    if hasattr(value, "tolist"):
+        return value.tolist()
+    return value
+
+def stage_key(node: str, inputs: List[Any]) -> str:
+    """Content hash of a node's name and inputs"""
+    payload = json.dumps(
+        [STAGE_CACHE_VERSION, node, _normalize(inputs)],
+        sort_keys=True, ensure_ascii=False, default=str
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+def _encode_value(value: Any) -> Any:
+    if isinstance(value, RiskTable):
+        return {"__table__": {name: value.column(name) for name in value.columns}}
+    if isinstance(value, BlobRef):
+        return {"__blob__": value.digest, "size": value.size}
+    if isinstance(value, list):
+        return [_encode_value(item) for item in value]
+    return _normalize(value)
+
+def _decode_value(value: Any) -> Any:
+    if isinstance(value, dict) and "__table__" in value:
+        return RiskTable(value["__table__"])
+    if isinstance(value, dict) and "__blob__" in value:
+        if not has_blob(value["__blob__"]):
+            raise ValueError(f"blob {value['__blob__']} is missing from the blob store")
+        return BlobRef(value["__blob__"], value["size"])
+    if isinstance(value, list):
+        return [_decode_value(item) for item in value]
+    return value
+
+def _encode(update: Dict) -> Dict:
+    return {key: _encode_value(value) for key, value in update.items()}
+
+def _decode(data: Dict) -> Dict:
+    return {key: _decode_value(value) for key, value in data.items()}
+
+def is_cacheable(update: Dict) -> bool:
+    """Only complete updates are stored: no validation errors and no empty outputs"""
+    if not update or update.get("validation_errors"):
+        return False
+    return all(len(value) for value in update.values() if isinstance(value, (RiskTable, list)))
+
+class StageCache:
+    """Node outputs stored as JSON under <root>/<node>/<key>.json"""
+
+    def __init__(self, root: Optional[str] = None):
+        self.root = root or os.path.join(CACHE_DIR, "stages")
+
+    def _path(self, node: str, key: str) -> str:
+        return os.path.join(self.root, node, f"{key}.json")
+
+    def get(self, node: str, key: str) -> Optional[Dict]:
+        path = self._path(node, key)
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                return _decode(json.load(f))
+        except (OSError, ValueError) as e:
+            logger.warning("[Stages] Ignoring unreadable cache entry %s: %s", path, e)
+            return None
+
+    def put(self, node: str, key: str, update: Dict) -> None:
+        path = self._path(node, key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_file = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_file, "w", encoding="utf-8") as f:
+            json.dump(_encode(update), f, ensure_ascii=False)
+        os.replace(tmp_file, path)
+
+def _replayed(update: Dict) -> Dict:
+    """A stored update as returned on a hit: no tokens were spent this time"""
+    update = dict(update)
+    if "token_usage" in update:
+        update["token_usage"] = {stage: 0 for stage in update["token_usage"]}
+    return update
+
+def memoize_node(name: str, func, inputs: Callable[[Dict], List[Any]], cache: Optional[StageCache] = None):
+    """Wrap a graph node (sync or async) so unchanged inputs return the stored output
+
+    `inputs(state)` lists everything the node's output depends on: the state
+    fields it reads plus its prompt and model settings. If they cannot be
+    computed (e.g. a missing input file) the node simply runs uncached.
+    """
+    cache = cache or StageCache()
+
+    def lookup(state: Dict):
+        try:
+            key = stage_key(name, inputs(state))
+        except Exception as e:
+            logger.warning("[Stages] %s: not memoized (%s)", name, e)
+            return None, None
+        cached = cache.get(name, key)
+        record_cache(name, cached is not None)
+        if cached is not None:
+            logger.info("[Stages] %s: inputs unchanged, reusing stored output", name)
+        return key, cached
+
+    def store(key: Optional[str], update: Dict) -> None:
+        if key is None or not is_cacheable(update):
+            return
+        try:
+            cache.put(name, key, update)
+        except (OSError, TypeError, ValueError) as e:
+            logger.warning("[Stages] %s: could not store output: %s", name, e)
+
+    if asyncio.iscoroutinefunction(func):
+        @functools.wraps(func)
+        async def async_wrapper(state, *args, **kwargs):
+            key, cached = lookup(state)
+            if cached is not None:
+                return _replayed(cached)
+            update = await func(state, *args, **kwargs)
+            store(key, update)
+            return update
+        return async_wrapper
+
+    @functools.wraps(func)
+    def wrapper(state, *args, **kwargs):
+        key, cached = lookup(state)
+        if cached is not None:
+            return _replayed(cached)
+        update = func(state, *args, **kwargs)
+        store(key, update)
+        return update
+    return wrapper
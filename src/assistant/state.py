@@ -1,11 +1,79 @@
-from typing import TypedDict, List, Dict, Annotated
-from langgraph.graph import add_messages
+from typing import Any, TypedDict, List, Dict, Annotated, Tuple, Union
+from langgraph.checkpoint.serde.jsonplus import JsonPlusSerializer
+from .blobs import BlobRef
+from .records import RiskTable
+
+def append_list(left: List, right: List) -> List:
+    """Reducer for append-only lists: updates carry only the new items"""
+    if not right:
+        return left or []
+    return (left or []) + list(right)
+
+def merge_token_usage(left: Dict[str, int], right: Dict[str, int]) -> Dict[str, int]:
+    """Reducer that sums token counts per stage instead of overwriting them"""
+    merged = dict(left or {})
+    for stage, tokens in (right or {}).items():
+        merged[stage] = merged.get(stage, 0) + tokens
+    return merged
 
 class State(TypedDict):
-    """Core state management for the optimization workflow"""
+    """Core state management for the optimization workflow
+
+    Large texts (RAG contexts) are held as BlobRef references to the blob
+    store, so copying the state or checkpointing it does not grow with the
+    document.
+    """
     input_file: str
-    context: Annotated[List[str], add_messages]
-    risk_list: str
-    risk_analysis: List[str]
+    context: Annotated[List[Union[str, BlobRef]], append_list]
+    risk_list: RiskTable
+    risk_analysis: RiskTable
     iteration: int
-    token_usage: Dict[str, int]
+    token_usage: Annotated[Dict[str, int], merge_token_usage]
+    validation_errors: Annotated[List[str], append_list]
+    # Delta re-analysis: previous run snapshot, risk Ids per context hash, and carried-over Ids
+    baseline_file: str
+    context_risks: Dict[str, List[str]]
+    carried_ids: List[str]
+
+def _rebuild(value: Union[list, tuple], items) -> Union[list, tuple]:
+    """A list or tuple of the same type holding items; namedtuples take their fields positionally"""
+    if hasattr(value, "_fields"):
+        return type(value)(*items)
+    return type(value)(items)
+
+def _to_plain(value: Any) -> Any:
+    if isinstance(value, RiskTable):
+        return {"__risktable__": {name: value.column(name) for name in value.columns}}
+    if isinstance(value, BlobRef):
+        return {"__blob__": [value.digest, value.size]}
+    if isinstance(value, dict):
+        return {key: _to_plain(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return _rebuild(value, [_to_plain(item) for item in value])
+    return value
+
+def _from_plain(value: Any) -> Any:
+    if isinstance(value, dict):
+        if "__risktable__" in value:
+            return RiskTable(value["__risktable__"])
+        if "__blob__" in value:
+            return BlobRef(*value["__blob__"])
+        return {key: _from_plain(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return _rebuild(value, [_from_plain(item) for item in value])
+    return value
+
+class StateSerializer(JsonPlusSerializer):
+    """Checkpoint serializer for State channels and pending writes
+
+    Risk tables are written as their columns (one array per field, not one
+    dict per record) and blob references as their digest and size, so a
+    checkpoint holds no document text. Use it with any LangGraph saver, e.g.
+    `MemorySaver(serde=StateSerializer())`.
+    """
+
+    def dumps_typed(self, obj: Any) -> Tuple[str, bytes]:
+        return super().dumps_typed(_to_plain(obj))
+
+    def loads_typed(self, data: Tuple[str, bytes]) -> Any:
+        return _from_plain(super().loads_typed(data))
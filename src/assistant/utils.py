@@ -1,56 +1,181 @@
+import asyncio
 import hashlib
-import tiktoken
 import logging
 import json
 import os
+import shutil
+import threading
 import time
-import traceback
-from langchain_text_splitters import RecursiveCharacterTextSplitter
-from tenacity import retry, stop_after_attempt, wait_exponential
-from langchain_community.vectorstores import FAISS
-from langchain_community.document_loaders import PyPDFLoader
-from typing import List, Dict, Union
-from langchain.schema import Document
-from .configuration import CACHE_DIR, embeddings, logger
-import pandas as pd
-
-# Define the tokenizer
-tokenizer = tiktoken.get_encoding("cl100k_base")
+from collections import OrderedDict, deque
+from functools import lru_cache, wraps
+from tenacity import retry, stop_after_attempt, wait_exponential, retry_if_not_exception_type
+from typing import List, Dict, Optional, Tuple, Union, TYPE_CHECKING
+from .cache_manifest import evict_if_needed, file_hash, get_manifest, text_hash
+from .logs import log_payload
+from .configuration import (
+    CACHE_DIR,
+    CONTEXT_CACHE_SIZE,
+    RATE_LIMITS_ENABLED,
+    VECTORSTORE_CACHE_SIZE,
+    get_embeddings,
+    logger,
+    ProviderUnavailableError,
+)
+from .records import RiskTable
+from .wire import encode_row, normalize_whitespace
+from .scoring import ScoringConfig, score_risks
+
+if TYPE_CHECKING:
+    import pandas as pd
+    from langchain.schema import Document
+    from langchain_community.vectorstores import FAISS
+
+# Tokenizer and text splitter settings. Both objects are built on first use
+# so that importing this module does not load the BPE ranks.
+TOKENIZER_ENCODING = "cl100k_base"
+SPLITTER_CHUNK_SIZE = 8000
+SPLITTER_CHUNK_OVERLAP = 400
+_JSON_DECODER = json.JSONDecoder()
+
+# Bumped when the text of RAG contexts changes, so cached contexts are rebuilt
+CONTEXT_FORMAT_VERSION = 2
+
+SPLITTER_SEPARATORS = [
+    "\n\n\n",
+    "\n\n",
+    "\n",
+    ". ",
+    "! ",
+    "? ",
+    ";",
+    ",",
+    " ",
+    ""
+]
+
+@lru_cache(maxsize=None)
+def get_tokenizer():
+    import tiktoken
+    return tiktoken.get_encoding(TOKENIZER_ENCODING)
 
 # Define the count_tokens function
 def count_tokens(text: str) -> int:
-    return len(tokenizer.encode(text))
-
-# Define the text splitter
-text_splitter = RecursiveCharacterTextSplitter(
-    chunk_size=8000,
-    chunk_overlap=400,
-    length_function=count_tokens,
-    separators=[
-        "\n\n\n",
-        "\n\n",
-        "\n",
-        ". ",
-        "! ",
-        "? ",
-        ";",
-        ",",
-        " ",
-        ""
-    ]
-)
+    return len(get_tokenizer().encode(text))
+
+@lru_cache(maxsize=None)
+def get_text_splitter():
+    from langchain_text_splitters import RecursiveCharacterTextSplitter
+    return RecursiveCharacterTextSplitter(
+        chunk_size=SPLITTER_CHUNK_SIZE,
+        chunk_overlap=SPLITTER_CHUNK_OVERLAP,
+        length_function=count_tokens,
+        separators=SPLITTER_SEPARATORS
+    )
+
+class LRUCache:
+    """Small thread-safe LRU mapping for warm in-process resources"""
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            if key not in self._items:
+                return None
+            self._items.move_to_end(key)
+            return self._items[key]
+
+    def put(self, key, value) -> None:
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._items[key] = value
+            self._items.move_to_end(key)
+            while len(self._items) > self.maxsize:
+                self._items.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._items.clear()
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+# Recently used vector stores (by document hash) and contexts (by document and query set)
+vectorstore_cache = LRUCache(VECTORSTORE_CACHE_SIZE)
+context_cache = LRUCache(CONTEXT_CACHE_SIZE)
 
 def get_document_hash(file_path: str) -> str:
-    with open(file_path, 'rb') as f:
-        return hashlib.md5(f.read()).hexdigest()
+    """MD5 of a file's bytes, read in blocks"""
+    return file_hash(file_path)
+
+def index_fingerprint() -> str:
+    """Hash of every setting that changes how a document is split and embedded"""
+    from .configuration import EMBEDDING_MODEL, LLM_BACKEND
+
+    settings = {
+        "embedding_model": "fake" if LLM_BACKEND == "fake" else EMBEDDING_MODEL,
+        "tokenizer": TOKENIZER_ENCODING,
+        "chunk_size": SPLITTER_CHUNK_SIZE,
+        "chunk_overlap": SPLITTER_CHUNK_OVERLAP,
+        "separators": SPLITTER_SEPARATORS,
+    }
+    return hashlib.sha256(json.dumps(settings, sort_keys=True).encode("utf-8")).hexdigest()[:12]
 
 def resolve_file_path(file_path: str) -> str:
     if os.path.exists(file_path):
         return file_path
     raise FileNotFoundError(f"Could not find file at path: {file_path}")
 
-@retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=4, max=10))
-def load_and_process_pdf(file_path: str) -> FAISS:
+def load_pages(file_path: str) -> List["Document"]:
+    """Load a document as one Document per page
+
+    Real PDFs go through PyPDFLoader. Text exports (e.g. pdftotext output
+    saved with a .pdf name) are split into pages on form feeds.
+    """
+    from langchain.schema import Document
+
+    with open(file_path, 'rb') as f:
+        is_pdf = f.read(5) == b'%PDF-'
+    if is_pdf:
+        from langchain_community.document_loaders import PyPDFLoader
+        return PyPDFLoader(file_path).load()
+
+    with open(file_path, 'r', encoding='utf-8', errors='replace') as f:
+        pages = f.read().split('\f')
+    return [
+        Document(page_content=page, metadata={'source': file_path, 'page': number})
+        for number, page in enumerate(pages)
+    ]
+
+@retry(
+    stop=stop_after_attempt(3),
+    wait=wait_exponential(multiplier=1, min=4, max=10),
+    retry=retry_if_not_exception_type((ProviderUnavailableError, FileNotFoundError))
+)
+def document_index_key(file_path: str) -> Tuple[str, Optional[List["Document"]]]:
+    """Cache key of a document's vector index, plus its pages if they had to be parsed
+
+    The key combines the normalized-text hash with the index fingerprint, so
+    changing the splitter or embedding settings never serves a stale index
+    and a re-exported PDF with identical text reuses the existing one. The
+    manifest remembers the text hash per file content, so known files are
+    not parsed again.
+    """
+    manifest = get_manifest(CACHE_DIR)
+    fingerprint = index_fingerprint()
+    content_hash = get_document_hash(file_path)
+    document_text = manifest.lookup_document(content_hash, fingerprint)
+    pages = None
+    if document_text is None:
+        pages = load_pages(file_path)
+        document_text = text_hash(page.page_content for page in pages)[:32]
+        manifest.record_document(content_hash, fingerprint, document_text)
+    return f"{document_text}-{fingerprint}", pages
+
+def load_and_process_pdf(file_path: str) -> "FAISS":
     """Load and process PDF document with caching
     
     Args:
@@ -59,20 +184,36 @@ def load_and_process_pdf(file_path: str) -> FAISS:
     Returns:
         FAISS: Vector store containing document embeddings
     """
+    file_path = resolve_file_path(file_path)
+    return _load_index(file_path, *document_index_key(file_path))
+
+def _load_index(file_path: str, index_key: str, documents: Optional[List["Document"]]) -> "FAISS":
+    """Vector store for index_key from memory, disk, or built from the document"""
+    from langchain_community.vectorstores import FAISS
+    from langchain.schema import Document
+
     try:
         # Check cache first
-        file_path = resolve_file_path(file_path)
-        doc_hash = get_document_hash(file_path)
-        cache_file = os.path.join(CACHE_DIR, f"{doc_hash}.faiss")
+        index_name = f"{index_key}.faiss"
+        cache_file = os.path.join(CACHE_DIR, index_name)
+        manifest = get_manifest(CACHE_DIR)
+
+        vectorstore = vectorstore_cache.get(index_key)
+        if vectorstore is not None:
+            manifest.touch(index_name)
+            return vectorstore
 
         if os.path.exists(cache_file):
-            logger.info(f"Loading cached embeddings from {cache_file}")
-            return FAISS.load_local(cache_file, embeddings, allow_dangerous_deserialization=True)
+            logger.info("Loading cached embeddings from %s", cache_file)
+            vectorstore = FAISS.load_local(cache_file, get_embeddings(), allow_dangerous_deserialization=True)
+            vectorstore_cache.put(index_key, vectorstore)
+            manifest.touch(index_name)
+            return vectorstore
 
         # Process new document
-        logger.info(f"Processing new document: {os.path.basename(file_path)}")
-        loader = PyPDFLoader(file_path)
-        documents = loader.load()
+        logger.info("Processing new document: %s", os.path.basename(file_path))
+        if documents is None:
+            documents = load_pages(file_path)
 
         # Clean and add metadata
         processed_docs = [
@@ -85,24 +226,34 @@ def load_and_process_pdf(file_path: str) -> FAISS:
         ]
 
         # Create and cache vector store
-        splits = text_splitter.split_documents(processed_docs)
-        logger.info(f"Created {len(splits)} splits for vector search")
-        vectorstore = FAISS.from_documents(splits, embeddings)
-        vectorstore.save_local(cache_file)
+        splits = get_text_splitter().split_documents(processed_docs)
+        logger.info("Created %d splits for vector search", len(splits))
+        vectorstore = FAISS.from_documents(splits, get_embeddings())
+        # Publish the index in one rename, so other processes never load a partial one
+        tmp_dir = f"{cache_file}.{os.getpid()}.{threading.get_ident()}.tmp"
+        vectorstore.save_local(tmp_dir)
+        try:
+            os.replace(tmp_dir, cache_file)
+        except OSError:
+            # Another worker published the same index first
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+        vectorstore_cache.put(index_key, vectorstore)
+        manifest.record(index_name, "index", text_hash=index_key.split("-")[0], fingerprint=index_key.split("-")[1])
+        evict_if_needed(CACHE_DIR)
         
         return vectorstore
 
     except Exception as e:
-        logger.error(f"Document processing failed: {str(e)}")
-        logger.error(f"Traceback: {traceback.format_exc()}")
+        logger.error("Document processing failed: %s", e, exc_info=True)
         raise
 
-def perform_rag_search(vectorstore: FAISS, queries: Dict[str, List[str]]) -> List[str]:
+def perform_rag_search(vectorstore: "FAISS", queries: Dict[str, List[str]], source: Optional[str] = None) -> List[str]:
     """Execute similarity search for given queries
     
     Args:
         vectorstore: FAISS vector store containing document embeddings
         queries: Dictionary mapping section names to search queries
+        source: File name cited in the contexts; defaults to the indexed file's name
         
     Returns:
         List[str]: List of formatted context strings, each containing:
@@ -122,43 +273,116 @@ def perform_rag_search(vectorstore: FAISS, queries: Dict[str, List[str]]) -> Lis
                 
                 for doc in docs:
                     # Format context with metadata
-                    source = doc.metadata.get('source', 'unknown')
+                    source_name = source or doc.metadata.get('source', 'unknown')
                     page = doc.metadata.get('page', 1)
                     
-                    context = f"""Termo de busca: {query}:
-                    
-                    {doc.page_content.strip()}
-                    
-                    [Fonte: {source}, Página: {page}]
-                    """
+                    context = (
+                        f"Termo de busca: {query}:\n\n"
+                        f"{normalize_whitespace(doc.page_content)}\n\n"
+                        f"[Fonte: {source_name}, Página: {page}]"
+                    )
                     
                     contexts.append(context)
                     
         return contexts
         
     except Exception as e:
-        logger.error(f"RAG search failed: {str(e)}")
-        logger.error(f"Traceback: {traceback.format_exc()}")
+        logger.error("RAG search failed: %s", e, exc_info=True)
         raise
 
+def contexts_key(index_key: str, source: str, queries: Dict[str, List[str]]) -> str:
+    """Cache key of the contexts found in an index by a query set, cited as `source`"""
+    return hashlib.md5(
+        (f"v{CONTEXT_FORMAT_VERSION}" + index_key + source + json.dumps(queries, sort_keys=True, ensure_ascii=False)).encode("utf-8")
+    ).hexdigest()
+
+def load_contexts(file_path: str, queries: Dict[str, List[str]]) -> List[str]:
+    """Return RAG contexts for a document, cached per index, query set and file name
+
+    Cached contexts let repeated runs (including offline runs) skip the
+    vector store and the embedding provider entirely.
+    """
+    file_path = resolve_file_path(file_path)
+    source = os.path.basename(file_path)
+    index_key, pages = document_index_key(file_path)
+    key = contexts_key(index_key, source, queries)
+    contexts_name = f"{key}.contexts.json"
+    cache_file = os.path.join(CACHE_DIR, contexts_name)
+    manifest = get_manifest(CACHE_DIR)
+
+    contexts = context_cache.get(key)
+    if contexts is not None:
+        manifest.touch(contexts_name)
+        return list(contexts)
+
+    if os.path.exists(cache_file):
+        logger.info(f"Loading cached contexts from {cache_file}")
+        with open(cache_file, "r", encoding="utf-8") as f:
+            contexts = json.load(f)
+        context_cache.put(key, contexts)
+        manifest.touch(contexts_name)
+        return list(contexts)
+
+    vectorstore = _load_index(file_path, index_key, pages)
+    contexts = perform_rag_search(vectorstore, queries, source)
+
+    tmp_file = f"{cache_file}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_file, "w", encoding="utf-8") as f:
+        json.dump(contexts, f, ensure_ascii=False)
+    os.replace(tmp_file, cache_file)
+    context_cache.put(key, contexts)
+    manifest.record(contexts_name, "contexts", index=f"{index_key}.faiss")
+    return list(contexts)
+
 def rate_limit(max_calls: int, period: int):
-    """Decorator to enforce rate limiting on function calls"""
+    """Decorator to enforce rate limiting on function calls
+
+    The call window is shared by every thread in the process, so concurrent
+    documents (e.g. in batch runs) draw from the same quota. Coroutine
+    functions wait with asyncio.sleep instead of blocking the event loop.
+    """
     def decorator(func):
-        calls = []
+        calls = deque()
+        lock = threading.Lock()
+
+        def reserve() -> float:
+            """Take a slot in the window, or return how long to wait for one"""
+            with lock:
+                now = time.time()
+                while calls and calls[0] <= now - period:
+                    calls.popleft()
+                if len(calls) < max_calls:
+                    calls.append(now)
+                    return 0.0
+                return period - (now - calls[0])
+
+        if asyncio.iscoroutinefunction(func):
+            @wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                if RATE_LIMITS_ENABLED:
+                    while (sleep_time := reserve()) > 0:
+                        await asyncio.sleep(sleep_time)
+                return await func(*args, **kwargs)
+            return async_wrapper
+
+        @wraps(func)
         def wrapper(*args, **kwargs):
-            now = time.time()
-            calls[:] = [call for call in calls if call > now - period]
-            if len(calls) >= max_calls:
-                sleep_time = period - (now - calls[0])
-                time.sleep(sleep_time)
-            result = func(*args, **kwargs)
-            calls.append(time.time())
-            return result
+            if RATE_LIMITS_ENABLED:
+                while (sleep_time := reserve()) > 0:
+                    time.sleep(sleep_time)
+            return func(*args, **kwargs)
         return wrapper
     return decorator
 
-def extract_json_from_response(response) -> List[Dict]:
-    """Extract and parse JSON from LLM response"""
+def extract_json_from_response(response) -> List:
+    """Extract and parse the JSON array in an LLM response
+
+    Scans for the first `[` that starts a complete JSON array, so rows
+    (arrays nested in the array), code fences and surrounding prose are
+    handled. Brackets right after `[` or `,` are elements of an enclosing
+    array and are skipped, so a truncated response fails instead of
+    returning one of its rows.
+    """
     try:
         # Handle different response types
         if hasattr(response, 'content'):
@@ -170,18 +394,22 @@ def extract_json_from_response(response) -> List[Dict]:
             
         # Clean and find JSON
         text = text.strip()
-        start = text.rfind('[')
-        end = text.rfind(']') + 1
-        
-        if start >= 0 and end > start:
-            json_str = text[start:end]
-            return json.loads(json_str)
+        start = text.find('[')
+        while start >= 0:
+            if text[:start].rstrip()[-1:] not in ("[", ","):
+                try:
+                    value, _ = _JSON_DECODER.raw_decode(text, start)
+                except ValueError:
+                    value = None
+                if isinstance(value, list):
+                    return value
+            start = text.find('[', start + 1)
             
         raise ValueError("No valid JSON array found in response")
         
     except Exception as e:
-        logger.error(f"Failed to parse response: {str(e)}")
-        logger.error(f"Raw response: {text[:500]}")
+        logger.error("Failed to parse response: %s", e)
+        log_payload(logger, "utils.raw_response", "Raw response: %s", text, level=logging.ERROR)
         raise
 
 def split_json_array(json_str: str, max_tokens: int = 4096) -> List[str]:
@@ -213,6 +441,41 @@ def split_json_array(json_str: str, max_tokens: int = 4096) -> List[str]:
         logger.error(f"Error splitting JSON: {str(e)}")
         raise
 
+def render_risk_chunks(table: RiskTable, fields: Optional[List[str]] = None, max_tokens: int = 4096,
+                       compact: bool = False) -> List[str]:
+    """Render a risk table as JSON array prompts, each within a token budget
+
+    Every record is serialized once; chunks are assembled by joining the
+    already rendered records instead of re-serializing lists. With compact,
+    records are rows in `fields` order (see wire.py), one per line.
+    """
+    try:
+        chunks = []
+        current_chunk = []
+        current_tokens = 0
+        separator, opening, closing = (",\n", "[\n", "\n]") if compact else (", ", "[", "]")
+
+        for risk in table.to_records(fields):
+            risk_str = encode_row(risk, fields) if compact else json.dumps(risk, ensure_ascii=False)
+            risk_tokens = count_tokens(risk_str) + 2
+
+            if current_chunk and current_tokens + risk_tokens > max_tokens:
+                chunks.append(opening + separator.join(current_chunk) + closing)
+                current_chunk = [risk_str]
+                current_tokens = risk_tokens
+            else:
+                current_chunk.append(risk_str)
+                current_tokens += risk_tokens
+
+        if current_chunk:
+            chunks.append(opening + separator.join(current_chunk) + closing)
+
+        return chunks
+
+    except Exception as e:
+        logger.error(f"Error rendering risk chunks: {str(e)}")
+        raise
+
 def merge_json_responses(responses: List[Union[str, List, Dict]]) -> str:
     """Merge multiple JSON array responses into single array"""
     try:
@@ -236,32 +499,15 @@ def merge_json_responses(responses: List[Union[str, List, Dict]]) -> str:
         logger.error(f"Error merging responses: {str(e)}")
         raise
 
-def process_risk_data(evaluated_risks: str) -> pd.DataFrame:
+def process_risk_data(evaluated_risks: Union[str, RiskTable], config: Optional[ScoringConfig] = None) -> "pd.DataFrame":
     """Process evaluated risks data and calculate risk scores"""
     try:
-        # Load JSON to DataFrame
-        df = pd.read_json(evaluated_risks)
-        
-        # Handle column name variations
-        if 'Relacionado' in df.columns:
-            if 'Relacionado ao' in df.columns:
-                # Merge columns, prefer 'Relacionado ao' where both exist
-                df['Relacionado ao'] = df['Relacionado ao'].combine_first(df['Relacionado'])
-                df.drop(columns=['Relacionado'], inplace=True)
-            else:
-                # Rename if only 'Relacionado' exists
-                df.rename(columns={'Relacionado': 'Relacionado ao'}, inplace=True)
-        
-        # Calculate derived columns
-        df['Impacto Geral'] = df['Impacto Financeiro'] + df['Impacto no Cronograma'] + df['Impacto Reputacional']
-        df['Pontuação Geral'] = df['Probabilidade'] * df['Impacto Geral']
-        
-        # Classify risk levels
-        bins = [-1, 10, 20, float('inf')]
-        labels = ['Baixo', 'Médio', 'Alto']
-        df['Nível de Risco'] = pd.cut(df['Pontuação Geral'], bins=bins, labels=labels)
-        
-        return df
+        # Load records into a risk table (normalizes 'Relacionado' variants)
+        if not isinstance(evaluated_risks, RiskTable):
+            evaluated_risks = RiskTable.from_json(evaluated_risks)
+
+        # Calculate derived columns and classify risk levels
+        return score_risks(evaluated_risks, config).to_dataframe()
         
     except Exception as e:
         logger.error(f"Error processing risk data: {str(e)}")
@@ -0,0 +1,96 @@
+import math
+from typing import Any, Callable, Dict, Iterable, List, NamedTuple, Optional, Tuple
+from .records import FIELD_ALIASES, IMPACT_FIELDS
+
+class ValidationResult(NamedTuple):
+    """Records that passed validation and records queued for re-ask with their errors"""
+    valid: List[Dict]
+    invalid: List[Tuple[Dict, List[str]]]
+
+def _text(record: Dict, name: str) -> Optional[str]:
+    value = record.get(name)
+    if not isinstance(value, str) or not value.strip():
+        return f"{name}: expected non-empty text, got {value!r}"
+    record[name] = value.strip()
+    return None
+
+def _score(low: int, high: int, nullable: bool) -> Callable[[Dict, str], Optional[str]]:
+    """Build a checker for an integer score in [low, high], coercing numeric strings"""
+    def check(record: Dict, name: str) -> Optional[str]:
+        value = record.get(name)
+        if value is None:
+            if nullable:
+                record[name] = 0
+                return None
+            return f"{name}: missing"
+        if isinstance(value, str):
+            try:
+                value = float(value.strip())
+            except ValueError:
+                return f"{name}: expected a number, got {value!r}"
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            return f"{name}: expected an integer, got {value!r}"
+        if isinstance(value, float) and not math.isfinite(value):
+            return f"{name}: expected a finite number, got {value!r}"
+        if value != int(value):
+            return f"{name}: expected an integer, got {value!r}"
+        value = int(value)
+        if not low <= value <= high:
+            return f"{name}: {value} outside {low}-{high}"
+        record[name] = value
+        return None
+    return check
+
+class RiskValidator:
+    """Per-record validator for risk records returned by the models
+
+    The schema is compiled once into a list of (field, checker) pairs, so
+    validating a record costs a handful of dict lookups. Checkers coerce
+    values in place (numeric strings, null impacts as 0) and field variants
+    such as `Relacionado` are normalized to their canonical name.
+    """
+
+    def __init__(self, checks: Iterable[Tuple[str, Callable[[Dict, str], Optional[str]]]]):
+        self.checks = list(checks)
+
+    def validate_record(self, record: Any) -> Tuple[Dict, List[str]]:
+        if not isinstance(record, dict):
+            return {}, [f"expected an object, got {type(record).__name__}"]
+        record = dict(record)
+        for alias, name in FIELD_ALIASES.items():
+            if alias in record:
+                value = record.pop(alias)
+                if record.get(name) is None:
+                    record[name] = value
+        errors = []
+        for name, check in self.checks:
+            error = check(record, name)
+            if error:
+                errors.append(error)
+        return record, errors
+
+    def validate(self, records: Iterable[Any]) -> ValidationResult:
+        valid, invalid = [], []
+        for record in records:
+            record, errors = self.validate_record(record)
+            if errors:
+                invalid.append((record, errors))
+            else:
+                valid.append(record)
+        return ValidationResult(valid, invalid)
+
+IDENTIFIED_RISK_VALIDATOR = RiskValidator([
+    ("Risco", _text),
+    ("Relacionado ao", _text),
+])
+
+EVALUATED_RISK_VALIDATOR = RiskValidator([
+    ("Id", _text),
+    ("Risco", _text),
+    ("Relacionado ao", _text),
+    ("Probabilidade", _score(1, 5, nullable=False)),
+] + [(name, _score(0, 5, nullable=True)) for name in IMPACT_FIELDS])
+
+def validate_evaluated_risks(records: Iterable[Any]) -> ValidationResult:
+    """Validate Evaluator output against the scored risk schema"""
+    return EVALUATED_RISK_VALIDATOR.validate(records)
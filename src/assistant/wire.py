@@ -0,0 +1,83 @@
+import json
+import re
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+from .records import IMPACT_FIELDS, RiskTable
+
+# Compact prompt/response encoding: one JSON array per risk with a fixed field
+# order, and categories as two-letter codes
+CATEGORY_CODES = {
+    "Planejamento da Contratação": "PC",
+    "Seleção do Fornecedor": "SF",
+    "Gestão Contratual": "GC",
+    "Solução Tecnológica": "ST",
+}
+CODE_CATEGORIES = {code: name for name, code in CATEGORY_CODES.items()}
+
+# Row layouts: the Creator returns [category, risk]; the Evaluator and Optimizer
+# receive risks and return only [Id, scores...], joined back to the input by Id
+IDENTIFIED_ROW = ["Relacionado ao", "Risco"]
+EVALUATOR_INPUT_ROW = ["Id", "Relacionado ao", "Risco"]
+SCORE_ROW = ["Id", "Probabilidade"] + IMPACT_FIELDS
+OPTIMIZER_INPUT_ROW = EVALUATOR_INPUT_ROW + SCORE_ROW[1:]
+
+_WHITESPACE_RUN = re.compile(r"[ \t\r\f\v]+")
+_BLANK_LINES = re.compile(r"\n\s*\n+")
+
+def normalize_whitespace(text: str) -> str:
+    """Collapse runs of spaces and blank lines, and strip every line"""
+    text = _WHITESPACE_RUN.sub(" ", text)
+    text = "\n".join(line.strip() for line in text.split("\n"))
+    return _BLANK_LINES.sub("\n\n", text).strip()
+
+def encode_category(value: Any) -> Any:
+    return CATEGORY_CODES.get(value, value)
+
+def decode_category(value: Any) -> Any:
+    if isinstance(value, str):
+        return CODE_CATEGORIES.get(value.strip().upper(), value)
+    return value
+
+def plain_scalar(value: Any) -> Any:
+    """JSON-friendly scalar: NumPy numbers as Python numbers, integral floats as ints"""
+    if hasattr(value, "item"):
+        value = value.item()
+    if isinstance(value, float):
+        if value != value:
+            return None
+        if value.is_integer():
+            return int(value)
+    return value
+
+def encode_row(record: Dict, fields: Sequence[str]) -> str:
+    row = [encode_category(record.get(name)) if name == "Relacionado ao" else plain_scalar(record.get(name)) for name in fields]
+    return json.dumps(row, ensure_ascii=False, separators=(",", ":"))
+
+def encode_rows(table: RiskTable, fields: Sequence[str]) -> str:
+    """Risks as a JSON array of rows, one row per line"""
+    return "[\n" + ",\n".join(encode_row(record, fields) for record in table.to_records(fields)) + "\n]"
+
+def decode_rows(items: Iterable[Any], fields: Sequence[str]) -> List[Any]:
+    """Expand rows to records keyed by `fields`
+
+    Objects (e.g. a model answering in the verbose format) pass through, and
+    rows of the wrong length are kept as-is so validation reports them.
+    """
+    records = []
+    for item in items:
+        if isinstance(item, (list, tuple)) and len(item) == len(fields):
+            record = dict(zip(fields, item))
+        else:
+            record = item
+        if isinstance(record, dict) and "Relacionado ao" in record:
+            record["Relacionado ao"] = decode_category(record["Relacionado ao"])
+        records.append(record)
+    return records
+
+def join_by_id(records: Iterable[Any], table: RiskTable, fields: Sequence[str]) -> List[Any]:
+    """Complete Id-keyed response records with `fields` of the matching input risk"""
+    inputs = {record["Id"]: record for record in table.to_records(["Id"] + [f for f in fields if f != "Id"])}
+    joined = []
+    for record in records:
+        source: Optional[Dict] = inputs.get(record.get("Id")) if isinstance(record, dict) else None
+        joined.append({**source, **record} if source else record)
+    return joined
@@ -0,0 +1,11 @@
+import os
+import sys
+import tempfile
+
+# Isolate the package from real providers and caches before anything imports it
+os.environ["RISK_AGENT_CACHE_DIR"] = tempfile.mkdtemp(prefix="risk-agent-tests-")
+os.environ.setdefault("RISK_AGENT_BACKEND", "fake")
+os.environ.setdefault("RISK_AGENT_OFFLINE", "1")
+os.environ.setdefault("RISK_AGENT_LOG_QUEUE", "0")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,31 @@
+import json
+import os
+import pytest
+from src.assistant.batch import discover_documents, document_id
+
+def touch(root, relative):
+    path = os.path.join(root, relative)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    open(path, "w").close()
+    return path
+
+def test_flattened_ids_do_not_collide(tmp_path):
+    nested = touch(tmp_path, os.path.join("a", "b.pdf"))
+    flat = touch(tmp_path, "a__b.pdf")
+    assert document_id(flat, str(tmp_path)) == "a__b"
+    assert document_id(nested, str(tmp_path)).startswith("a__b-")
+    assert document_id(nested, str(tmp_path)) == document_id(nested, str(tmp_path))
+    assert document_id(touch(tmp_path, os.path.join("a", "c.pdf")), str(tmp_path)) != document_id(nested, str(tmp_path))
+
+    ids = [doc_id for doc_id, _ in discover_documents(str(tmp_path))]
+    assert len(ids) == len(set(ids)) == 3
+
+def test_manifest_ids_are_resolved_and_checked(tmp_path):
+    touch(tmp_path, os.path.join("docs", "x.pdf"))
+    manifest = tmp_path / "manifest.json"
+    manifest.write_text(json.dumps(["docs/x.pdf", {"path": "docs/x.pdf", "id": "custom"}]))
+    assert [doc_id for doc_id, _ in discover_documents(str(manifest))][1] == "custom"
+
+    manifest.write_text(json.dumps([{"path": "docs/x.pdf", "id": "same"}, {"path": "docs/y.pdf", "id": "same"}]))
+    with pytest.raises(ValueError, match="same"):
+        discover_documents(str(manifest))
@@ -0,0 +1,84 @@
+import json
+import os
+import time
+import pytest
+from src.assistant.cache_manifest import ORPHAN_GRACE_S, CacheManifest
+
+DAY = 86400
+
+def write(root, relative, size=10, age=0.0):
+    path = os.path.join(root, relative)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("x" * size)
+    if age:
+        modified = time.time() - age
+        os.utime(path, (modified, modified))
+    return path
+
+@pytest.fixture
+def manifest(tmp_path):
+    return CacheManifest(str(tmp_path))
+
+def test_lru_eviction_keeps_the_most_recently_used(manifest):
+    for i, name in enumerate(["a.contexts.json", "b.contexts.json", "c.contexts.json"]):
+        write(manifest.root, name, size=100)
+        manifest.record(name, "contexts")
+        manifest.entries[name]["last_access"] = time.time() - (3 - i) * 60
+    # A use older than the touch interval is recorded, making a the most recent
+    manifest.touch("a.contexts.json")
+
+    assert manifest.evict(max_bytes=250, dry_run=True) == ["b.contexts.json"]
+    assert manifest.evict(max_bytes=150) == ["b.contexts.json", "c.contexts.json"]
+    assert sorted(manifest.entries) == ["a.contexts.json"]
+    assert sorted(os.listdir(manifest.root)) == ["a.contexts.json", "manifest.json"]
+
+def test_age_eviction_removes_unused_entries_and_loose_files(manifest):
+    write(manifest.root, "old.contexts.json")
+    manifest.record("old.contexts.json", "contexts")
+    manifest.entries["old.contexts.json"]["last_access"] = time.time() - 40 * DAY
+    write(manifest.root, "new.contexts.json")
+    manifest.record("new.contexts.json", "contexts")
+    old_stage = os.path.join("stages", "node", "old.json")
+    write(manifest.root, old_stage, age=40 * DAY)
+    write(manifest.root, os.path.join("stages", "node", "new.json"))
+
+    removed = manifest.evict(max_age_s=30 * DAY)
+    assert sorted(removed) == sorted(["old.contexts.json", old_stage])
+    assert not os.path.exists(os.path.join(manifest.root, old_stage))
+    assert os.path.exists(os.path.join(manifest.root, "new.contexts.json"))
+
+def test_evicted_blob_takes_its_stage_entries_along(manifest):
+    digest, other = "a" * 64, "b" * 64
+    blob = os.path.join("blobs", digest[:2], f"{digest}.txt")
+    write(manifest.root, blob, age=40 * DAY)
+    write(manifest.root, os.path.join("blobs", other[:2], f"{other}.txt"))
+    stage = os.path.join("stages", "rag", "k1.json")
+    unrelated = os.path.join("stages", "rag", "k2.json")
+    for relative, ref in ((stage, digest), (unrelated, other)):
+        write(manifest.root, relative)
+        with open(os.path.join(manifest.root, relative), "w", encoding="utf-8") as f:
+            json.dump({"update": {"contexts": {"__blob__": ref}}}, f)
+
+    assert sorted(manifest.evict(max_age_s=30 * DAY)) == sorted([blob, stage])
+    assert os.path.exists(os.path.join(manifest.root, unrelated))
+
+def test_only_old_cache_artifacts_are_orphans(manifest):
+    write(manifest.root, "fresh.tmp")
+    write(manifest.root, "stale.tmp", age=ORPHAN_GRACE_S + 60)
+    write(manifest.root, "stale.faiss", age=ORPHAN_GRACE_S + 60)
+    write(manifest.root, "notes.txt", age=ORPHAN_GRACE_S + 60)
+
+    assert sorted(manifest.evict()) == ["stale.faiss", "stale.tmp"]
+    assert sorted(os.listdir(manifest.root)) == ["fresh.tmp", "manifest.json", "notes.txt"]
+
+def test_loose_files_skip_files_removed_while_listing(manifest, monkeypatch):
+    write(manifest.root, os.path.join("stages", "node", "kept.json"))
+    walk = os.walk
+
+    def racing_walk(top):
+        for directory, dirs, names in walk(top):
+            yield directory, dirs, names + (["gone.json"] if names else [])
+
+    monkeypatch.setattr(os, "walk", racing_walk)
+    assert [relative for relative, _, _ in manifest._loose_files()] == [os.path.join("stages", "node", "kept.json")]
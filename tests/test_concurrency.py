@@ -0,0 +1,62 @@
+import time
+from src.assistant.concurrency import LATENCY_MIN_SAMPLES, AIMDLimiter
+
+def test_additive_increase_per_window_of_successes():
+    limiter = AIMDLimiter(initial=4, minimum=1, maximum=6, increase=1, latency_factor=0)
+    for _ in range(4):
+        limiter.on_success("m", time.monotonic(), 0.1)
+    # Each success adds increase / limit, so a window of 4 falls just short of +1
+    assert limiter.limit("m") == 4
+    limiter.on_success("m", time.monotonic(), 0.1)
+    assert limiter.limit("m") == 5
+    for _ in range(50):
+        limiter.on_success("m", time.monotonic(), 0.1)
+    assert limiter.limit("m") == 6
+
+def test_overload_and_timeout_halve_the_limit():
+    limiter = AIMDLimiter(initial=8, minimum=1, maximum=8, decrease=0.5)
+    limiter.on_overload("m", time.monotonic(), "FakeRateLimitError")
+    assert limiter.limit("m") == 4
+    limiter.on_overload("m", time.monotonic(), "timeout")
+    assert limiter.limit("m") == 2
+    limiter.on_overload("m", time.monotonic())
+    limiter.on_overload("m", time.monotonic())
+    assert limiter.limit("m") == 1
+    assert limiter.limit("other") == 8
+
+def test_latency_spike_decreases_the_limit():
+    limiter = AIMDLimiter(initial=8, minimum=1, maximum=8, increase=0, decrease=0.5, latency_factor=3)
+    # Spikes are only judged against an established baseline
+    limiter.on_success("m", time.monotonic(), 1.0)
+    assert limiter.limit("m") == 8
+    for _ in range(LATENCY_MIN_SAMPLES):
+        limiter.on_success("m", time.monotonic(), 0.1)
+    limiter.on_success("m", time.monotonic(), 0.25)
+    assert limiter.limit("m") == 8
+    limiter.on_success("m", time.monotonic(), 2.0)
+    assert limiter.limit("m") == 4
+
+def test_only_calls_started_after_the_last_decrease_decrease_again():
+    limiter = AIMDLimiter(initial=8, minimum=1, maximum=8, decrease=0.5)
+    burst = time.monotonic()
+    # A window of calls started together fails together: one decrease
+    for _ in range(8):
+        limiter.on_overload("m", burst)
+    assert limiter.limit("m") == 4
+    time.sleep(0.001)
+    limiter.on_overload("m", time.monotonic())
+    assert limiter.limit("m") == 2
+
+def test_capacity_follows_the_limit():
+    limiter = AIMDLimiter(initial=2, minimum=1, maximum=2)
+    limiter.start("m")
+    assert limiter.has_capacity("m")
+    limiter.start("m")
+    assert not limiter.has_capacity("m")
+    limiter.finish("m")
+    assert limiter.has_capacity("m")
+    assert limiter.stats()["m"] == {"limit": 2, "in_flight": 1, "latency_s": 0.0}
+
+    disabled = AIMDLimiter(initial=1, minimum=1, maximum=1, enabled=False)
+    disabled.start("m")
+    assert disabled.has_capacity("m")
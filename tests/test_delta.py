@@ -0,0 +1,68 @@
+import json
+import pytest
+from src.assistant.delta import (
+    ContextDiff,
+    RunSnapshot,
+    context_hash,
+    merge_carried,
+    snapshot_path,
+    split_carried,
+)
+from src.assistant.records import RiskTable
+
+CONTEXTS = [
+    "O fornecedor deve entregar em 30 dias.\n[Fonte: edital.pdf, Página: 1]",
+    "Multa de 10% por atraso. [Fonte: edital.pdf, Página: 2]",
+]
+RISKS = RiskTable.from_records([
+    {"Id": "R001", "Risco": "Atraso na entrega"},
+    {"Id": "R002", "Risco": "Multa contratual"},
+    {"Id": "R003", "Risco": "Rejeitado na avaliação"},
+])
+
+def snapshot():
+    hashes = [context_hash(text) for text in CONTEXTS]
+    return RunSnapshot({hashes[0]: ["R001"], hashes[1]: ["R002", "R004"]}, RISKS.take([0, 1]), "edital.pdf")
+
+def test_context_hash_ignores_layout_and_source():
+    assert context_hash("Multa  de 10%\npor atraso. [Fonte: edital_v2.pdf, Página: 7]") == context_hash(CONTEXTS[1])
+    assert context_hash("Multa de 20% por atraso.") != context_hash(CONTEXTS[1])
+
+def test_snapshot_round_trip(tmp_path):
+    path = snapshot_path(str(tmp_path / "report.json"))
+    assert path.endswith("report.snapshot.json")
+    snapshot().save(path)
+    loaded = RunSnapshot.load(path)
+    assert loaded.contexts == snapshot().contexts
+    assert loaded.risks == snapshot().risks
+    assert loaded.input_file == "edital.pdf"
+    # Ids recorded for contexts count even when the risk was dropped later
+    assert loaded.next_risk_number() == 5
+
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    data["version"] = 99
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f)
+    with pytest.raises(ValueError, match="version"):
+        RunSnapshot.load(path)
+
+def test_diff_carries_unchanged_contexts():
+    revised = [CONTEXTS[0].replace("Página: 1", "Página: 3"), "Multa de 20% por atraso."]
+    diff = ContextDiff(revised, snapshot())
+    assert diff.changed == [revised[1]]
+    assert diff.changed_hashes == [context_hash(revised[1])]
+    assert diff.carried_contexts == {context_hash(CONTEXTS[0]): ["R001"]}
+    assert diff.carried_ids == ["R001"]
+    assert diff.summary() == "1 of 2 contexts changed, 1 risks carried over"
+
+    unchanged = ContextDiff(CONTEXTS, snapshot())
+    assert unchanged.changed == []
+    # R004 did not make the final report, so it is not carried
+    assert unchanged.carried_ids == ["R001", "R002"]
+
+def test_split_and_merge_carried():
+    carried, new = split_carried(RISKS, ["R002"])
+    assert carried.column("Id") == ["R002"]
+    assert new.column("Id") == ["R001", "R003"]
+    assert merge_carried(carried, new).column("Id") == ["R002", "R001", "R003"]
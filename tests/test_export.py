@@ -0,0 +1,69 @@
+import json
+import os
+import numpy as np
+import pytest
+from src.assistant import export
+from src.assistant.export import ReportExporter, export_report
+from src.assistant.records import RiskTable
+
+FIELDS = ["Id", "Risco", "Probabilidade", "Pontuação Geral"]
+RISKS = RiskTable({
+    "Id": ["R001", "R002", "R003"],
+    "Risco": ["Atraso na entrega", "Falha de integração", None],
+    "Probabilidade": np.array([3, 2, 5]),
+    "Pontuação Geral": np.array([4.5, np.nan, 2.0]),
+})
+
+@pytest.fixture(autouse=True)
+def small_batches(monkeypatch):
+    # Several batches per table, so the writers see more than one write
+    monkeypatch.setattr(export, "EXPORT_BATCH_SIZE", 2)
+
+def test_json_matches_json_dump(tmp_path):
+    paths = export_report(RISKS, str(tmp_path / "report"), ["json", "jsonl"], FIELDS)
+    with open(paths["json"], "r", encoding="utf-8") as f:
+        text = f.read()
+    assert text == json.dumps(RISKS.to_records(), ensure_ascii=False, indent=2)
+    with open(paths["jsonl"], "r", encoding="utf-8") as f:
+        assert [json.loads(line) for line in f] == RISKS.to_records()
+    assert sorted(os.listdir(tmp_path)) == ["report.json", "report.jsonl"]
+
+def test_empty_reports(tmp_path):
+    paths = export_report(RiskTable(), str(tmp_path / "empty"), ["json", "jsonl"], FIELDS)
+    with open(paths["json"], "r", encoding="utf-8") as f:
+        assert json.load(f) == []
+    assert os.path.getsize(paths["jsonl"]) == 0
+
+def test_failed_export_leaves_no_files(tmp_path):
+    with pytest.raises(RuntimeError):
+        with ReportExporter(str(tmp_path / "report"), ["json", "jsonl"], FIELDS) as exporter:
+            exporter.write(RISKS)
+            raise RuntimeError("interrupted")
+    assert os.listdir(tmp_path) == []
+
+def test_unknown_format(tmp_path):
+    with pytest.raises(ValueError, match="csv"):
+        ReportExporter(str(tmp_path / "report"), ["json", "csv"], FIELDS)
+
+def test_parquet_round_trip(tmp_path):
+    pq = pytest.importorskip("pyarrow.parquet")
+    paths = export_report(RISKS, str(tmp_path / "report"), ["parquet"], FIELDS)
+    table = pq.read_table(paths["parquet"])
+    assert table.column_names == FIELDS
+    assert str(table.schema.field("Probabilidade").type) == "int64"
+    assert table.to_pylist() == [
+        {"Id": "R001", "Risco": "Atraso na entrega", "Probabilidade": 3, "Pontuação Geral": 4.5},
+        {"Id": "R002", "Risco": "Falha de integração", "Probabilidade": 2, "Pontuação Geral": None},
+        {"Id": "R003", "Risco": None, "Probabilidade": 5, "Pontuação Geral": 2.0},
+    ]
+
+def test_xlsx_round_trip(tmp_path):
+    openpyxl = pytest.importorskip("openpyxl")
+    paths = export_report(RISKS, str(tmp_path / "report"), ["xlsx"], FIELDS)
+    sheet = openpyxl.load_workbook(paths["xlsx"])["Riscos"]
+    assert list(sheet.values) == [
+        tuple(FIELDS),
+        ("R001", "Atraso na entrega", 3, 4.5),
+        ("R002", "Falha de integração", 2, None),
+        ("R003", None, 5, 2),
+    ]
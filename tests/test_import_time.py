@@ -0,0 +1,44 @@
+import json
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+# Wall-clock budget for importing the package, overridable for slow CI machines
+IMPORT_TIME_BUDGET = float(os.getenv("IMPORT_TIME_BUDGET", "1.5"))
+
+# Modules that must only be loaded on first use, never at import time
+LAZY_MODULES = [
+    "langchain_google_genai",
+    "google.cloud.aiplatform",
+    "tiktoken",
+    "faiss",
+    "pypdf",
+    "pandas",
+]
+
+PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import src.assistant.configuration
+import src.assistant.main
+import src.assistant.utils
+elapsed = time.perf_counter() - start
+print(json.dumps({"seconds": elapsed, "loaded": [m for m in %r if m in sys.modules]}))
+""" % LAZY_MODULES
+
+def import_report():
+    """Import the package in a fresh interpreter without credentials and report what it cost"""
+    env = {k: v for k, v in os.environ.items() if k != "GOOGLE_CLOUD_CREDENTIALS_PATH"}
+    env["RISK_AGENT_OFFLINE"] = "1"
+    result = subprocess.run([sys.executable, "-c", PROBE], cwd=Path(__file__).resolve().parents[1],
+                            env=env, capture_output=True, text=True)
+    assert result.returncode == 0, f"Import raised:\n{result.stderr}"
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+def test_import_loads_no_heavy_modules():
+    assert import_report()["loaded"] == []
+
+def test_import_is_within_budget():
+    seconds = import_report()["seconds"]
+    assert seconds < IMPORT_TIME_BUDGET, f"Import took {seconds:.2f}s, budget is {IMPORT_TIME_BUDGET:.2f}s"
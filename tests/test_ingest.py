@@ -0,0 +1,99 @@
+import os
+import time
+import pytest
+from src.assistant import ingest
+from src.assistant.ingest import IngestWorker
+from src.assistant.metrics import PROCESS_METRICS
+
+@pytest.fixture
+def indexed(monkeypatch):
+    """Stand-in for the context cache: the paths load_contexts has indexed, in call order"""
+    calls = []
+
+    def load_contexts(file_path, queries):
+        if "broken" in file_path:
+            raise ValueError("cannot parse")
+        calls.append(file_path)
+
+    monkeypatch.setattr(ingest, "load_contexts", load_contexts)
+    monkeypatch.setattr(ingest, "is_ingested", lambda file_path, queries: file_path in calls)
+    return calls
+
+def drop(inbox, name, text="texto"):
+    path = os.path.join(inbox, name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(text)
+    return path
+
+def wait_until(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "condition not reached"
+        time.sleep(0.01)
+
+def test_picks_up_supported_documents_once(tmp_path, indexed):
+    inbox = str(tmp_path)
+    pdf, txt = drop(inbox, "edital.pdf"), drop(inbox, os.path.join("lote", "anexo.txt"))
+    drop(inbox, "planilha.xlsx")
+    worker = IngestWorker(inbox, settle_s=0)
+    try:
+        assert worker.run_once() == {"done": 2}
+        assert sorted(indexed) == sorted([pdf, txt])
+        # Unchanged files are not queued again
+        assert worker.scan() == []
+    finally:
+        worker.stop(wait_for_documents=True)
+
+def test_changed_and_unsettled_files(tmp_path, indexed):
+    inbox = str(tmp_path)
+    path = drop(inbox, "edital.pdf")
+    worker = IngestWorker(inbox, settle_s=60)
+    try:
+        assert worker.scan() == []
+        worker.settle_s = 0
+        worker.run_once()
+        drop(inbox, "edital.pdf", "texto revisado")
+        os.utime(path, (time.time() - 10, time.time() - 10))
+        assert worker.scan() == [path]
+    finally:
+        worker.stop(wait_for_documents=True)
+
+def test_failures_are_counted_and_retried_after_a_change(tmp_path, indexed):
+    inbox = str(tmp_path)
+    path = drop(inbox, "broken.pdf")
+    before = PROCESS_METRICS.to_dict()["nodes"].get("ingest_document", {}).get("errors", 0)
+    worker = IngestWorker(inbox, settle_s=0)
+    try:
+        assert worker.run_once() == {"failed": 1}
+        assert worker.documents[path]["error"] == "cannot parse"
+        assert PROCESS_METRICS.to_dict()["nodes"]["ingest_document"]["errors"] == before + 1
+        assert worker.scan() == []
+        os.utime(path, (time.time() - 10, time.time() - 10))
+        assert worker.scan() == [path]
+    finally:
+        worker.stop(wait_for_documents=True)
+
+def test_restart_finds_documents_in_the_cache(tmp_path, indexed):
+    inbox = str(tmp_path)
+    drop(inbox, "edital.pdf")
+    first = IngestWorker(inbox, settle_s=0)
+    first.run_once()
+    first.stop(wait_for_documents=True)
+
+    restarted = IngestWorker(inbox, settle_s=0)
+    try:
+        assert restarted.run_once() == {"cached": 1}
+        assert len(indexed) == 1
+    finally:
+        restarted.stop(wait_for_documents=True)
+
+def test_polling_picks_up_new_files(tmp_path, indexed):
+    inbox = str(tmp_path)
+    worker = IngestWorker(inbox, poll_interval=0.05, settle_s=0).start()
+    try:
+        path = drop(inbox, "edital.pdf")
+        wait_until(lambda: worker.counts() == {"done": 1})
+        assert indexed == [path]
+    finally:
+        worker.stop(wait_for_documents=True)
@@ -0,0 +1,99 @@
+import asyncio
+import time
+import pytest
+from langchain_core.runnables import RunnableLambda
+from src.assistant import llm
+from src.assistant.concurrency import AIMDLimiter
+from src.assistant.fakes import FakeChatModel, FakeRateLimitError, LatencyModel
+from src.assistant.llm import LLMCaller, LLMDeadlineExceeded
+from src.assistant.scheduler import LLMScheduler
+
+@pytest.fixture
+def scheduler(monkeypatch):
+    sched = LLMScheduler(slots=4, reserved=0, limiter=AIMDLimiter(enabled=False))
+    monkeypatch.setattr(llm, "LLM_SCHEDULER", sched)
+    return sched
+
+def chain(model):
+    return RunnableLambda(lambda inputs: inputs["question"]) | model
+
+def wait_until(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "condition not reached"
+        time.sleep(0.01)
+
+def test_hedge_wins_and_the_slow_call_is_abandoned(scheduler):
+    # With seed 0 the first call lands in the 2 s tail and the second takes 20 ms
+    model = FakeChatModel(model="fake-hedge", latency=LatencyModel(median=0.02, sigma=0.0, tail_probability=0.5,
+                                                                 tail_multiplier=100))
+    caller = LLMCaller(timeout=5, deadline=10, hedge=True, hedge_min_delay=0.05, max_workers=4)
+    for _ in range(20):
+        caller.latencies.record("fake-hedge", 0.02)
+
+    start = time.monotonic()
+    response = caller.invoke(chain(model), {"question": "texto"}, key="fake-hedge")
+    assert time.monotonic() - start < 1.0
+    assert response.content
+    # The primary call keeps its thread and slot until it ends
+    assert caller._abandoned == 1
+    assert scheduler.running == 1
+    wait_until(lambda: caller._abandoned == 0 and scheduler.running == 0)
+
+def test_deadline_exceeded_is_raised_on_time(scheduler):
+    model = FakeChatModel(model="fake-failing", latency=LatencyModel(median=0.15, sigma=0.0),
+                          error_rate=1.0, retry_after=0.0)
+    caller = LLMCaller(timeout=5, deadline=0.5, max_attempts=100, max_workers=4)
+    start = time.monotonic()
+    with pytest.raises(LLMDeadlineExceeded):
+        caller.invoke(chain(model), {"question": "texto"}, key="fake-failing")
+    assert 0.4 <= time.monotonic() - start < 0.8
+    wait_until(lambda: scheduler.running == 0)
+
+def test_retry_after_sets_the_backoff(scheduler):
+    calls = []
+
+    def flaky(inputs):
+        calls.append(time.monotonic())
+        if len(calls) == 1:
+            raise FakeRateLimitError(retry_after=0.2)
+        return "ok"
+
+    caller = LLMCaller(timeout=5, deadline=5, max_attempts=2, max_workers=4)
+    assert caller.invoke(RunnableLambda(flaky), {}, key="flaky") == "ok"
+    assert calls[1] - calls[0] >= 0.2
+    wait_until(lambda: scheduler.running == 0)
+
+def test_ticket_is_released_on_every_path(scheduler):
+    # Pool calls give their slot back from a done callback, just after the caller sees the outcome
+    caller = LLMCaller(timeout=0.1, deadline=5, max_attempts=2, max_workers=4)
+
+    def fail(inputs):
+        raise ValueError("bad request")
+
+    assert caller.invoke(RunnableLambda(lambda inputs: "ok"), {}, key="ok") == "ok"
+    wait_until(lambda: scheduler.running == 0)
+
+    with pytest.raises(ValueError):
+        caller.invoke(RunnableLambda(fail), {}, key="fail")
+    wait_until(lambda: scheduler.running == 0)
+
+    exhausted = FakeChatModel(model="fake-429", error_rate=1.0, retry_after=0.0)
+    with pytest.raises(FakeRateLimitError):
+        caller.invoke(chain(exhausted), {"question": "texto"}, key="fake-429")
+    wait_until(lambda: scheduler.running == 0)
+
+    with pytest.raises(LLMDeadlineExceeded):
+        caller.invoke(RunnableLambda(lambda inputs: time.sleep(0.3)), {}, key="slow")
+    wait_until(lambda: scheduler.running == 0)
+
+    with pytest.raises(ValueError):
+        asyncio.run(caller.ainvoke(RunnableLambda(fail), {}, key="fail"))
+    wait_until(lambda: scheduler.running == 0)
+
+def test_ticket_is_released_when_the_pool_is_shut_down(scheduler):
+    caller = LLMCaller(max_workers=4)
+    caller._executor.shutdown()
+    with pytest.raises(RuntimeError):
+        caller.invoke(RunnableLambda(lambda inputs: "ok"), {}, key="closed")
+    assert scheduler.running == 0
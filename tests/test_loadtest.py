@@ -0,0 +1,46 @@
+import pytest
+from src.assistant.loadtest import STAGES, percentile, percentiles, summarize
+
+def test_nearest_rank_percentiles():
+    values = list(range(100, 0, -1))
+    assert percentile(values, 50) == 50
+    assert percentile(values, 95) == 95
+    assert percentile(values, 99) == 99
+    assert percentile(values, 100) == 100
+    assert percentile(values, 0) == 1
+    assert percentile([1, 2, 3, 4], 50) == 2
+    assert percentile([1, 2, 3, 4], 50.5) == 3
+    assert percentile([7.5], 99) == 7.5
+    assert percentile([], 95) == 0.0
+    assert percentiles([0.1, 0.2, 0.3]) == {"p50": 0.2, "p95": 0.3, "p99": 0.3}
+
+def result(wall_s, ok=True, error=None):
+    return {
+        "ok": ok,
+        "error": error,
+        "wall_s": wall_s,
+        "stages": {stage: wall_s / len(STAGES) for stage in STAGES} if ok else {},
+        "tokens": {"create_report": 300, "evaluate_report": 100},
+        "llm": {"calls": 3, "retries": 1, "errors": int(not ok), "coalesced": 0},
+    }
+
+def test_summarize_known_answer():
+    results = [result(2.0), result(4.0), result(1.0, ok=False, error="FakeRateLimitError")]
+    summary = summarize(4, results, wall_s=10.0, limits={"fake": {"limit": 6, "in_flight": 0}})
+
+    assert summary["documents"] == 3
+    assert summary["failed"] == 1
+    assert summary["documents_per_hour"] == 720.0
+    # Failed documents count towards throughput and tokens, not latency
+    assert summary["latency_s"] == {"p50": 2.0, "p95": 4.0, "p99": 4.0}
+    assert summary["tokens_per_s"] == 120.0
+    assert summary["llm"] == {"calls": 9, "retries": 3, "errors": 1, "coalesced": 0}
+    assert summary["concurrency_limits"] == {"fake": 6}
+    assert summary["stages"]["create_report"] == {"p50": 0.5, "p95": 1.0, "p99": 1.0, "tokens_per_s": 90.0}
+    assert summary["errors"] == ["FakeRateLimitError"]
+
+def test_summarize_without_wall_time():
+    summary = summarize(1, [], wall_s=0.0, limits={})
+    assert summary["documents_per_hour"] == 0.0
+    assert summary["tokens_per_s"] == 0.0
+    assert summary["latency_s"] == {"p50": 0.0, "p95": 0.0, "p99": 0.0}
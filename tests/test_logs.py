@@ -0,0 +1,122 @@
+import asyncio
+import logging
+import queue
+import pytest
+from src.assistant import logs
+from src.assistant.configuration import LOG_LEVEL, LOG_PAYLOAD_CHARS, LOG_QUEUE_ENABLED, LOG_SAMPLE_RATE
+from src.assistant.logs import (
+    CorrelationFilter,
+    RateSampler,
+    _DeferredQueueHandler,
+    configure_payloads,
+    correlation_id,
+    log_context,
+    log_payload,
+    setup_logging,
+)
+
+@pytest.fixture
+def queued_logger():
+    """A logger writing to a _DeferredQueueHandler, and the queue it fills"""
+    log_queue = queue.SimpleQueue()
+    handler = _DeferredQueueHandler(log_queue)
+    handler.addFilter(CorrelationFilter())
+    logger = logging.getLogger("tests.logs")
+    logger.addHandler(handler)
+    logger.setLevel(logging.DEBUG)
+    logger.propagate = False
+    yield logger, log_queue
+    logger.removeHandler(handler)
+
+@pytest.fixture
+def payloads():
+    yield configure_payloads
+    configure_payloads(LOG_SAMPLE_RATE, LOG_PAYLOAD_CHARS)
+
+def drain(log_queue):
+    records = []
+    while not log_queue.empty():
+        records.append(log_queue.get_nowait())
+    return records
+
+def test_log_context_nests_and_resets():
+    assert correlation_id() == ""
+    with log_context(run="r1"):
+        with log_context(node="creator", chunk="2/5"):
+            assert correlation_id() == "run=r1 node=creator chunk=2/5"
+        with log_context(run="r2"):
+            assert correlation_id() == "run=r2"
+        assert correlation_id() == "run=r1"
+    assert correlation_id() == ""
+
+def test_log_context_follows_tasks():
+    async def chunk(i):
+        with log_context(chunk=i):
+            await asyncio.sleep(0)
+            return correlation_id()
+
+    async def run():
+        with log_context(run="r1"):
+            return await asyncio.gather(chunk(1), chunk(2))
+
+    assert asyncio.run(run()) == ["run=r1 chunk=1", "run=r1 chunk=2"]
+
+def test_queue_handler_merges_arguments_and_tags_records(queued_logger):
+    logger, log_queue = queued_logger
+    values = [1]
+    with log_context(run="r1"):
+        logger.info("values: %s", values)
+    # Arguments are merged when the call is made, not when the listener formats it
+    values.append(2)
+    logger.info("untagged")
+
+    tagged, untagged = drain(log_queue)
+    assert (tagged.msg, tagged.args, tagged.correlation) == ("values: [1]", None, "[run=r1] ")
+    assert untagged.correlation == ""
+    assert logging.Formatter(logs.LOG_FORMAT).format(tagged).endswith(" - INFO - [run=r1] values: [1]")
+
+def test_setup_logging_writes_through_the_listener(capsys):
+    try:
+        setup_logging("INFO", use_queue=True)
+        with log_context(job="j1"):
+            logging.getLogger("tests.setup_logging").info("queued %d", 3)
+        logs._stop_listener()
+        assert "INFO - [job=j1] queued 3" in capsys.readouterr().err
+    finally:
+        setup_logging(LOG_LEVEL, use_queue=LOG_QUEUE_ENABLED)
+
+def test_rate_sampler_counts_dropped_events(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(logs.time, "monotonic", lambda: now[0])
+    sampler = RateSampler(2.0)
+    assert sampler.allow("a") == 0
+    assert sampler.allow("a") is None
+    assert sampler.allow("a") is None
+    assert sampler.allow("b") == 0
+    now[0] += 0.5
+    assert sampler.allow("a") == 2
+    assert RateSampler(0).allow("a") == 0
+
+def test_log_payload_truncates_and_samples(queued_logger, payloads):
+    logger, log_queue = queued_logger
+    payloads(1.0, 5)
+    log_payload(logger, "site", "raw: %s", "abcdefghij")
+    log_payload(logger, "site", "raw: %s", "dropped")
+    log_payload(logger, "other", "raw: %s", "xyz")
+    assert [record.msg for record in drain(log_queue)] == ["raw: abcde", "raw: xyz"]
+
+    logs._payload_sampler._last["site"] -= 10
+    log_payload(logger, "site", "raw: %s", "again")
+    assert [record.msg for record in drain(log_queue)] == ["raw: again (1 similar records dropped)"]
+
+def test_log_payload_skips_disabled_levels(queued_logger, payloads):
+    logger, log_queue = queued_logger
+    payloads(1.0, 200)
+    logger.setLevel(logging.INFO)
+
+    class Expensive:
+        def __str__(self):
+            raise AssertionError("payload converted although DEBUG is disabled")
+
+    log_payload(logger, "site", "raw: %s", Expensive())
+    assert drain(log_queue) == []
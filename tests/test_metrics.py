@@ -0,0 +1,25 @@
+from src.assistant.metrics import RunMetrics
+
+def test_prometheus_rendering():
+    metrics = RunMetrics(run_id="r1")
+    metrics.record_node("evaluate_report", 1.5)
+    metrics.record_node("evaluate_report", 0.5, error=True)
+    metrics.record_cache("evaluate_report", hit=True)
+    metrics.set_gauge("llm_concurrency_limit", "gemini", 4)
+    text = metrics.to_prometheus()
+
+    assert "# TYPE risk_agent_node_calls_total counter\n" in text
+    assert 'risk_agent_node_calls_total{run_id="r1",node="evaluate_report"} 2\n' in text
+    assert 'risk_agent_node_errors_total{run_id="r1",node="evaluate_report"} 1\n' in text
+    assert 'risk_agent_node_seconds_total{run_id="r1",node="evaluate_report"} 2.0\n' in text
+    assert 'risk_agent_node_cache_hits_total{run_id="r1",node="evaluate_report"} 1\n' in text
+    assert 'risk_agent_llm_concurrency_limit{run_id="r1",label="gemini"} 4\n' in text
+
+def test_prometheus_escapes_label_values():
+    metrics = RunMetrics(run_id='run "a"')
+    metrics.record_llm("creator", 'models\\gemini\nflash', wall_s=1.0, prompt_tokens=10)
+    text = metrics.to_prometheus()
+    assert ('risk_agent_llm_prompt_tokens_total{run_id="run \\"a\\"",node="creator",'
+            'model="models\\\\gemini\\nflash"} 10\n') in text
+    # Every sample stays on one line
+    assert all(line.startswith(("#", "risk_agent_")) for line in text.splitlines())
@@ -0,0 +1,30 @@
+import os
+import pstats
+import pytest
+from langchain_core.runnables import RunnableLambda
+from src.assistant.llm import invoke_llm
+from src.assistant.profiling import PROCESS_WIDE_PROFILER, profile_node, profiled_nodes
+
+def model_hot_path(inputs):
+    return sum(i * i for i in range(50_000))
+
+def node(state):
+    return {"result": invoke_llm(RunnableLambda(model_hot_path), {"question": "x"}, key="profiled")}
+
+def test_profiled_nodes_setting():
+    assert profiled_nodes("", ["a", "b"]) == set()
+    assert profiled_nodes("all", ["a", "b"]) == {"a", "b"}
+    assert profiled_nodes(" a, c ", ["a", "b"]) == {"a", "c"}
+
+def test_profile_writes_stats_and_summary(tmp_path):
+    assert profile_node("node", node, str(tmp_path))({}) == {"result": model_hot_path({})}
+    assert sorted(os.listdir(tmp_path)) == ["node-1.pstats", "node-1.tracemalloc", "node-1.txt"]
+
+@pytest.mark.skipif(PROCESS_WIDE_PROFILER, reason="one profiler per process: pool calls are not profiled")
+def test_llm_pool_calls_are_merged_into_the_node_profile(tmp_path):
+    profile_node("node", node, str(tmp_path))({})
+    functions = {function for _, _, function in pstats.Stats(str(tmp_path / "node-1.pstats")).stats}
+    # The model call ran on an llm-call pool thread, the node on this one
+    assert {"node", "model_hot_path"} <= functions
+    summary = (tmp_path / "node-1.txt").read_text(encoding="utf-8")
+    assert "scope: node thread and 1 LLM pool calls" in summary
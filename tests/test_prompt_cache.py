@@ -0,0 +1,104 @@
+import asyncio
+import sys
+import types
+import pytest
+from langchain_core.prompts import ChatPromptTemplate
+from src.assistant import prompt_cache
+from src.assistant.fakes import FakeChatModel
+from src.assistant.prompt_cache import PromptCache, _create_gemini_cache, aprompt_chain, prompt_chain
+from src.assistant.prompts import CREATOR_PROMPT, CREATOR_PROMPT_PARTS, EVALUATOR_PROMPT_PARTS, split_prompt
+
+def test_split_prompt_renders_like_the_full_prompt():
+    prompt = ChatPromptTemplate.from_template("Instruções fixas.\n\nEscala de 1 a 5.\n\nContexto:\n{context}\nFim")
+    parts = split_prompt(prompt, "context")
+    assert parts.prefix == "Instruções fixas.\n\nEscala de 1 a 5."
+    assert parts.suffix.input_variables == ["context"]
+    full = prompt.format_messages(context="TR")[0].content
+    assert parts.prefix + "\n\n" + parts.suffix.format_messages(context="TR")[0].content == full
+
+def test_split_prompt_needs_a_static_prefix():
+    with pytest.raises(ValueError):
+        split_prompt(ChatPromptTemplate.from_template("{role}\n\n{context}"), "context")
+
+def test_agent_prompt_prefixes_are_static():
+    assert CREATOR_PROMPT_PARTS.suffix.input_variables == ["context"]
+    assert CREATOR_PROMPT_PARTS.digest != EVALUATOR_PROMPT_PARTS.digest
+
+class GeminiStub:
+    def __init__(self, model, tokens):
+        self.model = model
+        self.tokens = tokens
+
+    def get_num_tokens(self, text):
+        return self.tokens
+
+@pytest.fixture
+def context_cache(monkeypatch):
+    """Record create_context_cache calls instead of reaching the provider"""
+    calls = []
+    module = types.ModuleType("langchain_google_genai")
+
+    def create_context_cache(model, messages, ttl=None):
+        calls.append((model, messages, ttl))
+        return "cachedContents/abc"
+
+    module.create_context_cache = create_context_cache
+    monkeypatch.setitem(sys.modules, "langchain_google_genai", module)
+    return calls
+
+def test_gemini_cache_skips_experimental_models(context_cache):
+    assert _create_gemini_cache(GeminiStub("models/gemini-2.0-pro-exp-02-05", 10_000), "prefix", 60) is None
+    assert context_cache == []
+
+def test_gemini_cache_skips_prefixes_below_the_minimum(context_cache):
+    assert _create_gemini_cache(GeminiStub("gemini-2.0-flash", 600), "prefix", 60, min_tokens=4096) is None
+    assert context_cache == []
+
+def test_gemini_cache_uses_the_chat_model_client(context_cache):
+    llm = GeminiStub("gemini-2.0-flash", 5000)
+    assert _create_gemini_cache(llm, "prefix", 60, min_tokens=4096) == "cachedContents/abc"
+    (model, messages, ttl), = context_cache
+    assert model is llm and messages[0].content == "prefix" and ttl == "60s"
+
+class CountingModel:
+    model = "counting"
+
+    def __init__(self, name=None):
+        self.name = name
+        self.uploads = 0
+
+    def create_cached_content(self, text, ttl=None):
+        self.uploads += 1
+        return self.name
+
+def test_prompt_cache_uploads_once_per_ttl_and_remembers_failures():
+    cache = PromptCache(ttl=3600)
+    llm = CountingModel("cachedContents/x")
+    assert cache.get(llm, CREATOR_PROMPT_PARTS) == "cachedContents/x"
+    assert cache.get(llm, CREATOR_PROMPT_PARTS) == "cachedContents/x"
+    unsupported = CountingModel(None)
+    unsupported.model = "unsupported"
+    assert cache.get(unsupported, CREATOR_PROMPT_PARTS) is None
+    assert cache.get(unsupported, CREATOR_PROMPT_PARTS) is None
+    assert (llm.uploads, unsupported.uploads) == (1, 1)
+
+def test_prompt_chain_binds_the_cached_prefix(monkeypatch):
+    monkeypatch.setattr(prompt_cache, "PROMPT_CACHE_ENABLED", True)
+    monkeypatch.setattr(prompt_cache, "PROMPT_CACHE", PromptCache())
+    llm = FakeChatModel(model="fake-gemini-2.0-flash")
+    chain = prompt_chain(CREATOR_PROMPT, llm, CREATOR_PROMPT_PARTS)
+    assert chain.first is CREATOR_PROMPT_PARTS.suffix
+    assert chain.last.kwargs["cached_content"].startswith("cachedContents/fake-")
+
+def test_async_prompt_chain_does_not_leave_the_loop_on_a_hit(monkeypatch):
+    monkeypatch.setattr(prompt_cache, "PROMPT_CACHE_ENABLED", True)
+    monkeypatch.setattr(prompt_cache, "PROMPT_CACHE", PromptCache())
+    llm = FakeChatModel(model="fake-gemini-2.0-flash")
+    prompt_chain(CREATOR_PROMPT, llm, CREATOR_PROMPT_PARTS)
+
+    async def no_thread(*args, **kwargs):
+        raise AssertionError("a warm entry must not go through a worker thread")
+
+    monkeypatch.setattr(asyncio, "to_thread", no_thread)
+    chain = asyncio.run(aprompt_chain(CREATOR_PROMPT, llm, CREATOR_PROMPT_PARTS))
+    assert "cached_content" in chain.last.kwargs
@@ -0,0 +1,52 @@
+import numpy as np
+import pytest
+from src.assistant.records import RiskTable
+
+RECORDS = [
+    {"Id": "R001", "Risco": "Atraso na entrega", "Probabilidade": 3, "Impacto Financeiro": 4},
+    {"Id": "R002", "Risco": "Falha de integração", "Probabilidade": 2},
+]
+
+def test_records_round_trip():
+    table = RiskTable.from_records(RECORDS)
+    assert len(table) == 2
+    assert table.fields == ["Id", "Risco", "Probabilidade", "Impacto Financeiro"]
+    # Missing values are stored as None and skipped again on the way out
+    assert table.column("Impacto Financeiro") == [4, None]
+    assert table.to_records() == RECORDS
+    assert RiskTable.from_json(table.to_json()) == table
+    assert table.to_records(fields=["Risco", "Id", "Ausente"]) == [
+        {"Risco": "Atraso na entrega", "Id": "R001"}, {"Risco": "Falha de integração", "Id": "R002"}]
+
+def test_dataframe_round_trip():
+    pytest.importorskip("pandas")
+    table = RiskTable.from_records(RECORDS)
+    assert RiskTable.from_dataframe(table.to_dataframe()) == table
+
+def test_aliases_yield_to_canonical_fields():
+    table = RiskTable.from_records([{"Relacionado": "Prazo"}, {"Relacionado": "Custo", "Relacionado ao": "Escopo"}])
+    assert table.column("Relacionado ao") == ["Prazo", "Escopo"]
+
+def test_numeric_columns():
+    table = RiskTable({"Id": ["R001", "R002", "R003"], "Probabilidade": [3, None, 1],
+                       "Pontuação Geral": np.array([1.5, np.nan, 2.0])})
+    np.testing.assert_array_equal(table.numeric("Probabilidade"), [3.0, np.nan, 1.0])
+    assert np.isnan(table.numeric("Impacto Geral")).all()
+    assert table.column("Pontuação Geral") == [1.5, None, 2.0]
+    assert table.take([2, 0]).to_records() == [{"Id": "R003", "Probabilidade": 1, "Pontuação Geral": 2.0},
+                                               {"Id": "R001", "Probabilidade": 3, "Pontuação Geral": 1.5}]
+    assert table.slice(1, 2).to_records() == [{"Id": "R002"}]
+
+def test_concat_and_assign():
+    first = RiskTable.from_records(RECORDS[:1])
+    second = RiskTable.from_records([{"Id": "R003", "Nível de Risco": "Alto"}])
+    merged = RiskTable.concat([first, RiskTable(), second])
+    assert merged.column("Nível de Risco") == [None, "Alto"]
+    assert merged.column("Risco") == ["Atraso na entrega", None]
+    assigned = merged.assign({"Nível de Risco": ["Baixo", "Alto"]})
+    assert assigned.column("Nível de Risco") == ["Baixo", "Alto"]
+    assert merged.column("Nível de Risco") == [None, "Alto"]
+
+def test_columns_must_have_the_same_length():
+    with pytest.raises(ValueError):
+        RiskTable({"Id": ["R001"], "Risco": []})
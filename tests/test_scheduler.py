@@ -0,0 +1,92 @@
+import threading
+import time
+import pytest
+from src.assistant.concurrency import AIMDLimiter
+from src.assistant.scheduler import LLMScheduler, SchedulerTimeout, TokenBudgetExceeded, job_context
+
+def scheduler(slots=1, reserved=0):
+    return LLMScheduler(slots=slots, reserved=reserved, limiter=AIMDLimiter(enabled=False))
+
+def wait_until(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "condition not reached"
+        time.sleep(0.005)
+
+def queue(sched, requests):
+    """Queue (job_id, priority, cost) requests in order behind a held slot; return their grant order"""
+    order = []
+    hold = sched.acquire(1)
+
+    def request(job_id, priority, cost):
+        with job_context(job_id, priority):
+            ticket = sched.acquire(cost, timeout=5)
+            order.append(job_id)
+            sched.release(ticket)
+
+    threads = []
+    for queued, (job_id, priority, cost) in enumerate(requests, 1):
+        thread = threading.Thread(target=request, args=(job_id, priority, cost))
+        thread.start()
+        threads.append(thread)
+        wait_until(lambda: sum(job["waiting"] for job in sched.stats().values()) == queued)
+    sched.release(hold)
+    for thread in threads:
+        thread.join()
+    return order
+
+def test_small_job_is_not_starved_by_a_large_one():
+    sched = scheduler()
+    order = queue(sched, [("large", "batch", 10)] * 3 + [("small", "batch", 10)])
+    assert order == ["large", "small", "large", "large"]
+
+def test_interactive_goes_before_batch():
+    sched = scheduler()
+    order = queue(sched, [("batch", "batch", 1), ("batch", "batch", 1), ("chat", "interactive", 1)])
+    assert order == ["chat", "batch", "batch"]
+
+def test_reserved_slots_are_kept_for_interactive_jobs():
+    sched = scheduler(slots=2, reserved=1)
+    with job_context("batch", "batch"):
+        ticket = sched.acquire(1)
+        with pytest.raises(SchedulerTimeout):
+            sched.acquire(1, timeout=0.05)
+    with job_context("chat", "interactive"):
+        sched.release(sched.acquire(1, timeout=0.05))
+    sched.release(ticket)
+    assert sched.running == 0
+
+def test_token_budget_counts_used_and_in_progress_tokens():
+    sched = scheduler(slots=4)
+    with job_context("job", "batch", token_budget=100):
+        first = sched.acquire(60)
+        second = sched.acquire(40)
+        # The calls in progress reserve the whole budget
+        with pytest.raises(TokenBudgetExceeded):
+            sched.acquire(10)
+        sched.release(first, tokens=20)
+        sched.release(second, tokens=20)
+        # Charged what the calls used, not their estimates
+        assert sched.stats()["job"]["used_tokens"] == 40
+        sched.release(sched.acquire(50), tokens=60)
+        with pytest.raises(TokenBudgetExceeded):
+            sched.acquire(1)
+
+def test_try_acquire_never_queues():
+    sched = scheduler(slots=2, reserved=0)
+    first = sched.acquire(1)
+    hedge = sched.try_acquire(1)
+    assert hedge is not None
+    assert sched.try_acquire(1) is None
+    sched.release(first)
+    sched.release(hedge)
+    assert sched.running == 0
+
+def test_try_acquire_respects_the_model_limit():
+    sched = LLMScheduler(slots=4, reserved=0, limiter=AIMDLimiter(initial=1, minimum=1))
+    ticket = sched.acquire(1, model="m")
+    assert sched.try_acquire(1, model="m") is None
+    other = sched.try_acquire(1, model="n")
+    assert other is not None
+    sched.release(ticket)
+    sched.release(other)
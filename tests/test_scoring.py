@@ -0,0 +1,73 @@
+import json
+from pathlib import Path
+import pandas as pd
+import pytest
+from src.assistant.records import IMPACT_FIELDS, RiskTable
+from src.assistant.scoring import ScoringConfig, aggregate_risks, score_risks
+
+FIXTURE_PATH = Path(__file__).resolve().parents[1] / "src" / "assistant" / "risk_analysis" / "output_risk_eval.json"
+
+def baseline_levels(records):
+    """Levels as the original pandas implementation computed them"""
+    df = pd.DataFrame(records)
+    df["Impacto Geral"] = df["Impacto Financeiro"] + df["Impacto no Cronograma"] + df["Impacto Reputacional"]
+    df["Pontuação Geral"] = df["Probabilidade"] * df["Impacto Geral"]
+    df["Nível de Risco"] = pd.cut(df["Pontuação Geral"], bins=[-1, 10, 20, float("inf")],
+                                  labels=["Baixo", "Médio", "Alto"])
+    return df
+
+def all_scores():
+    """Every probability x impact combination of the 1-5 and 0-5 scales"""
+    return [
+        {"Id": f"R{i}", "Probabilidade": p, "Impacto Financeiro": f, "Impacto no Cronograma": c, "Impacto Reputacional": r}
+        for i, (p, f, c, r) in enumerate(
+            (p, f, c, r) for p in range(1, 6) for f in range(6) for c in range(6) for r in range(6)
+        )
+    ]
+
+@pytest.mark.parametrize("records", [
+    pytest.param(json.loads(FIXTURE_PATH.read_text(encoding="utf-8")), id="fixture"),
+    pytest.param(all_scores(), id="all-scores"),
+])
+def test_default_config_matches_baseline(records):
+    expected = baseline_levels(records)
+    scored = score_risks(RiskTable.from_records(records), ScoringConfig())
+    assert list(scored.column("Impacto Geral")) == expected["Impacto Geral"].tolist()
+    assert list(scored.column("Pontuação Geral")) == expected["Pontuação Geral"].tolist()
+    assert list(scored.column("Nível de Risco")) == expected["Nível de Risco"].astype(str).tolist()
+
+def test_missing_probability_is_unscored():
+    scored = score_risks(RiskTable.from_records([{"Id": "R1", "Impacto Financeiro": 3}]), ScoringConfig())
+    assert scored.column("Nível de Risco") == [None]
+
+def test_partial_weights_are_rejected():
+    with pytest.raises(ValueError, match="Missing impact fields"):
+        ScoringConfig.from_dict({"impact_weights": {"Impacto Financeiro": 2.0}})
+    with pytest.raises(ValueError, match="Unknown impact fields"):
+        ScoringConfig.from_dict({"impact_weights": {**dict.fromkeys(IMPACT_FIELDS, 1.0), "Impacto Legal": 1.0}})
+
+def test_matrix_levels():
+    matrix = [["Baixo"] * 5] * 4 + [["Baixo", "Médio", "Médio", "Alto", "Alto"]]
+    config = ScoringConfig.from_dict({"matrix": matrix})
+    records = [
+        {"Id": "R1", "Probabilidade": 5, "Impacto Financeiro": 4, "Impacto no Cronograma": 1, "Impacto Reputacional": 0},
+        {"Id": "R2", "Probabilidade": 5, "Impacto Financeiro": 2, "Impacto no Cronograma": 0, "Impacto Reputacional": 0},
+        {"Id": "R3", "Probabilidade": 5, "Impacto Financeiro": 0, "Impacto no Cronograma": 0, "Impacto Reputacional": 0},
+        {"Id": "R4", "Probabilidade": 1, "Impacto Financeiro": 5, "Impacto no Cronograma": 5, "Impacto Reputacional": 5},
+    ]
+    scored = score_risks(RiskTable.from_records(records), config)
+    assert scored.column("Nível de Risco") == ["Alto", "Médio", "Baixo", "Baixo"]
+
+def test_aggregate_per_category():
+    records = [
+        {"Id": "R1", "Relacionado ao": "GC", "Probabilidade": 5, "Impacto Financeiro": 5, "Impacto no Cronograma": 5, "Impacto Reputacional": 5},
+        {"Id": "R2", "Relacionado ao": "GC", "Probabilidade": 1, "Impacto Financeiro": 1, "Impacto no Cronograma": 1, "Impacto Reputacional": 1},
+        {"Id": "R3", "Relacionado ao": "PC", "Probabilidade": 3, "Impacto Financeiro": 2, "Impacto no Cronograma": 2, "Impacto Reputacional": 1},
+    ]
+    groups = aggregate_risks(RiskTable.from_records(records), by=["Relacionado ao"], config=ScoringConfig())
+    assert groups == [
+        {"Relacionado ao": "GC", "Riscos": 2, "Pontuação Média": 39.0, "Pontuação Máxima": 75.0,
+         "Baixo": 1, "Médio": 0, "Alto": 1},
+        {"Relacionado ao": "PC", "Riscos": 1, "Pontuação Média": 15.0, "Pontuação Máxima": 15.0,
+         "Baixo": 0, "Médio": 1, "Alto": 0},
+    ]
@@ -0,0 +1,154 @@
+import asyncio
+import threading
+import time
+import pytest
+from src.assistant.singleflight import SingleFlight, request_key
+
+class LeaderError(Exception):
+    pass
+
+def start_leader(flight, key, release, result="leader", error=None):
+    """Run a leader call that blocks until release is set; return its thread and outcome list"""
+    outcome = []
+    started = threading.Event()
+
+    def call():
+        started.set()
+        release.wait(5)
+        if error is not None:
+            raise error
+        return result
+
+    def run():
+        try:
+            outcome.append(flight.do(key, call))
+        except Exception as e:
+            outcome.append(e)
+
+    thread = threading.Thread(target=run)
+    thread.start()
+    started.wait(5)
+    return thread, outcome
+
+def follow(flight, key, **kwargs):
+    results = []
+    thread = threading.Thread(target=lambda: results.append(flight.do(key, lambda: "own", **kwargs)))
+    thread.start()
+    return thread, results
+
+def test_request_key_is_order_independent():
+    assert request_key("m", {"a": 1, "b": 2}) == request_key("m", {"b": 2, "a": 1})
+    assert request_key("m", {"a": 1}) != request_key("n", {"a": 1})
+
+def test_followers_share_the_leader_result():
+    flight, release = SingleFlight(), threading.Event()
+    leader, outcome = start_leader(flight, "k", release)
+    followers = [follow(flight, "k") for _ in range(3)]
+    time.sleep(0.05)
+    release.set()
+    leader.join()
+    for thread, results in followers:
+        thread.join()
+        assert results == [("leader", True)]
+    assert outcome == [("leader", False)]
+
+def test_finished_calls_are_not_reused():
+    flight = SingleFlight()
+    assert flight.do("k", lambda: 1) == (1, False)
+    assert flight.do("k", lambda: 2) == (2, False)
+
+def test_followers_get_the_leader_error():
+    flight, release = SingleFlight(), threading.Event()
+    leader, _ = start_leader(flight, "k", release, error=LeaderError("boom"))
+    errors = []
+
+    def run():
+        try:
+            flight.do("k", lambda: "own")
+        except LeaderError as e:
+            errors.append(e)
+
+    thread = threading.Thread(target=run)
+    thread.start()
+    time.sleep(0.05)
+    release.set()
+    leader.join()
+    thread.join()
+    assert len(errors) == 1
+
+def test_followers_retry_on_leader_scoped_errors():
+    flight, release = SingleFlight(), threading.Event()
+    leader, _ = start_leader(flight, "k", release, error=LeaderError("leader budget"))
+    thread, results = follow(flight, "k", retry_on=(LeaderError,))
+    time.sleep(0.05)
+    release.set()
+    leader.join()
+    thread.join()
+    assert results == [("own", False)]
+
+def test_follower_makes_its_own_call_after_its_timeout():
+    flight, release = SingleFlight(), threading.Event()
+    leader, outcome = start_leader(flight, "k", release)
+    start = time.monotonic()
+    assert flight.do("k", lambda: "own", timeout=0.05) == ("own", False)
+    assert time.monotonic() - start < 1
+    release.set()
+    leader.join()
+    assert outcome == [("leader", False)]
+
+def test_leader_timeout_error_is_not_taken_for_the_follower_timeout():
+    flight, release = SingleFlight(), threading.Event()
+    leader, _ = start_leader(flight, "k", release, error=TimeoutError("provider"))
+    errors = []
+
+    def run():
+        try:
+            flight.do("k", lambda: "own", timeout=5)
+        except TimeoutError as e:
+            errors.append(str(e))
+
+    thread = threading.Thread(target=run)
+    thread.start()
+    time.sleep(0.05)
+    release.set()
+    leader.join()
+    thread.join()
+    assert errors == ["provider"]
+
+def test_async_followers_share_and_time_out():
+    async def scenario():
+        flight = SingleFlight()
+
+        async def slow():
+            await asyncio.sleep(0.2)
+            return "leader"
+
+        async def own():
+            return "own"
+
+        leader = asyncio.ensure_future(flight.ado("k", slow))
+        await asyncio.sleep(0.01)
+        impatient = await flight.ado("k", own, timeout=0.02)
+        shared = await flight.ado("k", own)
+        return impatient, shared, await leader
+
+    assert asyncio.run(scenario()) == (("own", False), ("leader", True), ("leader", False))
+
+def test_cancelled_async_follower_leaves_the_call_running():
+    async def scenario():
+        flight = SingleFlight()
+
+        async def slow():
+            await asyncio.sleep(0.1)
+            return "leader"
+
+        leader = asyncio.ensure_future(flight.ado("k", slow))
+        await asyncio.sleep(0.01)
+        follower = asyncio.ensure_future(flight.ado("k", slow))
+        await asyncio.sleep(0.01)
+        follower.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await follower
+        return await leader
+
+    assert asyncio.run(scenario()) == ("leader", False)
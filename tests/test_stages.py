@@ -0,0 +1,98 @@
+import asyncio
+import os
+import pytest
+from langchain_core.prompts import ChatPromptTemplate
+from src.assistant.prompts import EVALUATOR_PROMPT, OPTIMIZER_PROMPT
+from src.assistant.records import RiskTable
+from src.assistant.stages import StageCache, _replayed, memoize_node, stage_key
+
+RISKS = RiskTable.from_records([
+    {"Id": "R001", "Risco": "Atraso na entrega", "Probabilidade": 3},
+    {"Id": "R002", "Risco": "Falha de integração", "Probabilidade": 2},
+])
+
+def counting_node(calls):
+    def node(state):
+        calls.append(state["risk_list"])
+        return {"risk_analysis": RiskTable.from_records(state["risk_list"].to_records()),
+                "token_usage": {"evaluator": 120}}
+    return node
+
+def test_unchanged_inputs_hit_and_changed_inputs_miss(tmp_path):
+    calls = []
+    node = memoize_node("evaluate_report", counting_node(calls),
+                        lambda state: [state["risk_list"], EVALUATOR_PROMPT], cache=StageCache(str(tmp_path)))
+
+    first = node({"risk_list": RISKS})
+    # Equal content in a new table is the same key
+    again = node({"risk_list": RiskTable.from_records(RISKS.to_records())})
+    assert len(calls) == 1
+    assert again["risk_analysis"].to_records() == first["risk_analysis"].to_records()
+
+    node({"risk_list": RiskTable.from_records(RISKS.to_records()[:1])})
+    assert len(calls) == 2
+    assert len(os.listdir(tmp_path / "evaluate_report")) == 2
+
+def test_hits_replay_without_tokens(tmp_path):
+    calls = []
+    node = memoize_node("evaluate_report", counting_node(calls), lambda state: [state["risk_list"]],
+                        cache=StageCache(str(tmp_path)))
+    assert node({"risk_list": RISKS})["token_usage"] == {"evaluator": 120}
+    assert node({"risk_list": RISKS})["token_usage"] == {"evaluator": 0}
+    assert _replayed({"token_usage": {"creator": 5, "evaluator": 7}, "iteration": 1}) == \
+        {"token_usage": {"creator": 0, "evaluator": 0}, "iteration": 1}
+
+def test_async_nodes_share_the_store(tmp_path):
+    calls = []
+    cache = StageCache(str(tmp_path))
+
+    async def anode(state):
+        return counting_node(calls)(state)
+
+    memoize_node("evaluate_report", counting_node(calls), lambda state: [state["risk_list"]], cache=cache)(
+        {"risk_list": RISKS})
+    update = asyncio.run(memoize_node("evaluate_report", anode, lambda state: [state["risk_list"]], cache=cache)(
+        {"risk_list": RISKS}))
+    assert len(calls) == 1
+    assert update["token_usage"] == {"evaluator": 0}
+
+def test_incomplete_updates_are_not_stored(tmp_path):
+    cache = StageCache(str(tmp_path))
+    node = memoize_node("evaluate_report", lambda state: {"risk_analysis": RISKS, "validation_errors": ["R002"]},
+                        lambda state: [state["risk_list"]], cache=cache)
+    node({"risk_list": RISKS})
+    assert not (tmp_path / "evaluate_report").exists()
+
+def test_uncomputable_inputs_run_the_node_uncached(tmp_path):
+    def inputs(state):
+        raise FileNotFoundError(state["input_file"])
+
+    node = memoize_node("load_document", lambda state: {"context": ["texto"]}, inputs, cache=StageCache(str(tmp_path)))
+    assert node({"input_file": "missing.pdf"}) == {"context": ["texto"]}
+    assert not (tmp_path / "load_document").exists()
+
+def test_prompt_change_only_invalidates_its_own_stage(monkeypatch):
+    graph = pytest.importorskip("src.assistant.graph")
+    state = {"risk_list": RISKS, "risk_analysis": RISKS, "iteration": 1, "carried_ids": None}
+    before = {name: stage_key(name, graph.STAGE_INPUTS[name](state)) for name in ("evaluate_report", "optimize_report")}
+
+    changed = ChatPromptTemplate.from_template(OPTIMIZER_PROMPT.messages[0].prompt.template + "\nSeja conciso.")
+    monkeypatch.setattr(graph, "OPTIMIZER_PROMPT", changed)
+    after = {name: stage_key(name, graph.STAGE_INPUTS[name](state)) for name in ("evaluate_report", "optimize_report")}
+
+    assert after["evaluate_report"] == before["evaluate_report"]
+    assert after["optimize_report"] != before["optimize_report"]
+
+def test_prompt_text_is_part_of_the_key():
+    changed = ChatPromptTemplate.from_template(OPTIMIZER_PROMPT.messages[0].prompt.template + "\nSeja conciso.")
+    assert stage_key("optimize_report", [RISKS, OPTIMIZER_PROMPT]) == stage_key("optimize_report", [RISKS, OPTIMIZER_PROMPT])
+    assert stage_key("optimize_report", [RISKS, OPTIMIZER_PROMPT]) != stage_key("optimize_report", [RISKS, changed])
+    assert stage_key("optimize_report", [RISKS]) != stage_key("evaluate_report", [RISKS])
+
+def test_put_leaves_no_temporary_files(tmp_path):
+    cache = StageCache(str(tmp_path))
+    update = {"risk_analysis": RISKS}
+    cache.put("evaluate_report", "k", update)
+    cache.put("evaluate_report", "k", update)
+    assert os.listdir(tmp_path / "evaluate_report") == ["k.json"]
+    assert cache.get("evaluate_report", "k")["risk_analysis"].to_records() == RISKS.to_records()
@@ -0,0 +1,34 @@
+from collections import namedtuple
+import pytest
+
+pytest.importorskip("langgraph")
+
+from src.assistant.blobs import BlobRef
+from src.assistant.records import RiskTable
+from src.assistant.state import StateSerializer, _from_plain, _to_plain
+
+Pair = namedtuple("Pair", ["risks", "ref"])
+
+RISKS = RiskTable.from_records([
+    {"Id": "R001", "Risco": "Atraso na entrega", "Probabilidade": 3},
+    {"Id": "R002", "Risco": "Falha de integração", "Probabilidade": 2},
+])
+REF = BlobRef("a" * 64, 120)
+
+def test_namedtuples_keep_their_type():
+    plain = _to_plain(Pair(RISKS, REF))
+    assert type(plain) is Pair
+    assert plain.ref == {"__blob__": ["a" * 64, 120]}
+    restored = _from_plain(plain)
+    assert restored == Pair(RISKS, REF)
+
+def test_serializer_round_trip():
+    serializer = StateSerializer()
+    state = {"risk_list": RISKS, "contexts": REF, "carried_ids": ["R001"],
+             "nested": {"pairs": [(RISKS, REF)]}}
+    restored = serializer.loads_typed(serializer.dumps_typed(state))
+    assert restored["risk_list"] == RISKS
+    assert restored["contexts"] == REF
+    assert restored["carried_ids"] == ["R001"]
+    assert restored["nested"]["pairs"][0][0] == RISKS
+    assert restored["nested"]["pairs"][0][1] == REF
@@ -0,0 +1,65 @@
+import json
+import pytest
+from src.assistant.validation import IDENTIFIED_RISK_VALIDATOR, validate_evaluated_risks
+
+def evaluated(**overrides):
+    record = {
+        "Id": "R001",
+        "Risco": "Atraso na entrega",
+        "Relacionado ao": "Gestão Contratual",
+        "Probabilidade": 3,
+        "Impacto Financeiro": 2,
+        "Impacto no Cronograma": 4,
+        "Impacto Reputacional": 1,
+    }
+    record.update(overrides)
+    return record
+
+def test_valid_record_passes_unchanged():
+    result = validate_evaluated_risks([evaluated()])
+    assert result.valid == [evaluated()]
+    assert result.invalid == []
+
+def test_coerces_numeric_strings_and_null_impacts():
+    result = validate_evaluated_risks([evaluated(Probabilidade=" 4 ", **{"Impacto Financeiro": "2.0",
+                                                                         "Impacto Reputacional": None})])
+    record = result.valid[0]
+    assert record["Probabilidade"] == 4
+    assert record["Impacto Financeiro"] == 2
+    assert record["Impacto Reputacional"] == 0
+
+def test_normalizes_field_aliases():
+    record = evaluated()
+    record["Relacionado"] = record.pop("Relacionado ao")
+    result = validate_evaluated_risks([record])
+    assert result.valid[0]["Relacionado ao"] == "Gestão Contratual"
+    assert "Relacionado" not in result.valid[0]
+
+@pytest.mark.parametrize("value, message", [
+    (None, "missing"),
+    (6, "outside 1-5"),
+    (2.5, "expected an integer"),
+    ("três", "expected a number"),
+    (True, "expected an integer"),
+    ("nan", "expected a finite number"),
+    (float("inf"), "expected a finite number"),
+])
+def test_invalid_probability_is_reported_per_record(value, message):
+    result = validate_evaluated_risks([evaluated(Probabilidade=value), evaluated(Id="R002")])
+    assert [record["Id"] for record in result.valid] == ["R002"]
+    (record, errors), = result.invalid
+    assert record["Id"] == "R001"
+    assert len(errors) == 1 and message in errors[0]
+
+def test_nan_from_json_does_not_fail_the_chunk():
+    records = json.loads('[{"Id": "R1", "Risco": "a", "Relacionado ao": "b", "Probabilidade": NaN},'
+                         ' {"Id": "R2", "Risco": "a", "Relacionado ao": "b", "Probabilidade": 2}]')
+    result = validate_evaluated_risks(records)
+    assert [record["Id"] for record in result.valid] == ["R2"]
+    assert len(result.invalid) == 1
+
+def test_non_object_and_empty_text():
+    result = IDENTIFIED_RISK_VALIDATOR.validate(["texto", {"Risco": "  ", "Relacionado ao": "Seleção do Fornecedor"}])
+    assert result.valid == []
+    assert "expected an object" in result.invalid[0][1][0]
+    assert result.invalid[1][1] == ["Risco: expected non-empty text, got '  '"]
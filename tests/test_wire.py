@@ -0,0 +1,54 @@
+import json
+import numpy as np
+from src.assistant.records import RiskTable
+from src.assistant.wire import (
+    CATEGORY_CODES,
+    EVALUATOR_INPUT_ROW,
+    IDENTIFIED_ROW,
+    SCORE_ROW,
+    decode_category,
+    decode_rows,
+    encode_rows,
+    join_by_id,
+    normalize_whitespace,
+    plain_scalar,
+)
+
+RISKS = RiskTable.from_records([
+    {"Id": "R001", "Relacionado ao": "Gestão Contratual", "Risco": "Atraso na entrega"},
+    {"Id": "R002", "Relacionado ao": "Outra categoria", "Risco": "Falha de integração"},
+])
+
+def test_encode_rows_known_answer():
+    assert encode_rows(RISKS, EVALUATOR_INPUT_ROW) == (
+        '[\n["R001","GC","Atraso na entrega"],\n["R002","Outra categoria","Falha de integração"]\n]')
+
+def test_rows_round_trip_with_category_codes():
+    for name, code in CATEGORY_CODES.items():
+        assert decode_category(code) == name
+        assert decode_category(f" {code.lower()} ") == name
+    decoded = decode_rows(json.loads(encode_rows(RISKS, EVALUATOR_INPUT_ROW)), EVALUATOR_INPUT_ROW)
+    assert decoded == RISKS.to_records()
+
+def test_decode_rows_keeps_objects_and_malformed_rows():
+    decoded = decode_rows([["SF", "Cartel"], {"Relacionado ao": "PC", "Risco": "Escopo"}, ["ST"]], IDENTIFIED_ROW)
+    assert decoded == [{"Relacionado ao": "Seleção do Fornecedor", "Risco": "Cartel"},
+                       {"Relacionado ao": "Planejamento da Contratação", "Risco": "Escopo"},
+                       ["ST"]]
+
+def test_join_by_id():
+    scores = decode_rows([["R002", 3, 4, 2, 1], ["R009", 1, 1, 1, 1], "lixo"], SCORE_ROW)
+    joined = join_by_id(scores, RISKS, EVALUATOR_INPUT_ROW)
+    assert joined[0] == {"Id": "R002", "Relacionado ao": "Outra categoria", "Risco": "Falha de integração",
+                         "Probabilidade": 3, "Impacto Financeiro": 4, "Impacto no Cronograma": 2,
+                         "Impacto Reputacional": 1}
+    # Unknown Ids and non-records are left for validation to report
+    assert joined[1] == dict(zip(SCORE_ROW, ["R009", 1, 1, 1, 1]))
+    assert joined[2] == "lixo"
+
+def test_plain_scalar_and_whitespace():
+    assert plain_scalar(np.int64(3)) == 3 and type(plain_scalar(np.int64(3))) is int
+    assert plain_scalar(4.0) == 4 and type(plain_scalar(4.0)) is int
+    assert plain_scalar(2.5) == 2.5
+    assert plain_scalar(float("nan")) is None
+    assert normalize_whitespace("  a \t b \n\n\n  c  ") == "a b\n\nc"